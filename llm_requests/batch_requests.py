@@ -0,0 +1,238 @@
+"""
+Module for processing an input file through an OpenAI-compatible Batch API
+instead of the interactive request loop.
+
+1. `write_batch_file` splits the input file into chunks and writes one chat request
+   per chunk into a JSONL batch file. Each request's `custom_id` encodes the byte range
+   of its chunk ("chunk-<start>-<end>").
+2. `submit_batch` uploads the batch file, waits for the batch to finish
+   and downloads the results.
+3. `ingest_batch_results` parses the results in input order and writes them
+   with the same writers as continuous_llm_requests.py.
+
+Batch chunks do not overlap (there is no response to rewind on), so token-budget
+chunking cut at article/sentence ends is recommended.
+"""
+
+import os
+import json
+import time
+
+from openai import OpenAI
+
+from text_file_extraction import TextChunkReader
+from output_conversion import parse_and_clean_up, remove_reasoning, export_main_output
+from output_writer import OutputWriter
+from text_changes_check import text_changes_check, text_changes_string
+
+from constants import SYSTEM_PROMPT, TEMPERATURE, ADDED_RESEND_TOL, REMOVED_RESEND_TOL, \
+    CHOSEN_TOKEN_ESTIMATE, GROQ_API, OUTPUT_LOGS_FOLDER, BATCH_REQUESTS, BATCH_RESULTS
+
+BATCH_ENDPOINT = "/v1/chat/completions"
+BATCH_COMPLETION_WINDOW = "24h"
+BATCH_POLL_INTERVAL = 60
+
+_FINAL_BATCH_STATES = ("completed", "failed", "expired", "cancelled")
+
+
+def chunk_custom_id(start: int, end: int) -> str:
+    """Returns the batch custom_id of the chunk between the given byte offsets."""
+    return f"chunk-{start}-{end}"
+
+
+def chunk_range(custom_id: str) -> tuple[int, int]:
+    """Returns the (start, end) byte offsets encoded in a chunk custom_id."""
+    _, start, end = custom_id.split("-")
+    return int(start), int(end)
+
+
+def write_batch_file(input_file_path: str, batch_path: str, model: str,
+                     temperature: float = TEMPERATURE, char_count: int = 1000,
+                     token_budget: int | None = None,
+                     start_position: int = 0) -> int:
+    # pylint: disable=too-many-arguments
+    """
+    Splits the input file into chunks and writes one chat completion request per chunk.
+
+    :param input_file_path: Path to the input text file.
+    :param batch_path: Path to the JSONL batch file to write.
+    :param model: Provider model name.
+    :param temperature: Sampling temperature.
+    :param char_count: Chunk size in characters (when token_budget is None).
+    :param token_budget: Estimated tokens per chunk, enables token-budget chunking
+                         (e.g. CHOSEN_TOKEN_ESTIMATE["chunk_tokens"]).
+    :param start_position: Byte offset to start from.
+    :return: Number of requests written.
+    """
+    count = 0
+    with TextChunkReader(input_file_path, char_count, start_position,
+                         token_budget=token_budget,
+                         bytes_per_token=CHOSEN_TOKEN_ESTIMATE["bytes_per_token"]) as reader, \
+         open(batch_path, "w", encoding="utf-8") as batch_file:
+        start = reader.position
+        for text, positions in reader:
+            end = positions[-1]
+            request = {
+                "custom_id": chunk_custom_id(start, end),
+                "method": "POST",
+                "url": BATCH_ENDPOINT,
+                "body": {
+                    "model": model,
+                    "temperature": temperature,
+                    "messages": [
+                        {"role": "system", "content": SYSTEM_PROMPT},
+                        {"role": "user", "content": text}
+                    ]
+                }
+            }
+            batch_file.write(json.dumps(request, ensure_ascii=False) + "\n")
+            count += 1
+            start = end
+
+    return count
+
+
+def submit_batch(client: OpenAI, batch_path: str, results_path: str,
+                 poll_interval: float = BATCH_POLL_INTERVAL) -> str:
+    """
+    Uploads a batch file, waits until the batch is finished and stores its results
+    (and the error records, if any) in `results_path`.
+
+    :param client: OpenAI client of the provider (or of a local fake endpoint).
+    :param batch_path: Path to the JSONL batch file.
+    :param results_path: Path to the JSONL results file to write.
+    :param poll_interval: Seconds between batch status checks.
+    :return: The batch id.
+    """
+    with open(batch_path, "rb") as batch_file:
+        uploaded = client.files.create(file=batch_file, purpose="batch")
+
+    batch = client.batches.create(
+        input_file_id=uploaded.id,
+        endpoint=BATCH_ENDPOINT,
+        completion_window=BATCH_COMPLETION_WINDOW
+    )
+    print(f"[INFO] Submitted batch {batch.id}")
+
+    while batch.status not in _FINAL_BATCH_STATES:
+        time.sleep(poll_interval)
+        batch = client.batches.retrieve(batch.id)
+        print(f"[INFO] Batch {batch.id}: {batch.status}")
+
+    if batch.status != "completed":
+        raise RuntimeError(f"Batch {batch.id} ended with status {batch.status}.")
+
+    with open(results_path, "wb") as results_file:
+        for file_id in (batch.output_file_id, batch.error_file_id):
+            if file_id:
+                results_file.write(client.files.content(file_id).content)
+
+    return batch.id
+
+
+def _result_content(result: dict | None) -> str | None:
+    if not result or result.get("error"):
+        return None
+    response = result.get("response") or {}
+    if response.get("status_code") != 200:
+        return None
+    try:
+        return response["body"]["choices"][0]["message"]["content"]
+    except (KeyError, IndexError, TypeError):
+        return None
+
+
+def ingest_batch_results(batch_path: str, results_path: str, input_file_path: str,
+                         quarantine_failed: bool = False) -> list[str]:
+    # pylint: disable=too-many-locals
+    """
+    Writes the batch results into the outputs of the input file (main output,
+    category words, changes log and latest position), strictly in input order.
+
+    Chunks ending at or before the latest recorded position are skipped, so the ingest
+    can be repeated; a chunk not starting at it stops the ingest. A failed chunk
+    or a chunk over the resend tolerances is logged in the changes log and,
+    as the outputs have to stay contiguous, either stops the ingest
+    (the latest position stays at its start, so it and the chunks after it can be sent
+    again, e.g. in a new batch from that position), or with `quarantine_failed` is
+    written untagged and quarantined like in continuous_llm_requests.py.
+
+    :param batch_path: Path to the JSONL batch file the results belong to.
+    :param results_path: Path to the JSONL results file.
+    :param input_file_path: Path to the input text file.
+    :param quarantine_failed: Write failed chunks untagged instead of stopping at them.
+    :return: custom_ids of the chunks that were not written from a tagged response.
+    """
+    input_texts = {}
+    with open(batch_path, "r", encoding="utf-8") as batch_file:
+        for line in batch_file:
+            request = json.loads(line)
+            input_texts[request["custom_id"]] = request["body"]["messages"][-1]["content"]
+
+    results = {}
+    with open(results_path, "r", encoding="utf-8") as results_file:
+        for line in results_file:
+            if line.strip():
+                result = json.loads(line)
+                results[result["custom_id"]] = result
+
+    failed = []
+
+    with OutputWriter(input_file_path) as writer:
+        position = writer.position
+        custom_ids = [custom_id for custom_id in sorted(input_texts, key=chunk_range)
+                      if chunk_range(custom_id)[1] > position]
+        for index, custom_id in enumerate(custom_ids):
+            start, end = chunk_range(custom_id)
+            position_string = f"----- {start:16} - {end:16} ----- (batch)"
+            if start != position:
+                print(f"[WARNING] Chunk {custom_id} does not continue the output "
+                      f"at {position}, stopping the ingest")
+                failed += custom_ids[index:]
+                break
+
+            input_text = input_texts[custom_id]
+            content = _result_content(results.get(custom_id))
+            if content is None:
+                failure = "BATCH REQUEST FAILED"
+            else:
+                response_parsed_object, reconstructed_text = \
+                    parse_and_clean_up(remove_reasoning(content))
+                a, r = text_changes_check(input_text, reconstructed_text)
+                text_changes_tostring = text_changes_string(a, r)
+                if len(a) <= ADDED_RESEND_TOL and len(r) <= REMOVED_RESEND_TOL:
+                    writer.write_chunk(response_parsed_object, end,
+                                       "\n".join([position_string, text_changes_tostring]))
+                    position = end
+                    continue
+                failure = f"{text_changes_tostring}\nBATCH RESPONSE REJECTED"
+
+            failed.append(custom_id)
+            if not quarantine_failed:
+                writer.log_changes(f"{position_string}\n{failure}, stopping the ingest")
+                failed += custom_ids[index + 1:]
+                break
+            # keep the text untagged so the output stays complete
+            writer.write_chunk([{"words": input_text.split(), "category": None}], end,
+                               f"{position_string}\n{failure}, QUARANTINED",
+                               "\n".join([position_string, input_text]))
+            position = end
+
+    export_main_output(input_file_path)
+    return failed
+
+
+if __name__ == "__main__":
+    INPUT_FILE = \
+        r"" # <Cesta ke vstupnímu textovému souboru, který má být zpracován>
+
+    LOG_FOLDER = os.path.join(OUTPUT_LOGS_FOLDER, os.path.basename(INPUT_FILE))
+    os.makedirs(LOG_FOLDER, exist_ok=True)
+    BATCH_FILE = os.path.join(LOG_FOLDER, BATCH_REQUESTS)
+    RESULTS_FILE = os.path.join(LOG_FOLDER, BATCH_RESULTS)
+
+    print(f"Requests: {write_batch_file(INPUT_FILE, BATCH_FILE, GROQ_API['model'])}")
+    BATCH_CLIENT = OpenAI(api_key=GROQ_API["keys"][0], base_url=GROQ_API["base_url"])
+    submit_batch(BATCH_CLIENT, BATCH_FILE, RESULTS_FILE)
+    FAILED = ingest_batch_results(BATCH_FILE, RESULTS_FILE, INPUT_FILE)
+    print(f"Chunks not written: {len(FAILED)}")
@@ -0,0 +1,130 @@
+"""
+Tests of the Batch API mode against a local fake batch endpoint.
+
+Run from the llm_requests folder:
+    python -m pytest batch_requests_test.py
+"""
+
+import json
+import types
+
+import pytest
+
+pytest.importorskip("openai")
+
+# pylint: disable=wrong-import-position
+from batch_requests import write_batch_file, submit_batch, ingest_batch_results, chunk_range
+from output_conversion import get_latest_position, read_output_log
+from conftest import output_words, read_log
+
+from constants import LOGS_QUARANTINE
+
+INPUT_TEXT = " ".join(
+    f"Věta číslo {i} obsahuje jméno Honza a město Praha." for i in range(12)) + "\n"
+
+
+class FakeBatchEndpoint:
+    # pylint: disable=too-few-public-methods
+    """
+    In-memory OpenAI-compatible Batch API: answers every request by echoing its input
+    with the first word tagged as a location, except for the custom_ids in `fail`
+    (error record) and `reject` (response with changed text).
+    """
+
+    def __init__(self, fail=(), reject=()):
+        self.fail = set(fail)
+        self.reject = set(reject)
+        self._files = {}
+        self._batches = {}
+        self.files = types.SimpleNamespace(create=self._create_file, content=self._file_content)
+        self.batches = types.SimpleNamespace(create=self._create_batch,
+                                             retrieve=self._retrieve_batch)
+
+    def _create_file(self, file, purpose):
+        assert purpose == "batch"
+        file_id = f"file-{len(self._files)}"
+        self._files[file_id] = file.read()
+        return types.SimpleNamespace(id=file_id)
+
+    def _file_content(self, file_id):
+        return types.SimpleNamespace(content=self._files[file_id])
+
+    def _answer(self, request):
+        custom_id = request["custom_id"]
+        if custom_id in self.fail:
+            return {"custom_id": custom_id, "response": None,
+                    "error": {"code": "server_error", "message": "failed"}}
+        text = request["body"]["messages"][-1]["content"]
+        first, rest = text.split(" ", 1)
+        content = f"<l>{first}</l> {rest}"
+        if custom_id in self.reject:
+            content = "Úplně jiná odpověď bez původního textu."
+        return {"custom_id": custom_id, "error": None, "response": {
+            "status_code": 200, "body": {"choices": [{"message": {"content": content}}]}}}
+
+    def _create_batch(self, input_file_id, endpoint, completion_window):
+        # pylint: disable=unused-argument
+        lines = self._files[input_file_id].decode("utf-8").splitlines()
+        answers = [self._answer(json.loads(line)) for line in lines if line.strip()]
+        output_id = f"file-{len(self._files)}"
+        self._files[output_id] = "".join(
+            json.dumps(answer, ensure_ascii=False) + "\n" for answer in answers).encode("utf-8")
+        batch_id = f"batch-{len(self._batches)}"
+        self._batches[batch_id] = {"polls": 0, "output_file_id": output_id}
+        return types.SimpleNamespace(id=batch_id, status="in_progress")
+
+    def _retrieve_batch(self, batch_id):
+        batch = self._batches[batch_id]
+        batch["polls"] += 1
+        status = "completed" if batch["polls"] > 1 else "in_progress"
+        return types.SimpleNamespace(id=batch_id, status=status,
+                                     output_file_id=batch["output_file_id"], error_file_id=None)
+
+
+def run_batch(input_file: str, client: FakeBatchEndpoint, **ingest_kwargs) -> list[str]:
+    """Writes a batch from the latest position, submits it and ingests the results."""
+    write_batch_file(input_file, "batch.jsonl", "model", char_count=150, token_budget=None,
+                     start_position=get_latest_position(input_file))
+    submit_batch(client, "batch.jsonl", "results.jsonl", poll_interval=0)
+    return ingest_batch_results("batch.jsonl", "results.jsonl", input_file, **ingest_kwargs)
+
+
+def batch_custom_ids() -> list[str]:
+    """Returns the custom_ids of the last written batch file in input order."""
+    with open("batch.jsonl", "r", encoding="utf-8") as batch_file:
+        return sorted((json.loads(line)["custom_id"] for line in batch_file), key=chunk_range)
+
+
+def test_failed_chunk_stops_the_ingest(input_file):
+    """The output stops before a failed chunk and the rerun continues right after it."""
+    write_batch_file(input_file, "batch.jsonl", "model", char_count=150, token_budget=None)
+    custom_ids = batch_custom_ids()
+    assert len(custom_ids) > 3
+
+    not_written = run_batch(input_file, FakeBatchEndpoint(fail=[custom_ids[2]]))
+    assert not_written == custom_ids[2:]
+    assert get_latest_position(input_file) == chunk_range(custom_ids[2])[0]
+    with open(input_file, "rb") as file:
+        written = file.read(chunk_range(custom_ids[2])[0]).decode("utf-8")
+    assert output_words(input_file) == written.split()
+
+    assert not run_batch(input_file, FakeBatchEndpoint())
+    assert batch_custom_ids()[0] == custom_ids[2]
+    assert output_words(input_file) == INPUT_TEXT.split()
+    assert get_latest_position(input_file) == chunk_range(custom_ids[-1])[1]
+
+
+def test_rejected_chunk_is_quarantined(input_file):
+    """With quarantine_failed a rejected chunk is written untagged and the ingest goes on."""
+    write_batch_file(input_file, "batch.jsonl", "model", char_count=150, token_budget=None)
+    custom_ids = batch_custom_ids()
+
+    not_written = run_batch(input_file, FakeBatchEndpoint(reject=[custom_ids[1]]),
+                            quarantine_failed=True)
+    assert not_written == [custom_ids[1]]
+    assert output_words(input_file) == INPUT_TEXT.split()
+    assert get_latest_position(input_file) == chunk_range(custom_ids[-1])[1]
+
+    sections = list(read_output_log(input_file))
+    assert sum(section["category"] == "l" for section in sections) == len(custom_ids) - 1
+    assert read_log(input_file, LOGS_QUARANTINE).count("(batch)") == 1
@@ -0,0 +1,263 @@
+"""
+Module with the category filtering rules applied to the parsed sections.
+
+Every category has at most one rule, registered in CATEGORY_RULES under the tag
+name of the category. A rule gets the category and the words of a section and
+returns the (category, words) parts replacing it: the section unchanged, with the
+category dropped (set to None), or split into parts. Sections of a category
+without a rule are kept. The patterns and keyword sets of the rules are built once
+at import.
+
+A deployment can replace, add or remove rules before processing:
+
+    register_category_rule(TAGS["PHONE"], my_phone_rule)
+    register_category_rule(TAGS["WEB"], None)
+
+Every rule counts its calls, the words it got, how often it kept, changed (split or
+narrowed) and demoted a section, and the time spent in it, see `category_rule_stats`.
+"""
+
+import re
+import time
+
+from constants import TAGS, OMITTED_TAGS
+
+_TWO_DIGITS_PATTERN = re.compile(r'\d{2,}')
+_CASE_NUMBER_KEYWORDS = frozenset({
+    "čj.", "j.", "zn.", "č.j.", "sp.zn.", "zn", "čj", ".", "j.:", "zn.:", "značka:", "číslo:",
+    "jednací:", "spisu:", "značkou"})
+
+
+class CategoryRule:
+    # pylint: disable=too-many-instance-attributes
+    """
+    Filtering rule of one category with its counters.
+
+    Usage:
+        rule = CategoryRule(case_number_rule)
+        parts = rule(TAGS["CASE_NUMBER"], words)
+    """
+
+    __slots__ = ("function", "name", "calls", "words", "kept", "changed", "demoted", "seconds")
+
+    def __init__(self, function, name: str | None = None):
+        """
+        :param function: Function (category, words) -> list of (category, words) parts.
+        :param name: Name shown in the statistics (default the function name).
+        """
+        self.function = function
+        self.name = name or function.__name__
+        self.reset()
+
+    def reset(self) -> None:
+        """Zeroes the counters."""
+        self.calls = 0
+        self.words = 0
+        self.kept = 0
+        self.changed = 0
+        self.demoted = 0
+        self.seconds = 0.0
+
+    def __call__(self, category: str, words: list[str]) -> list[tuple[str | None, list[str]]]:
+        started = time.perf_counter()
+        parts = self.function(category, words)
+        self.seconds += time.perf_counter() - started
+
+        self.calls += 1
+        self.words += len(words)
+        if len(parts) == 1 and parts[0][0] == category and len(parts[0][1]) == len(words):
+            self.kept += 1
+        elif all(part_category is None for part_category, _ in parts):
+            self.demoted += 1
+        else:
+            self.changed += 1
+        return parts
+
+    def stats(self) -> dict:
+        """Returns the counters."""
+        return {"rule": self.name, "calls": self.calls, "words": self.words, "kept": self.kept,
+                "changed": self.changed, "demoted": self.demoted, "seconds": self.seconds}
+
+
+def _split_around(category: str, words: list[str], first: int, last: int) \
+        -> list[tuple[str | None, list[str]]]:
+    """Keeps the category for words[first:last], the words before and after get None."""
+    parts = []
+    if words[:first]:
+        parts.append((None, words[:first]))
+    parts.append((category, words[first:last]))
+    if words[last:]:
+        parts.append((None, words[last:]))
+    return parts
+
+
+def _zipcode_index(words: list[str]) -> int | None:
+    """Returns the index of the first 3-digit word followed by a 2-digit word."""
+    for i in range(len(words) - 1):
+        if words[i].isdigit() and len(words[i]) == 3 and \
+                words[i + 1].isdigit() and len(words[i + 1]) == 2:
+            return i
+    return None
+
+
+def omitted_rule(_category: str, words: list[str]) -> list[tuple[str | None, list[str]]]:
+    """Drops the category (OMITTED_TAGS)."""
+    return [(None, words)]
+
+
+def case_number_rule(category: str, words: list[str]) -> list[tuple[str | None, list[str]]]:
+    """
+    Keeps case numbers with a number of at least two digits and a slash.
+    A keyword like "čj." splits the section, the keyword and the words before it get None.
+    """
+    has_two_digits = any(_TWO_DIGITS_PATTERN.search(word) for word in words)
+    has_slash = any('/' in word for word in words)
+    if not (has_two_digits and has_slash):
+        return [(None, words)]
+
+    for i, word in enumerate(words):
+        if word.lower() in _CASE_NUMBER_KEYWORDS:
+            parts = [(None, words[:i + 1])]
+            if words[i + 1:]:
+                parts.append((category, words[i + 1:]))
+            return parts
+    return [(category, words)]
+
+
+def zipcode_rule(category: str, words: list[str]) -> list[tuple[str | None, list[str]]]:
+    """Keeps only the first "123 45" pair of words."""
+    zip_index = _zipcode_index(words)
+    if zip_index is None:
+        return [(None, words)]
+    return _split_around(category, words, zip_index, zip_index + 2)
+
+
+def email_rule(category: str, words: list[str]) -> list[tuple[str | None, list[str]]]:
+    """Keeps only the first word with "@"."""
+    at_index = next((i for i, word in enumerate(words) if "@" in word), None)
+    if at_index is None:
+        return [(None, words)]
+    return _split_around(category, words, at_index, at_index + 1)
+
+
+def phone_rule(category: str, words: list[str]) -> list[tuple[str | None, list[str]]]:
+    """
+    Keeps phone numbers with at least 9 digits, the leading words with letters
+    and everything after the number get None.
+    """
+    if sum(char.isdigit() for word in words for char in word) < 9:
+        return [(None, words)]
+
+    i = 0
+    while i < len(words) and any(char.isalpha() for char in words[i]):
+        i += 1
+    first = i
+    # words with digits and special characters
+    while i < len(words) and any(char.isdigit() or not char.isalpha() for char in words[i]):
+        i += 1
+
+    parts = []
+    if words[:first]:
+        parts.append((None, words[:first]))
+    if words[first:i]:
+        parts.append((category, words[first:i]))
+    if words[i:]:
+        parts.append((None, words[i:]))
+    return parts
+
+
+def web_rule(category: str, words: list[str]) -> list[tuple[str | None, list[str]]]:
+    """Keeps only the first word with a dot."""
+    dot_index = next((i for i, word in enumerate(words) if "." in word), None)
+    if dot_index is None:
+        return [(None, words)]
+    return _split_around(category, words, dot_index, dot_index + 1)
+
+
+def location_rule(category: str, words: list[str]) -> list[tuple[str | None, list[str]]]:
+    """
+    Keeps locations with a capital letter or a digit, the first "123 45" pair
+    of words is moved to the zip code category.
+    """
+    if not any(word[0].isupper() or any(char.isdigit() for char in word) for word in words):
+        return [(None, words)]
+
+    zip_index = _zipcode_index(words)
+    if zip_index is None:
+        return [(category, words)]
+    parts = []
+    if words[:zip_index]:
+        parts.append((TAGS["LOCATION"], words[:zip_index]))
+    parts.append((TAGS["ZIPCODE"], words[zip_index:zip_index + 2]))
+    if words[zip_index + 2:]:
+        parts.append((TAGS["LOCATION"], words[zip_index + 2:]))
+    return parts
+
+
+def capitalised_or_digit_rule(category: str, words: list[str]) \
+        -> list[tuple[str | None, list[str]]]:
+    """Keeps sections with a word starting with a capital letter or a digit."""
+    if not any(word and (word[0].isupper() or word[0].isdigit()) for word in words):
+        return [(None, words)]
+    return [(category, words)]
+
+
+def capitalised_rule(category: str, words: list[str]) -> list[tuple[str | None, list[str]]]:
+    """Keeps sections with a word starting with a capital letter."""
+    if not any(word and word[0].isupper() for word in words):
+        return [(None, words)]
+    return [(category, words)]
+
+
+CATEGORY_RULES = {
+    TAGS["CASE_NUMBER"]: CategoryRule(case_number_rule),
+    TAGS["ZIPCODE"]: CategoryRule(zipcode_rule),
+    TAGS["EMAIL"]: CategoryRule(email_rule),
+    TAGS["PHONE"]: CategoryRule(phone_rule),
+    TAGS["WEB"]: CategoryRule(web_rule),
+    TAGS["LOCATION"]: CategoryRule(location_rule),
+    TAGS["INSTITUTION"]: CategoryRule(capitalised_or_digit_rule),
+    TAGS["COMPANY"]: CategoryRule(capitalised_or_digit_rule),
+    TAGS["PERSONAL_NAME"]: CategoryRule(capitalised_rule),
+}
+CATEGORY_RULES.update({category: CategoryRule(omitted_rule) for category in OMITTED_TAGS})
+
+
+def register_category_rule(category: str, function, name: str | None = None) -> None:
+    """
+    Sets the rule of a category, replacing the previous one.
+
+    :param category: Tag name of the category.
+    :param function: Function (category, words) -> list of (category, words) parts,
+                     None removes the rule (the sections of the category are kept).
+    :param name: Name shown in the statistics (default the function name).
+    """
+    if function is None:
+        CATEGORY_RULES.pop(category, None)
+    else:
+        CATEGORY_RULES[category] = CategoryRule(function, name)
+
+
+def filter_section(category: str | None, words: list[str]) -> list[tuple[str | None, list[str]]]:
+    """
+    Applies the category filtering rule of a section.
+
+    :param category: Category of the section.
+    :param words: Words of the section.
+    :return: List of (category, words) parts replacing the section.
+    """
+    rule = CATEGORY_RULES.get(category)
+    if rule is None:
+        return [(category, words)]
+    return rule(category, words)
+
+
+def category_rule_stats() -> dict:
+    """Returns the counters of the rules per category."""
+    return {category: rule.stats() for category, rule in CATEGORY_RULES.items()}
+
+
+def reset_category_rule_stats() -> None:
+    """Zeroes the counters of all rules."""
+    for rule in CATEGORY_RULES.values():
+        rule.reset()
@@ -0,0 +1,73 @@
+"""
+Tests of the category rule registry and its counters.
+
+Run from the llm_requests folder:
+    python -m pytest category_rules_test.py
+"""
+
+import pytest
+
+import category_rules
+from category_rules import filter_section, register_category_rule, category_rule_stats, \
+    reset_category_rule_stats
+
+from constants import TAGS
+
+
+@pytest.fixture(name="rules", autouse=True)
+def fixture_rules(monkeypatch):
+    """A copy of the registry with zeroed counters, the registered rules are dropped after."""
+    monkeypatch.setattr(category_rules, "CATEGORY_RULES", dict(category_rules.CATEGORY_RULES))
+    reset_category_rule_stats()
+    yield category_rules.CATEGORY_RULES
+    reset_category_rule_stats()
+
+
+def counters(category: str) -> tuple[int, int, int, int, int]:
+    """Returns the calls, words, kept, changed and demoted counters of a rule."""
+    stats = category_rule_stats()[category]
+    return stats["calls"], stats["words"], stats["kept"], stats["changed"], stats["demoted"]
+
+
+def test_counters_of_kept_changed_and_demoted_sections():
+    """Every call is counted as kept, changed (split or narrowed) or demoted."""
+    email = TAGS["EMAIL"]
+    assert filter_section(email, ["jan@novak.cz"]) == [(email, ["jan@novak.cz"])]
+    assert filter_section(email, ["adresa", "jan@novak.cz"]) == \
+        [(None, ["adresa"]), (email, ["jan@novak.cz"])]
+    assert filter_section(email, ["bez", "adresy"]) == [(None, ["bez", "adresy"])]
+    assert counters(email) == (3, 5, 1, 1, 1)
+
+    # a location split into a location and a zip code is changed
+    assert filter_section(TAGS["LOCATION"], ["Praha", "120", "00"]) == \
+        [(TAGS["LOCATION"], ["Praha"]), (TAGS["ZIPCODE"], ["120", "00"])]
+    assert counters(TAGS["LOCATION"]) == (1, 3, 0, 1, 0)
+    assert counters(TAGS["DATE"]) == (0, 0, 0, 0, 0)
+    assert category_rule_stats()[email]["rule"] == "email_rule"
+    assert category_rule_stats()[email]["seconds"] >= 0
+
+    reset_category_rule_stats()
+    assert counters(email) == (0, 0, 0, 0, 0)
+
+
+def test_register_category_rule(rules):
+    """A rule can be replaced, added under a name, and removed."""
+    def first_word_rule(category, words):
+        return [(category, words[:1]), (None, words[1:])]
+
+    register_category_rule(TAGS["PERSONAL_NAME"], first_word_rule)
+    register_category_rule("x", first_word_rule, name="custom")
+    assert filter_section(TAGS["PERSONAL_NAME"], ["Jan", "Novák"]) == \
+        [(TAGS["PERSONAL_NAME"], ["Jan"]), (None, ["Novák"])]
+    assert filter_section("x", ["a"]) == [("x", ["a"]), (None, [])]
+    assert category_rule_stats()["x"]["rule"] == "custom"
+    assert counters(TAGS["PERSONAL_NAME"]) == (1, 2, 0, 1, 0)
+    # a part without words still counts the section as changed, not kept
+    assert counters("x") == (1, 1, 0, 1, 0)
+
+    # without a rule the section is kept as it is and nothing is counted
+    register_category_rule(TAGS["DATE"], None)
+    assert TAGS["DATE"] not in rules
+    assert filter_section(TAGS["DATE"], ["1.", "5."]) == [(TAGS["DATE"], ["1.", "5."])]
+    assert TAGS["DATE"] not in category_rule_stats()
+    register_category_rule(TAGS["DATE"], None)  # removing a missing rule is a no-op
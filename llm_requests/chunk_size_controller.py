@@ -0,0 +1,122 @@
+"""
+Module for adapting the chunk size to the observed behaviour of a model.
+
+ChunkSizeController is an additive-increase/multiplicative-decrease
+controller: every accepted response within the target latency grows the
+chunk by a fixed step (larger chunks spread the system prompt over more
+text), while resends and truncated responses shrink it multiplicatively,
+and slow responses shrink it gently. The size does not grow while the rate
+limit headroom is low. The learned size is stored per model and unit, so
+the next run starts from it.
+"""
+
+import os
+import json
+
+from constants import CHUNK_SIZE_LIMITS, CHUNK_TARGET_LATENCY, OUTPUT_LOGS_FOLDER, CHUNK_SIZES
+
+INCREASE_RATIO = 0.05           # additive step as a ratio of the initial size
+RESEND_DECREASE_FACTOR = 0.75
+LATENCY_DECREASE_FACTOR = 0.9
+MIN_HEADROOM = 0.2              # do not grow with less than 20 % of the token budget left
+RESEND_RATE_ALPHA = 0.1
+
+
+class ChunkSizeController:
+    # pylint: disable=too-many-instance-attributes
+    """
+    AIMD controller of the chunk size (token budget or characters) within configured bounds.
+    """
+
+    def __init__(self, size: int, minimum: int, maximum: int,
+                 target_latency: float = CHUNK_TARGET_LATENCY):
+        """
+        :param size: Initial chunk size.
+        :param minimum: Lower bound of the size.
+        :param maximum: Upper bound of the size.
+        :param target_latency: Responses slower than this (seconds) shrink the size.
+        """
+        self.minimum = minimum
+        self.maximum = maximum
+        self.target_latency = target_latency
+        self.step = max(int(size * INCREASE_RATIO), 1)
+        self.size = self._clamp(size)
+
+        self.requests = 0
+        self.resends = 0
+        self.resend_rate = 0.0
+
+    def _clamp(self, size: float) -> int:
+        return int(min(max(size, self.minimum), self.maximum))
+
+    def record(self, latency: float | None = None, resent: bool = False,
+               truncated: bool = False, headroom: float | None = None) -> int:
+        """
+        Updates the size after a request.
+
+        :param latency: Seconds the request took.
+        :param resent: The response was rejected and the chunk has to be re-sent.
+        :param truncated: The response was cut by the output token limit.
+        :param headroom: Remaining share of the rate limit token budget (0-1), if known.
+        :return: The new chunk size.
+        """
+        self.requests += 1
+        self.resends += resent
+        self.resend_rate += RESEND_RATE_ALPHA * (float(resent) - self.resend_rate)
+
+        if resent or truncated:
+            self.size = self._clamp(self.size * RESEND_DECREASE_FACTOR)
+        elif latency is not None and latency > self.target_latency:
+            self.size = self._clamp(self.size * LATENCY_DECREASE_FACTOR)
+        elif headroom is None or headroom >= MIN_HEADROOM:
+            self.size = self._clamp(self.size + self.step)
+        return self.size
+
+    def stats(self) -> dict:
+        """Returns the current size and the resend counters."""
+        return {
+            "size": self.size,
+            "requests": self.requests,
+            "resends": self.resends,
+            "resend_rate": self.resend_rate,
+        }
+
+
+def _chunk_sizes_path() -> str:
+    return os.path.join(OUTPUT_LOGS_FOLDER, CHUNK_SIZES)
+
+
+def load_chunk_size_controller(model: str, unit: str, default_size: int) -> ChunkSizeController:
+    """
+    Creates a controller for the model, starting from its last stored size.
+
+    :param model: Model name (key of the stored sizes).
+    :param unit: "tokens" for token-budget chunking, "chars" for character chunking.
+    :param default_size: Initial size when no size is stored for the model.
+    """
+    size = default_size
+    path = _chunk_sizes_path()
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as file:
+            size = json.load(file).get(f"{model}|{unit}", default_size)
+
+    limits = CHUNK_SIZE_LIMITS[unit]
+    return ChunkSizeController(size, limits["min"], limits["max"])
+
+
+def save_chunk_size(controller: ChunkSizeController, model: str, unit: str) -> None:
+    """
+    Stores the current size of the controller for the next run.
+
+    :param controller: Controller of the model.
+    :param model: Model name.
+    :param unit: "tokens" or "chars".
+    """
+    path = _chunk_sizes_path()
+    sizes = {}
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as file:
+            sizes = json.load(file)
+    sizes[f"{model}|{unit}"] = controller.size
+    with open(path, "w", encoding="utf-8") as file:
+        json.dump(sizes, file, ensure_ascii=False, indent=2)
@@ -0,0 +1,36 @@
+"""
+Fixtures and helpers shared by the tests in the llm_requests folder.
+"""
+
+import os
+
+import pytest
+
+from output_conversion import read_output_log
+
+from constants import OUTPUT_LOGS_FOLDER
+
+
+@pytest.fixture(name="input_file")
+def fixture_input_file(request, tmp_path, monkeypatch):
+    """
+    Input file with the INPUT_TEXT of the test module in a temporary folder,
+    the working folder is the output logs folder.
+    """
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "input").mkdir()
+    path = tmp_path / "input" / "input.txt"
+    path.write_text(request.module.INPUT_TEXT, encoding="utf-8")
+    return str(path)
+
+
+def output_words(input_file: str) -> list[str]:
+    """Returns all words of the main output."""
+    return [word for section in read_output_log(input_file) for word in section["words"]]
+
+
+def read_log(input_file: str, name: str) -> str:
+    """Returns the content of a log of the input file."""
+    log_path = os.path.join(OUTPUT_LOGS_FOLDER, os.path.basename(input_file), name)
+    with open(log_path, "r", encoding="utf-8") as file:
+        return file.read()
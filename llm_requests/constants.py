@@ -21,6 +21,37 @@ OMITTED_TAGS = [
     TAGS["MONEY"]
 ]
 
+# pylint: disable=line-too-long
+SYSTEM_PROMPT = f"""
+        You are an assistant tasked with classifying Czech words and phrases into categories of personal data.
+
+        Your task is to identify and wrap these sections with <>tags</> that represent one of the following categories:
+        - <{TAGS["PERSONAL_NAME"]}> for personal names, inside the tagged section, include the first name, last name, and professional titles such as Ing., JUDr., etc.
+        - <{TAGS["INSTITUTION"]}> for names of specific government, political, cultural, educational or scientific agencies/institutions
+        - <{TAGS["COMPANY"]}> for company names, includes social media platform names
+        - <{TAGS["LOCATION"]}> for place names (e.g., cities, streets, etc.)
+        - <{TAGS["DATE"]}> for dates
+        - <{TAGS["ZIPCODE"]}> for 5-digit Czech postal codes (e.g., "123 45")
+        - <{TAGS["PHONE"]}> for phone numbers
+        - <{TAGS["EMAIL"]}> for email addresses
+        - <{TAGS["CASE_NUMBER"]}> for court case numbers (číslo jednací, č. j., spisová značka)
+        - <{TAGS["ACT"]}> for references to laws and legal acts (e.g., "zákon č. 89/2012 Sb.", "s ř. s.", etc.)
+        - <{TAGS["WEB"]}> for web page URL (www addresses)
+
+        Non-relevant text should not be tagged.
+        Make sure that tags are closed before another tag starts. In case of category overlap, apply the most relevant one.
+
+        Example Input:
+        Here is some text. Jan Novák, Ing., works at XYZ Company and can be reached at jan.novak@example.com +420 123 456 789. More information is available.
+        Example Output:
+        Here is some text. <{TAGS["PERSONAL_NAME"]}>Jan Novák, Ing.</{TAGS["PERSONAL_NAME"]}>, works at <{TAGS["COMPANY"]}>XYZ Company</{TAGS["COMPANY"]}> and can be reached at <{TAGS["EMAIL"]}>jan.novak@example.com</{TAGS["EMAIL"]}> <{TAGS["PHONE"]}>+420 123 456 789</{TAGS["PHONE"]}>. More information is available.
+
+        Return only the original text with the added tags.
+        Do not remove whitespaces.
+        Do not include any explanation or additional text content in the response.
+        """
+# pylint: enable=line-too-long
+
 
 
 # "LLama 3.3 70b" # Currently not using OpenRouter
@@ -47,6 +78,35 @@ TEMPERATURE = 0.4 # 0.4 # 1.0
 
 TEXT_CHUNK_WORD_OVERLAP_TOL = 4
 
+ADDED_RESEND_TOL = 15 #15
+REMOVED_RESEND_TOL = 15 #15
+
+# resends of one chunk before it is split in half
+CHUNK_RETRY_LIMIT = 2
+# rejected chunks shorter than twice this are not split but quarantined (written untagged)
+MIN_SPLIT_WORDS = 16
+
+# Offline token estimate used for token-budget chunking:
+# average UTF-8 bytes of Czech text per token and the token budget for the text of one request
+TOKEN_ESTIMATES = {
+    "LLama 3.3 70b": {"bytes_per_token": 3.2, "chunk_tokens": 350},
+    "Deepseek R1 distill LLama 70b": {"bytes_per_token": 3.2, "chunk_tokens": 350},
+    "Deepseek R1": {"bytes_per_token": 3.0, "chunk_tokens": 350},
+    "Deepseek V3 0324": {"bytes_per_token": 3.0, "chunk_tokens": 350},
+    "Gemini 2.5 Flash": {"bytes_per_token": 3.6, "chunk_tokens": 400},
+    "Gemma 3 27b": {"bytes_per_token": 3.6, "chunk_tokens": 350},
+}
+DEFAULT_TOKEN_ESTIMATE = {"bytes_per_token": 3.0, "chunk_tokens": 350}
+CHOSEN_TOKEN_ESTIMATE = TOKEN_ESTIMATES.get(CHOSEN_MODEL, DEFAULT_TOKEN_ESTIMATE)
+
+# Bounds of the adaptive chunk size (chunk_size_controller.py),
+# token budget with token-budget chunking, characters otherwise
+CHUNK_SIZE_LIMITS = {
+    "tokens": {"min": 150, "max": 1200},
+    "chars": {"min": 400, "max": 4000},
+}
+CHUNK_TARGET_LATENCY = 20.0 # seconds
+
 # -----------------------------------------------------------------------
 
 OUTPUT_LOGS_FOLDER = r"" # <Cesta ke složce pro ukládání výstupních dat a logů>
@@ -55,6 +115,23 @@ LOGS_CATEGORY_WORDS = "category_words"
 LOGS_CHANGES = "changes.txt"
 LOGS_LATEST_POS = "latest_position.txt"
 MAIN_OUTPUT = "main_output.txt"
+MAIN_OUTPUT_LOG = "main_output.jsonl" # append-only, one JSON array per chunk
+MAIN_OUTPUT_SPANS = "main_output_spans.jsonl" # span output mode (span_output.py)
+LOGS_QUARANTINE = "quarantine.txt"
+LOGS_CHECKPOINT = "checkpoint.json"
+
+# group commit of the per-chunk outputs (output_writer.py)
+OUTPUT_COMMIT_CHUNKS = 8
+OUTPUT_COMMIT_INTERVAL = 5.0 # seconds
+OUTPUT_FSYNC = True
+
+BATCH_REQUESTS = "batch_requests.jsonl"
+BATCH_RESULTS = "batch_results.jsonl"
+
+RESPONSE_CACHE = "response_cache.sqlite" # shared by all input files, inside OUTPUT_LOGS_FOLDER
+RESPONSE_CACHE_MAX_BYTES = 512 * 1024 * 1024
+
+CHUNK_SIZES = "chunk_sizes.json" # learned chunk size per model, inside OUTPUT_LOGS_FOLDER
 
 
 
@@ -93,7 +170,8 @@ GROQ_API = {
         # <API klíč pro platformu Groq>
     ],
     "model": CHOSEN_GROQ_MODEL,
-    "base_url": "https://api.groq.com/openai/v1"
+    "base_url": "https://api.groq.com/openai/v1",
+    "limits": {"rpm": 30, "tpm": 12000, "rpd": 1000, "tpd": 100000} # free tier
 }
 
 
@@ -115,7 +193,8 @@ OPENROUTER_API = {
         # <API klíč pro platformu OpenRouter>
     ],
     "model": CHOSEN_OPENROUTER_MODEL,
-    "base_url": "https://openrouter.ai/api/v1"
+    "base_url": "https://openrouter.ai/api/v1",
+    "limits": {"rpm": 20, "rpd": 50} # free models
 }
 
 
@@ -1,26 +1,41 @@
 """Module for continuously sending requests and saving the processed output."""
-import re
-
-from text_file_extraction import read_text_file
-from output_conversion import parse_tagged_text, object_to_json, reconstruct_text, \
-    append_json_string_to_file, correct_object_and_get_reverse_index, \
-    get_latest_position, write_tagged_sections_to_files, append_to_changes_log, \
-        write_latest_position, clean_up_categories
+import os
+import time
+
+from text_file_extraction import TextChunkReader
+from word_offset_index import load_word_index
+from output_conversion import parse_and_clean_up, correct_object_and_get_reverse_index, \
+    remove_reasoning, export_main_output
+from output_writer import OutputWriter
 from text_changes_check import text_changes_check, text_changes_string
-from openai_api_buffer import OpenAIClientManager
+from openai_api_buffer import OpenAIClientManager, HedgePolicy
+from response_cache import ResponseCache
+from chunk_size_controller import ChunkSizeController, load_chunk_size_controller, \
+    save_chunk_size
 
-from constants import TAGS, \
-    TEMPERATURE, \
-    API_INFO
+from constants import SYSTEM_PROMPT, \
+    TEMPERATURE, ADDED_RESEND_TOL, REMOVED_RESEND_TOL, CHUNK_RETRY_LIMIT, MIN_SPLIT_WORDS, \
+    API_INFO, CHOSEN_TOKEN_ESTIMATE, CHOSEN_MODEL, \
+    OUTPUT_LOGS_FOLDER, RESPONSE_CACHE, RESPONSE_CACHE_MAX_BYTES
 
 REQUEST_COUNT = -1 # -1 for Inf loop
 REQUEST_APPROXIMATE_CHAR_LENGTH = 1000
 
-ADDED_RESEND_TOL = 15 #15
-REMOVED_RESEND_TOL = 15 #15
+# size chunks by estimated tokens and cut them at article/sentence ends
+# instead of REQUEST_APPROXIMATE_CHAR_LENGTH characters
+# (the overlap of a chunk cut at an article end is not re-sent)
+TOKEN_BUDGET_CHUNKING = False
+
+# adapt the chunk size (REQUEST_APPROXIMATE_CHAR_LENGTH or the model's token budget)
+# to the observed latency, resends, truncation and rate limit headroom
+ADAPTIVE_CHUNK_SIZE = False
 
+# stream responses and cancel them as soon as they exceed the resend tolerances
+STREAM_RESPONSES = False
 
-FTELL_MASK = (1 << 64) - 1
+# also send slow requests to another provider after its p95 latency
+# (applies to non-streamed requests, STREAM_RESPONSES = False)
+HEDGE_REQUESTS = False
 
 
 
@@ -30,37 +45,9 @@ INPUT_FILE = \
 
 
 chat_prompt = [
-    # pylint: disable=line-too-long
     {
         "role": "system",
-        "content": f"""
-        You are an assistant tasked with classifying Czech words and phrases into categories of personal data.
-
-        Your task is to identify and wrap these sections with <>tags</> that represent one of the following categories:
-        - <{TAGS["PERSONAL_NAME"]}> for personal names, inside the tagged section, include the first name, last name, and professional titles such as Ing., JUDr., etc.
-        - <{TAGS["INSTITUTION"]}> for names of specific government, political, cultural, educational or scientific agencies/institutions
-        - <{TAGS["COMPANY"]}> for company names, includes social media platform names
-        - <{TAGS["LOCATION"]}> for place names (e.g., cities, streets, etc.)
-        - <{TAGS["DATE"]}> for dates
-        - <{TAGS["ZIPCODE"]}> for 5-digit Czech postal codes (e.g., "123 45")
-        - <{TAGS["PHONE"]}> for phone numbers
-        - <{TAGS["EMAIL"]}> for email addresses
-        - <{TAGS["CASE_NUMBER"]}> for court case numbers (číslo jednací, č. j., spisová značka)
-        - <{TAGS["ACT"]}> for references to laws and legal acts (e.g., "zákon č. 89/2012 Sb.", "s ř. s.", etc.)
-        - <{TAGS["WEB"]}> for web page URL (www addresses)
-
-        Non-relevant text should not be tagged.
-        Make sure that tags are closed before another tag starts. In case of category overlap, apply the most relevant one.
-
-        Example Input:
-        Here is some text. Jan Novák, Ing., works at XYZ Company and can be reached at jan.novak@example.com +420 123 456 789. More information is available.
-        Example Output:
-        Here is some text. <{TAGS["PERSONAL_NAME"]}>Jan Novák, Ing.</{TAGS["PERSONAL_NAME"]}>, works at <{TAGS["COMPANY"]}>XYZ Company</{TAGS["COMPANY"]}> and can be reached at <{TAGS["EMAIL"]}>jan.novak@example.com</{TAGS["EMAIL"]}> <{TAGS["PHONE"]}>+420 123 456 789</{TAGS["PHONE"]}>. More information is available.
-
-        Return only the original text with the added tags.
-        Do not remove whitespaces.
-        Do not include any explanation or additional text content in the response.
-        """
+        "content": SYSTEM_PROMPT
     },
     {
         "role": "user",
@@ -70,48 +57,89 @@ chat_prompt = [
 
 
 
-clientManager = OpenAIClientManager(API_INFO)
+RESPONSE_CACHE_STORE = ResponseCache(os.path.join(OUTPUT_LOGS_FOLDER, RESPONSE_CACHE),
+    RESPONSE_CACHE_MAX_BYTES)
+clientManager = OpenAIClientManager(API_INFO, cache=RESPONSE_CACHE_STORE, cache_model=CHOSEN_MODEL,
+    hedge_policy=HedgePolicy() if HEDGE_REQUESTS else None)
+
+WORD_INDEX = load_word_index(INPUT_FILE)
+
 
+# commits the main output, category words, logs and latest position together
+OUTPUT_WRITER = OutputWriter(INPUT_FILE)
 
-COUNT_POSITION = get_latest_position(INPUT_FILE)
+COUNT_POSITION = OUTPUT_WRITER.position
 PREV_COUNT_POS = COUNT_POSITION
 RAW_PREV_COUNT_POS = COUNT_POSITION
 
+TEXT_READER = TextChunkReader(INPUT_FILE, REQUEST_APPROXIMATE_CHAR_LENGTH, COUNT_POSITION,
+    token_budget=CHOSEN_TOKEN_ESTIMATE["chunk_tokens"] if TOKEN_BUDGET_CHUNKING else None,
+    bytes_per_token=CHOSEN_TOKEN_ESTIMATE["bytes_per_token"])
+
+CHUNK_SIZE_UNIT = "tokens" if TOKEN_BUDGET_CHUNKING else "chars"
+DEFAULT_CHUNK_SIZE = CHOSEN_TOKEN_ESTIMATE["chunk_tokens"] if TOKEN_BUDGET_CHUNKING \
+    else REQUEST_APPROXIMATE_CHAR_LENGTH
+if ADAPTIVE_CHUNK_SIZE:
+    CHUNK_SIZE_CONTROLLER = load_chunk_size_controller(CHOSEN_MODEL, CHUNK_SIZE_UNIT,
+        DEFAULT_CHUNK_SIZE)
+else:
+    CHUNK_SIZE_CONTROLLER = ChunkSizeController(DEFAULT_CHUNK_SIZE, DEFAULT_CHUNK_SIZE,
+        DEFAULT_CHUNK_SIZE)
+
+RETRY_COUNT = 0          # resends of the current chunk
+SPLIT_CHAR_COUNT = None  # reduced chunk size while splitting a rejected chunk
+SPLIT_UNTIL = 0          # end of the rejected chunk being split
+
 WHILE_ITERATOR = 0
 
 while WHILE_ITERATOR != REQUEST_COUNT:
     WHILE_ITERATOR += 1
     #-----
 
-    input_text, positions = read_text_file(INPUT_FILE, \
-        COUNT_POSITION, REQUEST_APPROXIMATE_CHAR_LENGTH)
-    COUNT_POSITION = positions[-1]
+    CHUNK_SIZE = CHUNK_SIZE_CONTROLLER.size
+    if TOKEN_BUDGET_CHUNKING:
+        TEXT_READER.token_budget = CHUNK_SIZE
+    else:
+        TEXT_READER.char_count = CHUNK_SIZE
+
+    TEXT_READER.seek(COUNT_POSITION)
+    input_text, positions = TEXT_READER.read_chunk(SPLIT_CHAR_COUNT)
 
     #-----
-    if COUNT_POSITION == RAW_PREV_COUNT_POS:
+    if not positions or positions[-1] == RAW_PREV_COUNT_POS:
         print(f"End of text file (most likely) reached ({COUNT_POSITION})")
         break
+    COUNT_POSITION = positions[-1]
     #-----
 
     chat_prompt[1]["content"] = input_text
 
-    llm_response_text = clientManager.chat(chat_prompt, TEMPERATURE)
+    IS_DIVERGED = False
+    REQUEST_STARTED = time.monotonic()
+    if STREAM_RESPONSES:
+        # <think> blocks are dropped while streaming
+        llm_response_text, IS_DIVERGED = clientManager.chat_stream(chat_prompt, TEMPERATURE,
+            ADDED_RESEND_TOL, REMOVED_RESEND_TOL)
+    else:
+        llm_response_text = clientManager.chat(chat_prompt, TEMPERATURE)
+        llm_response_text = remove_reasoning(llm_response_text)
+    REQUEST_LATENCY = time.monotonic() - REQUEST_STARTED
 
     #print(llm_response_text)
 
-    llm_response_text = re.sub(r'<think>.*?</think>', '', llm_response_text, flags=re.DOTALL)
-
-    response_parsed_object = parse_tagged_text(llm_response_text)
+    response_parsed_object, RECONSTRUCTED_TEXT = parse_and_clean_up(llm_response_text)
 
     # changes log
     POSITION_STRING = \
-        f"----- {PREV_COUNT_POS & FTELL_MASK:16} - {COUNT_POSITION & FTELL_MASK:16} -----"
+        f"----- {PREV_COUNT_POS:16} - {COUNT_POSITION:16} " \
+        f"({WORD_INDEX.progress(COUNT_POSITION):7.2%}) -----"
     print(POSITION_STRING)
 
-    a, r = text_changes_check(input_text, reconstruct_text(response_parsed_object))
+    a, r = ([], []) if IS_DIVERGED else \
+        text_changes_check(input_text, RECONSTRUCTED_TEXT)
 
     # print(response_parsed_object)
-    # print(reconstruct_text(response_parsed_object))
+    # print(RECONSTRUCTED_TEXT)
     # print(a, r)
 
     ADDED_COUNT = len(a)
@@ -122,10 +150,33 @@ while WHILE_ITERATOR != REQUEST_COUNT:
         print(f"Too many added words: {ADDED_COUNT}, limit is {ADDED_RESEND_TOL}")
     if IS_REMOVED_OVER_LIMIT:
         print(f"Too many removed words: {REMOVED_COUNT}, limit is {REMOVED_RESEND_TOL}")
-    if IS_ADDED_OVER_LIMIT or IS_REMOVED_OVER_LIMIT:
+    if IS_DIVERGED or IS_ADDED_OVER_LIMIT or IS_REMOVED_OVER_LIMIT:
         print("--------------------- !!! RESENDING !!! ---------------------")
-        PREV_COUNT_POS = positions[1]
-        COUNT_POSITION = positions[1]
+        clientManager.discard_cached(chat_prompt, TEMPERATURE)
+        CHUNK_SIZE_CONTROLLER.record(REQUEST_LATENCY, resent=True)
+        RETRY_COUNT += 1
+        COUNT_POSITION = PREV_COUNT_POS
+        if RETRY_COUNT <= CHUNK_RETRY_LIMIT:
+            continue
+
+        if len(positions) >= 2 * MIN_SPLIT_WORDS:
+            # bisect: re-read the same span in halves until the pieces pass
+            SPLIT_CHAR_COUNT = len(input_text) // 2
+            SPLIT_UNTIL = max(SPLIT_UNTIL, positions[-1])
+            print(f"Chunk rejected {RETRY_COUNT} times, splitting it ({SPLIT_CHAR_COUNT} chars)")
+            OUTPUT_WRITER.log_changes(f"{POSITION_STRING}\nSPLIT after {RETRY_COUNT} resends")
+            RETRY_COUNT = 0
+            continue
+
+        # too short to split, keep the text untagged so the output stays complete
+        print(f"Chunk rejected {RETRY_COUNT} times, quarantining it")
+        COUNT_POSITION = positions[-1]
+        OUTPUT_WRITER.write_chunk([{"words": input_text.split(), "category": None}],
+            COUNT_POSITION, f"{POSITION_STRING}\nQUARANTINED after {RETRY_COUNT} resends",
+            "\n".join([POSITION_STRING, input_text]))
+        RETRY_COUNT = 0
+        RAW_PREV_COUNT_POS = COUNT_POSITION
+        PREV_COUNT_POS = COUNT_POSITION
         continue
     #-----
     RAW_PREV_COUNT_POS = COUNT_POSITION
@@ -135,21 +186,46 @@ while WHILE_ITERATOR != REQUEST_COUNT:
     print(TEXT_CHANGES_TOSTRING)
 
     CHANGES_OUTPUT = "\n".join([POSITION_STRING, TEXT_CHANGES_TOSTRING])
-    append_to_changes_log(INPUT_FILE, CHANGES_OUTPUT)
-
-    #modifies response_parsed_object
-    clean_up_categories(response_parsed_object)
+    if RETRY_COUNT:
+        CHANGES_OUTPUT += f"\nResends: {RETRY_COUNT}"
+    CHANGES_OUTPUT += f"\nChunk size: {SPLIT_CHAR_COUNT or CHUNK_SIZE} " \
+        f"{'chars' if SPLIT_CHAR_COUNT else CHUNK_SIZE_UNIT}, latency: {REQUEST_LATENCY:.1f}s"
+    # running totals, so the last logged chunk has them even if the loop does not end normally
+    CHANGES_OUTPUT += f"\nBytes sent: {TEXT_READER.bytes_sent}, " \
+        f"re-sent: {TEXT_READER.bytes_resent}"
+    RETRY_COUNT = 0
 
-    #modifies response_parsed_object
-    REVERSE_INDEX = correct_object_and_get_reverse_index(response_parsed_object, input_text)
-    COUNT_POSITION = positions[REVERSE_INDEX]
+    CHUNK_SIZE_CONTROLLER.record(REQUEST_LATENCY,
+        truncated=clientManager.last_finish_reason == "length",
+        headroom=clientManager.token_headroom())
 
-    append_json_string_to_file(object_to_json(response_parsed_object), INPUT_FILE)
+    # no tagged section can continue past an article end, so no overlap is re-sent
+    # (a detected sentence end may be wrong, e.g. after an unknown abbreviation)
+    if TEXT_READER.last_boundary not in ("article", "eof"):
+        #modifies response_parsed_object
+        REVERSE_INDEX = correct_object_and_get_reverse_index(response_parsed_object, input_text)
+        COUNT_POSITION = positions[REVERSE_INDEX]
 
-    write_tagged_sections_to_files(response_parsed_object, INPUT_FILE)
+    OUTPUT_WRITER.write_chunk(response_parsed_object, COUNT_POSITION, CHANGES_OUTPUT)
 
-    write_latest_position(INPUT_FILE, COUNT_POSITION)
 
+    if SPLIT_CHAR_COUNT and COUNT_POSITION >= SPLIT_UNTIL:
+        SPLIT_CHAR_COUNT = None # past the rejected chunk, back to full-size chunks
 
     #-----
     PREV_COUNT_POS = COUNT_POSITION
+
+RESENT_STRING = f"Bytes sent: {TEXT_READER.bytes_sent}, re-sent: {TEXT_READER.bytes_resent} " \
+    f"({TEXT_READER.bytes_resent / max(TEXT_READER.bytes_sent, 1):.2%})"
+print(RESENT_STRING)
+OUTPUT_WRITER.log_changes(RESENT_STRING)
+OUTPUT_WRITER.close()
+print(f"Response cache: {clientManager.cache_stats()}")
+print(f"Chunk size: {CHUNK_SIZE_CONTROLLER.stats()}")
+if ADAPTIVE_CHUNK_SIZE:
+    save_chunk_size(CHUNK_SIZE_CONTROLLER, CHOSEN_MODEL, CHUNK_SIZE_UNIT)
+export_main_output(INPUT_FILE)
+
+TEXT_READER.close()
+clientManager.close()
+RESPONSE_CACHE_STORE.close()
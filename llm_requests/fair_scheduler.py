@@ -0,0 +1,123 @@
+"""
+Module for sharing the requests in flight of one client pool fairly between input files.
+
+FairScheduler hands out a fixed number of request slots with stride scheduling:
+every granted request advances the virtual time ("pass") of its file by 1 / weight,
+and a free slot goes to the waiting file with the highest priority and then the
+lowest pass. A file with weight 2 thus gets twice the requests of a file with
+weight 1 while both have chunks waiting, and a file that was idle does not
+collect credit for the time it was not asking.
+"""
+
+import asyncio
+import contextlib
+from collections import deque
+
+
+class FairScheduler:
+    # pylint: disable=too-many-instance-attributes
+    """
+    Weighted fair scheduler of request slots between named flows (input files).
+
+    Usage:
+        scheduler = FairScheduler(32)
+        scheduler.register("a.txt", weight=2)
+        async with scheduler.slot("a.txt"):
+            await client_manager.achat(...)
+    """
+
+    def __init__(self, slots: int):
+        """
+        :param slots: Number of requests in flight across all flows.
+        """
+        self.slots = slots
+        self._free = slots
+        self._weights = {}
+        self._priorities = {}
+        self._pass = {}
+        self._waiting = {}      # name -> deque of futures
+        self._virtual_time = 0.0
+        self.granted = {}
+
+    def register(self, name: str, weight: float = 1.0, priority: int = 0) -> None:
+        """
+        Adds a flow (or changes its weight and priority).
+
+        :param name: Flow name.
+        :param weight: Share of the slots relative to the other flows of the same priority.
+        :param priority: Flows with a higher priority are served first.
+        :raises ValueError: If the weight is not positive.
+        """
+        if weight <= 0:
+            raise ValueError(f"Weight of {name} has to be positive, got {weight}.")
+        self._weights[name] = weight
+        self._priorities[name] = priority
+        self._pass.setdefault(name, self._virtual_time)
+        self._waiting.setdefault(name, deque())
+        self.granted.setdefault(name, 0)
+
+    def _grant(self, name: str) -> None:
+        self._free -= 1
+        self._virtual_time = self._pass[name]
+        self._pass[name] += 1 / self._weights[name]
+        self.granted[name] += 1
+
+    def _dispatch(self) -> None:
+        while self._free:
+            waiting = [name for name, queue in self._waiting.items() if queue]
+            if not waiting:
+                return
+            name = min(waiting, key=lambda n: (-self._priorities[n], self._pass[n]))
+            future = self._waiting[name].popleft()
+            if future.done():
+                continue    # cancelled while waiting
+            self._grant(name)
+            future.set_result(None)
+
+    async def acquire(self, name: str) -> None:
+        """
+        Waits for a free slot for a flow.
+
+        :param name: Registered flow name.
+        """
+        if name not in self._weights:
+            self.register(name)
+        queue = self._waiting[name]
+        if not queue:
+            # an idle flow starts from the current virtual time, without saved-up credit
+            self._pass[name] = max(self._pass[name], self._virtual_time)
+        if self._free and not any(self._waiting.values()):
+            self._grant(name)
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        queue.append(future)
+        self._dispatch()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if not future.cancelled():
+                self.release()
+            elif future in queue:
+                queue.remove(future)
+            raise
+
+    def release(self) -> None:
+        """Returns a slot and hands it to the next waiting flow."""
+        self._free += 1
+        self._dispatch()
+
+    @contextlib.asynccontextmanager
+    async def slot(self, name: str):
+        """Holds a slot of a flow for the duration of the block."""
+        await self.acquire(name)
+        try:
+            yield
+        finally:
+            self.release()
+
+    def stats(self) -> dict:
+        """Returns the granted requests and the number of waiting requests per flow."""
+        return {name: {"granted": self.granted[name], "waiting": len(self._waiting[name]),
+                       "weight": weight, "priority": self._priorities[name]}
+                for name, weight in self._weights.items()}
@@ -0,0 +1,401 @@
+"""
+Module for processing a shared corpus from several machines through a job queue.
+
+1. `enqueue_file` splits an input file into non-overlapping chunks (like the batch mode;
+   token-budget chunks cut at article/sentence ends are recommended) and adds their
+   byte ranges to the queue.
+2. Any number of `run_worker` processes, on any machine that sees the queue and the
+   corpus, lease chunks, keep the lease alive with heartbeats while the request runs
+   and store the cleaned-up result in the queue's result store. A chunk whose lease
+   expires (crashed or stalled worker) is handed out again; a completed chunk never is,
+   and a result sent after the lease was lost is dropped. A chunk that was leased
+   MAX_JOB_ATTEMPTS times without a result ends in the "failed" state.
+3. `assemble` writes the stored results through an OutputWriter (main output,
+   category words, changes log, latest position) in input order, as far as
+   the chunks are complete; a failed chunk is written untagged and quarantined.
+   It can be run repeatedly.
+
+JobQueueBackend is the interface of the queue, SQLiteJobQueue implements it on a
+SQLite file (on a shared volume; it uses the default rollback journal, as WAL does
+not work over network file systems).
+"""
+
+import os
+import abc
+import json
+import time
+import socket
+import sqlite3
+import threading
+import multiprocessing
+
+from text_file_extraction import TextChunkReader
+from output_conversion import parse_and_clean_up, get_latest_position, remove_reasoning, \
+    export_main_output
+from output_writer import OutputWriter
+from text_changes_check import text_changes_check, text_changes_string
+from openai_api_buffer import OpenAIClientManager
+
+from constants import SYSTEM_PROMPT, TEMPERATURE, ADDED_RESEND_TOL, REMOVED_RESEND_TOL, \
+    CHUNK_RETRY_LIMIT, CHOSEN_TOKEN_ESTIMATE, API_INFO
+
+LEASE_SECONDS = 300
+HEARTBEAT_INTERVAL = LEASE_SECONDS / 3
+# a chunk leased this many times without a result fails (and is quarantined by `assemble`)
+MAX_JOB_ATTEMPTS = 5
+IDLE_POLL_INTERVAL = 10
+
+_MAX_CHUNK_CHARS = 1 << 30
+
+
+class JobQueueBackend(abc.ABC):
+    """
+    Interface of a chunk job queue with leases and a per-chunk result store.
+
+    A job is a dictionary with "id", "corpus" (input file path), "seq" (order within
+    the corpus), "start" and "end" (byte range), "attempts" and "state" ("pending",
+    "leased", "done" or "failed").
+    """
+
+    @abc.abstractmethod
+    def enqueue(self, corpus: str, ranges: list[tuple[int, int]]) -> int:
+        """Adds the byte ranges of a corpus (in order), returns the number of new jobs."""
+
+    @abc.abstractmethod
+    def lease(self, worker: str, lease_seconds: float = LEASE_SECONDS) -> dict | None:
+        """Leases the first pending (or expired) job, or returns None if there is none."""
+
+    @abc.abstractmethod
+    def heartbeat(self, job_id: int, worker: str, lease_seconds: float = LEASE_SECONDS) -> bool:
+        """Extends a lease, returns False if the worker does not hold it anymore."""
+
+    @abc.abstractmethod
+    def complete(self, job_id: int, worker: str, result: dict) -> bool:
+        """Stores the result of a leased job, returns False (and drops it) if the lease was lost."""
+
+    @abc.abstractmethod
+    def release(self, job_id: int, worker: str) -> None:
+        """
+        Gives a leased job back to the queue (e.g. after a request error),
+        or fails it if it is out of attempts.
+        """
+
+    @abc.abstractmethod
+    def results(self, corpus: str, after_position: int) -> list[tuple[dict, dict | None]]:
+        """
+        Returns the (job, result or None) pairs of a corpus from a byte offset on.
+        The result of a failed job is None.
+        """
+
+    @abc.abstractmethod
+    def stats(self) -> dict:
+        """Returns the number of jobs in each state (including "failed")."""
+
+    def close(self) -> None:
+        """Releases the backend's resources."""
+
+
+class SQLiteJobQueue(JobQueueBackend):
+    """
+    Job queue and result store in one SQLite file.
+    """
+
+    def __init__(self, path: str):
+        """
+        :param path: Path to the SQLite file (created if missing).
+        """
+        self.path = path
+        self._connection = sqlite3.connect(path, timeout=60, isolation_level=None)
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "id INTEGER PRIMARY KEY, corpus TEXT NOT NULL, seq INTEGER NOT NULL, "
+            "start INTEGER NOT NULL, end INTEGER NOT NULL, "
+            "state TEXT NOT NULL DEFAULT 'pending', worker TEXT, lease_until REAL, "
+            "attempts INTEGER NOT NULL DEFAULT 0, result TEXT, UNIQUE (corpus, start))"
+        )
+        self._connection.execute(
+            "CREATE INDEX IF NOT EXISTS jobs_state ON jobs (state, corpus, seq)")
+
+    def _transaction(self):
+        # BEGIN IMMEDIATE takes the write lock up front, so two workers can not lease one job
+        self._connection.execute("BEGIN IMMEDIATE")
+
+    def _fail_exhausted(self, now: float) -> None:
+        # expired leases of jobs out of attempts end in the terminal "failed" state
+        self._connection.execute(
+            "UPDATE jobs SET state = 'failed', worker = NULL, lease_until = NULL "
+            "WHERE attempts >= ? AND (state = 'pending' OR (state = 'leased' AND lease_until < ?))",
+            (MAX_JOB_ATTEMPTS, now))
+
+    def enqueue(self, corpus: str, ranges: list[tuple[int, int]]) -> int:
+        self._transaction()
+        try:
+            seq = self._connection.execute(
+                "SELECT COALESCE(MAX(seq) + 1, 0) FROM jobs WHERE corpus = ?",
+                (corpus,)).fetchone()[0]
+            added = 0
+            for start, end in ranges:
+                cursor = self._connection.execute(
+                    "INSERT OR IGNORE INTO jobs (corpus, seq, start, end) VALUES (?, ?, ?, ?)",
+                    (corpus, seq, start, end))
+                seq += cursor.rowcount
+                added += cursor.rowcount
+            self._connection.execute("COMMIT")
+        except BaseException:
+            self._connection.execute("ROLLBACK")
+            raise
+        return added
+
+    def lease(self, worker: str, lease_seconds: float = LEASE_SECONDS) -> dict | None:
+        now = time.time()
+        self._transaction()
+        try:
+            self._fail_exhausted(now)
+            row = self._connection.execute(
+                "SELECT id, corpus, seq, start, end, attempts FROM jobs "
+                "WHERE state = 'pending' OR (state = 'leased' AND lease_until < ?) "
+                "ORDER BY corpus, seq LIMIT 1", (now,)).fetchone()
+            if row is not None:
+                self._connection.execute(
+                    "UPDATE jobs SET state = 'leased', worker = ?, lease_until = ?, "
+                    "attempts = attempts + 1 WHERE id = ?",
+                    (worker, now + lease_seconds, row[0]))
+            self._connection.execute("COMMIT")
+        except BaseException:
+            self._connection.execute("ROLLBACK")
+            raise
+
+        if row is None:
+            return None
+        return dict(zip(("id", "corpus", "seq", "start", "end", "attempts", "state"),
+                        row[:5] + (row[5] + 1, "leased")))
+
+    def heartbeat(self, job_id: int, worker: str, lease_seconds: float = LEASE_SECONDS) -> bool:
+        cursor = self._connection.execute(
+            "UPDATE jobs SET lease_until = ? WHERE id = ? AND worker = ? AND state = 'leased'",
+            (time.time() + lease_seconds, job_id, worker))
+        return cursor.rowcount == 1
+
+    def complete(self, job_id: int, worker: str, result: dict) -> bool:
+        cursor = self._connection.execute(
+            "UPDATE jobs SET state = 'done', result = ?, lease_until = NULL "
+            "WHERE id = ? AND worker = ? AND state = 'leased'",
+            (json.dumps(result, ensure_ascii=False), job_id, worker))
+        return cursor.rowcount == 1
+
+    def release(self, job_id: int, worker: str) -> None:
+        self._connection.execute(
+            "UPDATE jobs SET state = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END, "
+            "worker = NULL, lease_until = NULL WHERE id = ? AND worker = ? AND state = 'leased'",
+            (MAX_JOB_ATTEMPTS, job_id, worker))
+
+    def results(self, corpus: str, after_position: int) -> list[tuple[dict, dict | None]]:
+        self._fail_exhausted(time.time())
+        rows = self._connection.execute(
+            "SELECT id, corpus, seq, start, end, attempts, state, result FROM jobs "
+            "WHERE corpus = ? AND start >= ? ORDER BY seq", (corpus, after_position)).fetchall()
+        return [(dict(zip(("id", "corpus", "seq", "start", "end", "attempts", "state"), row[:7])),
+                 json.loads(row[7]) if row[7] else None) for row in rows]
+
+    def stats(self) -> dict:
+        self._fail_exhausted(time.time())
+        return dict(self._connection.execute(
+            "SELECT state, COUNT(*) FROM jobs GROUP BY state").fetchall())
+
+    def close(self) -> None:
+        self._connection.close()
+
+
+class _Heartbeat:
+    """Keeps a lease alive from a background thread while a job is processed."""
+
+    def __init__(self, queue_path: str, job_id: int, worker: str,
+                 lease_seconds: float = LEASE_SECONDS):
+        self._args = (queue_path, job_id, worker, lease_seconds)
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self.lost = False
+
+    def _run(self):
+        queue_path, job_id, worker, lease_seconds = self._args
+        queue = SQLiteJobQueue(queue_path) # sqlite connections are bound to their thread
+        try:
+            while not self._stop.wait(min(HEARTBEAT_INTERVAL, lease_seconds / 3)):
+                if not queue.heartbeat(job_id, worker, lease_seconds):
+                    self.lost = True
+                    return
+        finally:
+            queue.close()
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *_):
+        self._stop.set()
+        self._thread.join()
+
+
+def enqueue_file(queue: JobQueueBackend, input_file_path: str, char_count: int = 1000,
+                 token_budget: int | None = None) -> int:
+    """
+    Adds the chunks of an input file (from its latest recorded position) to the queue.
+    Chunks that are already queued are skipped.
+
+    :param queue: Job queue.
+    :param input_file_path: Path to the input text file (as seen by the workers).
+    :param char_count: Chunk size in characters (when token_budget is None).
+    :param token_budget: Estimated tokens per chunk, enables token-budget chunking
+                         (e.g. CHOSEN_TOKEN_ESTIMATE["chunk_tokens"]).
+    :return: Number of new jobs.
+    """
+    ranges = []
+    with TextChunkReader(input_file_path, char_count, get_latest_position(input_file_path),
+                         token_budget=token_budget,
+                         bytes_per_token=CHOSEN_TOKEN_ESTIMATE["bytes_per_token"]) as reader:
+        start = reader.position
+        for _, positions in reader:
+            ranges.append((start, positions[-1]))
+            start = positions[-1]
+    return queue.enqueue(input_file_path, ranges)
+
+
+def read_text_range(input_file_path: str, start: int, end: int) -> str:
+    """Returns the text of a chunk between two word end positions, as the reader formats it."""
+    with TextChunkReader(input_file_path, _MAX_CHUNK_CHARS, start, end=end) as reader:
+        return reader.read_chunk()[0]
+
+
+def process_chunk(client_manager: OpenAIClientManager, text: str,
+                  temperature: float = TEMPERATURE) -> dict:
+    """
+    Requests a chunk with bounded resends and returns its result: the cleaned-up sections,
+    the changes string and the resend count. A chunk rejected more than CHUNK_RETRY_LIMIT
+    times is quarantined (kept untagged).
+    """
+    chat_prompt = [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": text}
+    ]
+    for resends in range(CHUNK_RETRY_LIMIT + 1):
+        llm_response_text = remove_reasoning(client_manager.chat(chat_prompt, temperature))
+        response_parsed_object, reconstructed_text = parse_and_clean_up(llm_response_text)
+        a, r = text_changes_check(text, reconstructed_text)
+        if len(a) <= ADDED_RESEND_TOL and len(r) <= REMOVED_RESEND_TOL:
+            return {"parsed": response_parsed_object, "changes": text_changes_string(a, r),
+                    "resends": resends, "quarantined": False}
+        client_manager.discard_cached(chat_prompt, temperature)
+
+    return {"parsed": [{"words": text.split(), "category": None}], "changes": "",
+            "resends": CHUNK_RETRY_LIMIT + 1, "quarantined": True, "text": text}
+
+
+def run_worker(queue_path: str, worker: str, client_manager: OpenAIClientManager,
+               wait_for_jobs: bool = False) -> int:
+    """
+    Leases and processes jobs until the queue is empty.
+
+    :param queue_path: Path to the SQLite queue.
+    :param worker: Unique worker name (e.g. "<host>-<pid>").
+    :param client_manager: Client manager sending the requests.
+    :param wait_for_jobs: Keep polling for new or expired jobs instead of returning.
+    :return: Number of jobs completed by this worker.
+    """
+    queue = SQLiteJobQueue(queue_path)
+    completed = 0
+    try:
+        while True:
+            job = queue.lease(worker)
+            if job is None:
+                if not wait_for_jobs:
+                    return completed
+                time.sleep(IDLE_POLL_INTERVAL)
+                continue
+
+            try:
+                with _Heartbeat(queue_path, job["id"], worker) as heartbeat:
+                    text = read_text_range(job["corpus"], job["start"], job["end"])
+                    result = process_chunk(client_manager, text)
+            except RuntimeError as e:
+                print(f"[WARNING] Job {job['id']} failed: {e}")
+                queue.release(job["id"], worker)
+                continue
+
+            if heartbeat.lost or not queue.complete(job["id"], worker, result):
+                print(f"[WARNING] Lease of job {job['id']} was lost, result dropped.")
+                continue
+            completed += 1
+    finally:
+        queue.close()
+
+
+def assemble(queue: JobQueueBackend, input_file_path: str) -> int:
+    """
+    Writes the completed results of an input file in order, from its latest position
+    up to the first chunk that is not complete yet. A failed chunk (out of attempts)
+    is read from the input file and written untagged and quarantined.
+
+    :param queue: Job queue.
+    :param input_file_path: Path to the input text file (as it was enqueued).
+    :return: Number of chunks written.
+    """
+    written = 0
+    with OutputWriter(input_file_path) as writer:
+        position = writer.position
+        for job, result in queue.results(input_file_path, position):
+            if job["start"] != position or (result is None and job["state"] != "failed"):
+                break
+
+            position_string = \
+                f"----- {job['start']:16} - {job['end']:16} ----- (job {job['id']})"
+            quarantine = None
+            if result is None:
+                # keep the text untagged so the output stays complete
+                text = read_text_range(input_file_path, job["start"], job["end"])
+                result = {"parsed": [{"words": text.split(), "category": None}]}
+                changes_output = f"{position_string}\nFAILED after {job['attempts']} attempts, " \
+                    "QUARANTINED"
+                quarantine = "\n".join([position_string, text])
+            elif result["quarantined"]:
+                changes_output = f"{position_string}\nQUARANTINED after {result['resends']} resends"
+                quarantine = "\n".join([position_string, result["text"]])
+            else:
+                changes_output = "\n".join([position_string, result["changes"]])
+                if result["resends"]:
+                    changes_output += f"\nResends: {result['resends']}"
+
+            writer.write_chunk(result["parsed"], job["end"], changes_output, quarantine)
+            position = job["end"]
+            written += 1
+
+    if written:
+        export_main_output(input_file_path)
+    return written
+
+
+def _local_worker(queue_path: str, index: int) -> None:
+    client_manager = OpenAIClientManager(API_INFO)
+    try:
+        run_worker(queue_path, f"{socket.gethostname()}-{os.getpid()}-{index}", client_manager)
+    finally:
+        client_manager.close()
+
+
+if __name__ == "__main__":
+    INPUT_FILE = \
+        r"" # <Cesta ke vstupnímu textovému souboru, který má být zpracován>
+    QUEUE_FILE = r"" # <Cesta k SQLite frontě na sdíleném svazku>
+    LOCAL_WORKERS = 4
+
+    JOB_QUEUE = SQLiteJobQueue(QUEUE_FILE)
+    print(f"Enqueued: {enqueue_file(JOB_QUEUE, INPUT_FILE)}")
+
+    WORKER_PROCESSES = [multiprocessing.Process(target=_local_worker, args=(QUEUE_FILE, i))
+                        for i in range(LOCAL_WORKERS)]
+    for process in WORKER_PROCESSES:
+        process.start()
+    for process in WORKER_PROCESSES:
+        process.join()
+
+    print(f"Assembled: {assemble(JOB_QUEUE, INPUT_FILE)}, queue: {JOB_QUEUE.stats()}")
+    JOB_QUEUE.close()
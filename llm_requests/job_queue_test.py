@@ -0,0 +1,93 @@
+"""
+Tests of the job queue mode with several local worker processes and a fake client.
+
+Run from the llm_requests folder:
+    python -m pytest job_queue_test.py
+"""
+
+import multiprocessing
+
+import pytest
+
+pytest.importorskip("openai")
+
+# pylint: disable=wrong-import-position
+from conftest import output_words, read_log
+from job_queue import SQLiteJobQueue, enqueue_file, run_worker, assemble, MAX_JOB_ATTEMPTS
+from output_conversion import get_latest_position
+
+from constants import LOGS_CHANGES, LOGS_QUARANTINE
+
+INPUT_TEXT = "\n\n".join(
+    f"Článek {i}. Honza jel do Prahy. Vrátil se až večer." for i in range(40)) + "\n"
+WORKERS = 4
+
+
+class EchoClient:
+    """Client manager answering every chunk with its text, the first word tagged as a location."""
+
+    def chat(self, messages: list[dict], temperature: float) -> str:
+        # pylint: disable=unused-argument
+        """Answers one request."""
+        first, rest = messages[-1]["content"].split(" ", 1)
+        return f"<l>{first}</l> {rest}"
+
+    def discard_cached(self, messages: list[dict], temperature: float) -> None:
+        """Nothing is cached."""
+
+
+def _echo_worker(queue_path: str, index: int) -> None:
+    run_worker(queue_path, f"worker-{index}", EchoClient())
+
+
+def run_workers(queue_path: str) -> None:
+    """Runs WORKERS worker processes until the queue is empty."""
+    processes = [multiprocessing.Process(target=_echo_worker, args=(queue_path, i))
+                 for i in range(WORKERS)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+        assert process.exitcode == 0
+
+
+@pytest.fixture(name="queue")
+def fixture_queue(tmp_path):
+    """Empty SQLite queue in the temporary folder."""
+    queue = SQLiteJobQueue(str(tmp_path / "queue.sqlite"))
+    yield queue
+    queue.close()
+
+
+def test_workers_complete_every_chunk_once(input_file, queue):
+    """Worker processes take over an expired lease and every chunk is written once, in order."""
+    jobs = enqueue_file(queue, input_file, char_count=100, token_budget=None)
+    assert jobs > WORKERS
+    assert enqueue_file(queue, input_file, char_count=100, token_budget=None) == 0
+
+    crashed = queue.lease("crashed", lease_seconds=-1)
+    run_workers(queue.path)
+    assert not queue.complete(crashed["id"], "crashed", {})
+    assert queue.stats() == {"done": jobs}
+
+    assert assemble(queue, input_file) == jobs
+    assert assemble(queue, input_file) == 0
+    assert output_words(input_file) == INPUT_TEXT.split()
+    assert read_log(input_file, LOGS_CHANGES).count(" ----- (job ") == jobs
+    assert get_latest_position(input_file) == len(INPUT_TEXT.encode("utf-8"))
+
+
+def test_job_out_of_attempts_fails_and_is_quarantined(input_file, queue):
+    """A job leased MAX_JOB_ATTEMPTS times without a result fails and is written untagged."""
+    jobs = enqueue_file(queue, input_file, char_count=100, token_budget=None)
+    for _ in range(MAX_JOB_ATTEMPTS):
+        failed = queue.lease("crashed", lease_seconds=-1)
+        assert failed["seq"] == 0
+    run_workers(queue.path)
+    assert queue.stats() == {"done": jobs - 1, "failed": 1}
+
+    assert assemble(queue, input_file) == jobs
+    assert output_words(input_file) == INPUT_TEXT.split()
+    assert f"(job {failed['id']})\nFAILED after {MAX_JOB_ATTEMPTS} attempts, QUARANTINED" \
+        in read_log(input_file, LOGS_CHANGES)
+    assert read_log(input_file, LOGS_QUARANTINE).count(" ----- (job ") == 1
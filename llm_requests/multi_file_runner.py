@@ -0,0 +1,134 @@
+"""
+Module for processing many input files at once with one shared client pool.
+
+Every input file gets a PipelineRunner with its own output folder and latest
+position in OUTPUT_LOGS_FOLDER (so each file continues where it stopped), and all
+runners send their requests through one OpenAIClientManager. A FairScheduler
+splits the requests in flight between the files by their weights and priorities,
+instead of the files competing for the same API keys in separate scripts.
+"""
+
+import os
+import glob
+import asyncio
+
+from openai_api_buffer import OpenAIClientManager
+from pipeline_runner import PipelineRunner, PIPELINE_WORKERS
+from fair_scheduler import FairScheduler
+from chunk_size_controller import ChunkSizeController
+
+from constants import API_INFO, TEMPERATURE
+
+INPUT_FILE_PATTERN = "*.txt"
+
+
+def collect_input_files(paths: list[str], pattern: str = INPUT_FILE_PATTERN) -> list[str]:
+    """
+    Expands directories to the files matching `pattern` inside them (sorted by name).
+
+    :param paths: Input files and directories.
+    :param pattern: Glob pattern of input files in directories.
+    :return: List of input file paths.
+    :raises ValueError: If two input files have the same name, as the output
+                        folder is selected by the file name.
+    """
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files += sorted(file for file in glob.glob(os.path.join(path, pattern))
+                            if os.path.isfile(file))
+        else:
+            files.append(path)
+
+    names = {}
+    for file in files:
+        name = os.path.basename(file)
+        if name in names:
+            raise ValueError(
+                f"Input files {names[name]} and {file} share the output folder {name}.")
+        names[name] = file
+    return files
+
+
+class MultiFileRunner:
+    """
+    Processes several input files concurrently, sharing one client manager fairly.
+
+    Usage:
+        runner = MultiFileRunner(OpenAIClientManager(API_INFO), ["corpora/"],
+                                 weights={"corpora/urgent.txt": 3})
+        runner.run()
+    """
+
+    def __init__(self, client_manager: OpenAIClientManager, paths: list[str],
+                 weights: dict[str, float] | None = None,
+                 priorities: dict[str, int] | None = None,
+                 slots: int = PIPELINE_WORKERS, char_count: int = 1000,
+                 token_budget: int | None = None,
+                 temperature: float = TEMPERATURE,
+                 chunk_size: ChunkSizeController | None = None):
+        # pylint: disable=too-many-arguments
+        # pylint: disable=too-many-positional-arguments
+        """
+        :param client_manager: Client manager shared by all files.
+        :param paths: Input files and directories (see `collect_input_files`).
+        :param weights: Share of the requests per input file path (default 1).
+        :param priorities: Priority per input file path (default 0), files with
+                           a higher priority get the free slots first.
+        :param slots: Requests in flight across all files (the client manager's
+                      max_in_flight should be at least this).
+        :param char_count: Chunk size in characters (when token_budget is None).
+        :param token_budget: Estimated tokens per chunk, enables token-budget chunking.
+        :param temperature: Sampling temperature.
+        :param chunk_size: Adapts the chunk size of all files (they share the model).
+        """
+        self.client_manager = client_manager
+        self.input_file_paths = collect_input_files(paths)
+        self.scheduler = FairScheduler(slots)
+        weights = weights or {}
+        priorities = priorities or {}
+
+        self.runners = []
+        for input_file_path in self.input_file_paths:
+            self.scheduler.register(input_file_path, weights.get(input_file_path, 1.0),
+                                    priorities.get(input_file_path, 0))
+            # every file may use all slots while the others are idle
+            self.runners.append(PipelineRunner(
+                client_manager, input_file_path, char_count, token_budget,
+                workers=self.scheduler.slots, temperature=temperature, chunk_size=chunk_size,
+                scheduler=self.scheduler, close_client=False))
+
+    def run(self) -> None:
+        """Blocking wrapper around `arun`."""
+        asyncio.run(self.arun())
+
+    async def arun(self) -> None:
+        """
+        Processes all input files from their latest recorded positions.
+        A file that fails does not stop the others, the first error is raised at the end.
+        """
+        try:
+            results = await asyncio.gather(*(runner.arun() for runner in self.runners),
+                                           return_exceptions=True)
+        finally:
+            await self.client_manager.aclose()
+
+        for input_file_path, stats in self.scheduler.stats().items():
+            print(f"{input_file_path}: {stats['granted']} requests "
+                  f"(weight {stats['weight']}, priority {stats['priority']})")
+        for input_file_path, result in zip(self.input_file_paths, results):
+            if isinstance(result, BaseException):
+                print(f"[ERROR] {input_file_path}: {result}")
+        for result in results:
+            if isinstance(result, BaseException):
+                raise result
+
+
+if __name__ == "__main__":
+    INPUT_PATHS = [
+        r"", # <Cesty ke vstupním textovým souborům nebo složkám>
+    ]
+
+    CLIENT_MANAGER = OpenAIClientManager(API_INFO)
+    MultiFileRunner(CLIENT_MANAGER, INPUT_PATHS).run()
+    CLIENT_MANAGER.close()
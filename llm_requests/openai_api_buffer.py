@@ -1,42 +1,178 @@
 """
 This module provides a OpenAIClientManager class that manages multiple
-OpenAI API clients using a circular buffer. Clients hitting rate limits
-are temporarily removed and re-added once their cooldown expires.
+OpenAI API clients using a circular buffer. Each request goes to the ready
+key with the lowest expected latency (rolling per-key and per-provider
+latency and error statistics, see RoutingStats) among the next few ready
+keys in the rotation; ties, and keys without
+statistics yet, are taken in round-robin order. Clients hitting rate limits
+are temporarily removed and re-added once their cooldown expires
+(cooldown expiries are kept in a min-heap, so this stays cheap with
+hundreds of keys). When every key is cooling down, requests wait for the
+first one to come back instead of failing.
+
+Besides the synchronous `chat`, the manager offers `achat` and `agather`
+(and the blocking `chat_many` wrapper) built on the async OpenAI client,
+which keep several requests in flight with a per-key concurrency limit.
+
+Every key is paced by a KeyRateLimiter (configured limits plus the
+`x-ratelimit-*` response headers), so requests wait for a key with budget
+instead of running into 429 responses.
+
+All keys of one base URL share a single long-lived HTTP connection pool
+(keep-alive, HTTP/2 when the `h2` package is installed), and clients of
+benched keys are kept and resumed after the cooldown.
+
+An optional ResponseCache answers repeated requests without any API call.
+
+`chat_stream` streams the response through a StreamingDivergenceMonitor
+and cancels the generation as soon as it diverges from the input text.
+
+With a HedgePolicy, a request that is still running after its provider's
+p95 latency is also sent to a different provider; the first valid
+response wins and the other request is cancelled.
 """
 
 import time
 import re
+import heapq
+import asyncio
+import importlib.util
 from collections import deque
-from openai import OpenAI, APIStatusError, APITimeoutError, APIConnectionError #RateLimitError
+import httpx
+from openai import OpenAI, AsyncOpenAI, \
+    APIStatusError, APITimeoutError, APIConnectionError #RateLimitError
 #from pydantic
 from openai.types.chat import ChatCompletionMessageParam
 
+from rate_limits import KeyRateLimiter, retry_after_seconds
+from routing_stats import RoutingStats
+from response_cache import ResponseCache, request_hash
+from stream_alignment import StreamingDivergenceMonitor
+from text_file_extraction import estimate_tokens
+
 DEFAULT_COOLDOWN = 600
+DEFAULT_MAX_IN_FLIGHT = 8
+DEFAULT_KEY_CONCURRENCY = 1
+
+# a single request gives up after failing this many times per configured key
+MAX_ATTEMPTS_PER_KEY = 2
+
+# the tagged response repeats the input text, plus the tags
+COMPLETION_TOKENS_RATIO = 1.3
+
+HTTP_MAX_CONNECTIONS = 32
+HTTP_MAX_KEEPALIVE_CONNECTIONS = 16
+HTTP_KEEPALIVE_EXPIRY = 120
+HTTP2 = importlib.util.find_spec("h2") is not None
+
+# number of recent routing decisions kept for routing_stats()
+ROUTING_LOG_SIZE = 100
+# healthy ready keys compared per routing decision (the next ones in round-robin order),
+# so a decision does not have to score every key
+ROUTING_CANDIDATES = 8
+
+# at most this many hedges per request on average
+HEDGE_BUDGET = 0.1
+# hedge delay when the provider has no latency samples yet
+HEDGE_FALLBACK_DELAY = 20.0
+HEDGE_MIN_DELAY = 1.0
+HEDGE_CHECK_INTERVAL = 0.5
+
+_REQUEST_ERRORS = (APIStatusError, APITimeoutError, APIConnectionError, TypeError)
+
+
+class HedgePolicy:
+    # pylint: disable=too-few-public-methods
+    """
+    Opt-in hedging of slow requests.
+
+    When a request has not finished `delay` seconds after it was sent
+    (by default the p95 latency of its provider, at least `min_delay`),
+    the same request is also sent to a key of a different provider.
+    Hedges are capped at `budget` per request, so they cannot double the quota use.
+    """
+
+    def __init__(self, delay: float | None = None, budget: float = HEDGE_BUDGET,
+                 fallback_delay: float = HEDGE_FALLBACK_DELAY,
+                 min_delay: float = HEDGE_MIN_DELAY):
+        """
+        :param delay: Fixed hedge delay in seconds, None for the provider's p95 latency.
+        :param budget: Maximum ratio of hedges to requests.
+        :param fallback_delay: Delay used while the provider has no latency samples.
+        :param min_delay: Lower bound of the p95 based delay.
+        """
+        self.delay = delay
+        self.budget = budget
+        self.fallback_delay = fallback_delay
+        self.min_delay = min_delay
 
 
 class OpenAIClientManager:
     # pylint: disable=too-few-public-methods
     # pylint: disable=too-many-locals
+    # pylint: disable=too-many-instance-attributes
     """
     Manages multiple OpenAI API clients with support for different models and base URLs.
     """
 
-    def __init__(self, configs: list[dict]):
+    def __init__(self, configs: list[dict], max_in_flight: int = DEFAULT_MAX_IN_FLIGHT,
+                 key_concurrency: int = DEFAULT_KEY_CONCURRENCY,
+                 cache: ResponseCache | None = None, cache_model: str | None = None,
+                 hedge_policy: HedgePolicy | None = None):
+        # pylint: disable=too-many-arguments
+        # pylint: disable=too-many-positional-arguments
         """
         Initializes with a list of config dictionaries:
         [
             {
                 "keys": ["api_key1", "api_key2"],
                 "model": "model-name",
-                "base_url": "https://custom.endpoint/v1"
+                "base_url": "https://custom.endpoint/v1",
+                "limits": {"rpm": 30, "tpm": 6000, "rpd": 1000, "tpd": 100000}  # optional
             },
             ...
         ]
+
+        :param max_in_flight: Maximum number of concurrent async requests (achat/agather).
+        :param key_concurrency: Maximum number of concurrent async requests per API key.
+        :param cache: Response cache consulted before sending a request.
+        :param cache_model: Model name used in the cache key, defaults to all configured models.
+        :param hedge_policy: Enables hedged requests in `chat`/`achat`.
         """
-        self._clients = deque()
+        self._rotation = deque()     # api keys in round-robin order, benched ones dropped lazily
+        self._in_rotation = set()
         self._cooldown_clients = {}  # api_key -> timestamp
+        self._cooldown_heap = []     # (timestamp, api_key) min-heap of cooldown expiries
         self._key_meta = {}          # api_key -> (model, base_url)
+        self._key_index = {}         # api_key -> 1-based position in the configs
         self._all_keys = []
+        self._limiters = {}          # api_key -> KeyRateLimiter
+        self._key_stats = {}         # api_key -> RoutingStats
+        self._provider_stats = {}    # base_url -> RoutingStats
+        self._routing_log = deque(maxlen=ROUTING_LOG_SIZE)
+
+        self._sync_clients = {}      # api_key -> OpenAI, kept while benched
+        self._http_clients = {}      # base_url -> httpx.Client shared by its keys
+        self._async_clients = {}     # api_key -> AsyncOpenAI
+        self._async_http_clients = {} # base_url -> httpx.AsyncClient shared by its keys
+        self._key_in_flight = {}     # api_key -> number of running async requests
+        self._max_in_flight = max_in_flight
+        self._key_concurrency = key_concurrency
+        self._loop = None            # event loop the asyncio primitives below belong to
+        self._in_flight = None
+        self._key_released = None
+
+        self._cache = cache
+        self._cache_model = cache_model
+
+        # finish reason of the last synchronous response ("length" when it was truncated)
+        self.last_finish_reason = None
+
+        self._hedge_policy = hedge_policy
+        self._hedged_requests = 0    # requests sent through the hedging path
+        self._hedges_sent = 0
+        self._hedge_wins = 0
+        self._sync_loop = None       # event loop of hedged synchronous `chat` calls
 
         for config in configs:
             keys = config.get("keys")
@@ -46,19 +182,83 @@ class OpenAIClientManager:
             if not keys:
                 raise ValueError("Each config must contain at least one API key.")
 
+            if base_url not in self._http_clients:
+                self._http_clients[base_url] = httpx.Client(
+                    limits=self._http_limits(), http2=HTTP2)
+                self._provider_stats[base_url] = RoutingStats()
+
             for key in keys:
-                self._clients.append(OpenAI(api_key=key, base_url=base_url))
+                client = OpenAI(api_key=key, base_url=base_url,
+                                http_client=self._http_clients[base_url])
+                self._sync_clients[key] = client
+                self._rotation.append(key)
+                self._in_rotation.add(key)
                 self._key_meta[key] = (model, base_url)
+                self._limiters[key] = KeyRateLimiter(**config.get("limits", {}))
+                self._key_stats[key] = RoutingStats()
                 self._all_keys.append(key)
+                self._key_index[key] = len(self._all_keys)
+
+        if self._cache_model is None:
+            self._cache_model = "|".join(sorted({model for model, _ in self._key_meta.values()}))
+
+    @staticmethod
+    def _http_limits() -> httpx.Limits:
+        return httpx.Limits(
+            max_connections=HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=HTTP_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=HTTP_KEEPALIVE_EXPIRY
+        )
 
     def _restore_cooled_down_clients(self):
         now = time.time()
-        ready_keys = [key for key, ts in self._cooldown_clients.items() if now >= ts]
-        for key in ready_keys:
-            _, base_url = self._key_meta[key]
+        while self._cooldown_heap and self._cooldown_heap[0][0] <= now:
+            retry_at, key = heapq.heappop(self._cooldown_heap)
+            if self._cooldown_clients.get(key) != retry_at:
+                continue  # outdated entry
             print(f"[INFO] Re-adding cooled down client {key}")
-            self._clients.append(OpenAI(api_key=key, base_url=base_url))
             del self._cooldown_clients[key]
+            if key not in self._in_rotation:
+                self._rotation.append(key)
+                self._in_rotation.add(key)
+
+    def _active_count(self) -> int:
+        return len(self._all_keys) - len(self._cooldown_clients)
+
+    def _cooldown_wait(self) -> float:
+        """Seconds until the first benched key comes back (inf if no key is benched)."""
+        if not self._cooldown_heap:
+            return float("inf")
+        return max(self._cooldown_heap[0][0] - time.time(), 0.0)
+
+    def next_available_in(self, tokens: int = 0) -> float:
+        """
+        Returns how many seconds the caller has to wait until some key can send
+        a request of the given estimated size (0 if one can right away).
+
+        :param tokens: Estimated total tokens of the request.
+        """
+        self._restore_cooled_down_clients()
+        waits = [self._limiters[key].wait_time(tokens)
+                 for key in self._rotation if key not in self._cooldown_clients]
+        return min(min(waits, default=float("inf")), self._cooldown_wait())
+
+    def _bench_client(self, api_key: str, error: Exception):
+        print(error)
+        if api_key in self._cooldown_clients:
+            return  # already benched by another concurrent request
+
+        response = getattr(error, "response", None)
+        headers = getattr(response, "headers", None)
+        self._limiters[api_key].update_from_headers(headers)
+
+        cooldown_seconds = self._extract_cooldown_seconds(str(error)) \
+            or retry_after_seconds(headers) or DEFAULT_COOLDOWN
+        retry_at = time.time() + cooldown_seconds
+        self._cooldown_clients[api_key] = retry_at
+        heapq.heappush(self._cooldown_heap, (retry_at, api_key))
+        # the key itself leaves the rotation the next time it comes up in _next_ready_key
+        print(f"[WARNING] Rate limit hit for {api_key}, retry in {cooldown_seconds:.1f}s.")
 
     def _extract_cooldown_seconds(self, message):
         match = re.search(r"try again in (\d+)m([\d.]+)s", message)
@@ -68,46 +268,559 @@ class OpenAIClientManager:
             return minutes * 60 + seconds
         return None
 
+    def _estimate_request_tokens(self, messages: list[ChatCompletionMessageParam]) -> int:
+        prompt_tokens = sum(estimate_tokens(message["content"]) for message in messages)
+        completion_tokens = estimate_tokens(messages[-1]["content"]) * COMPLETION_TOKENS_RATIO
+        return int(prompt_tokens + completion_tokens)
+
+    def _routing_score(self, api_key: str) -> tuple[bool, float]:
+        """Sort key of a ready key: healthy keys first, then the lowest expected latency."""
+        stats = self._key_stats[api_key]
+        if not stats.has_samples:
+            # a new key is expected to behave like the other keys of its provider
+            stats = self._provider_stats[self._key_meta[api_key][1]]
+        return not stats.healthy, stats.expected_latency()
+
+    def _next_ready_key(self, tokens: int, check_in_flight: bool = False,
+                        exclude_base_url: str | None = None) -> tuple[str | None, float]:
+        """
+        Returns the ready key (rate limits allow a request of the given size right away)
+        with the best routing score among the first ROUTING_CANDIDATES healthy ready keys
+        in round-robin order (and the unhealthy ready keys before them), or None and
+        the shortest wait of all active keys. Keys with equal scores are taken in
+        round-robin order. Keys of `exclude_base_url` are skipped.
+        """
+        shortest_wait = float("inf")
+        candidates = []     # (score, api_key) of ready keys, taken out of the rotation
+        healthy = 0
+        for _ in range(len(self._rotation)):
+            if healthy >= ROUTING_CANDIDATES:
+                break
+            api_key = self._rotation.popleft()
+            if api_key in self._cooldown_clients:
+                self._in_rotation.discard(api_key)
+                continue
+            if exclude_base_url is not None and self._key_meta[api_key][1] == exclude_base_url:
+                self._rotation.append(api_key) # circ buffer shift
+                continue
+            if check_in_flight and self._key_in_flight.get(api_key, 0) >= self._key_concurrency:
+                self._rotation.append(api_key)
+                continue
+            wait = self._limiters[api_key].wait_time(tokens)
+            if wait > 0:
+                self._rotation.append(api_key)
+                shortest_wait = min(shortest_wait, wait)
+                continue
+            score = self._routing_score(api_key)
+            candidates.append((score, api_key))
+            healthy += not score[0]
+
+        if not candidates:
+            return None, shortest_wait
+
+        # the first of the best scores, the chosen key goes to the back of the rotation
+        best_score, best_key = min(candidates, key=lambda candidate: candidate[0])
+        for _, api_key in candidates:
+            if api_key != best_key:
+                self._rotation.append(api_key)
+        self._rotation.append(best_key)
+        self._routing_log.append({
+            "time": time.time(),
+            "key": best_key,
+            "provider": self._key_meta[best_key][1],
+            "expected_latency": best_score[1],
+            "healthy": not best_score[0],
+            "candidates": len(candidates),
+        })
+        return best_key, 0.0
+
+    def _wait_for_ready_key(self, tokens: int) -> str:
+        while True:
+            self._restore_cooled_down_clients()
+            api_key, wait = self._next_ready_key(tokens)
+            if api_key is not None:
+                self._limiters[api_key].acquire(tokens)
+                return api_key
+            wait = min(wait, self._cooldown_wait())
+            if wait == float("inf"):
+                raise RuntimeError("No API keys are configured.")
+            print(f"[INFO] No API key available (active: {self._active_count()}), "
+                  f"waiting {wait:.1f}s.")
+            time.sleep(wait)
+
+    def _record_success(self, api_key: str, started: float, completion_tokens: int | None):
+        latency = time.monotonic() - started
+        self._key_stats[api_key].record_success(latency, completion_tokens)
+        self._provider_stats[self._key_meta[api_key][1]].record_success(latency, completion_tokens)
+
+    def _record_cancelled(self, api_key: str, started: float):
+        latency = time.monotonic() - started
+        self._key_stats[api_key].record_latency(latency)
+        self._provider_stats[self._key_meta[api_key][1]].record_latency(latency)
+
+    def _record_error(self, api_key: str):
+        self._key_stats[api_key].record_error()
+        self._provider_stats[self._key_meta[api_key][1]].record_error()
+
+    def _record_response(self, api_key: str, tokens: int, raw_response, started: float):
+        response = raw_response.parse()
+        limiter = self._limiters[api_key]
+        limiter.update_from_headers(raw_response.headers)
+        usage = getattr(response, "usage", None)
+        limiter.record_usage(tokens, getattr(usage, "total_tokens", None))
+        self._record_success(api_key, started, getattr(usage, "completion_tokens", None))
+        return response
+
+    def _cache_key(self, messages: list[ChatCompletionMessageParam], temperature: float) -> str:
+        return request_hash(messages, self._cache_model, temperature)
+
+    def _cache_get(self, messages: list[ChatCompletionMessageParam],
+                   temperature: float) -> str | None:
+        if self._cache is None:
+            return None
+        return self._cache.get(self._cache_key(messages, temperature))
+
+    def _cache_put(self, messages: list[ChatCompletionMessageParam],
+                   temperature: float, content: str | None):
+        if self._cache is not None and content is not None:
+            self._cache.put(self._cache_key(messages, temperature), content)
+
+    def discard_cached(self, messages: list[ChatCompletionMessageParam], temperature: float):
+        """
+        Removes the cached response of a request, so that a rejected response
+        is not served again when the same request is re-sent.
+        """
+        if self._cache is not None:
+            self._cache.discard(self._cache_key(messages, temperature))
+
+    def cache_stats(self) -> dict | None:
+        """
+        Returns the response cache hit/miss counters, or None if no cache is used.
+        """
+        return self._cache.stats() if self._cache is not None else None
+
+    def routing_stats(self) -> dict:
+        """
+        Returns a snapshot of the routing statistics: per key (with its current
+        routing score), per provider (base URL) and the recent routing decisions.
+        """
+        keys = {}
+        for api_key, stats in self._key_stats.items():
+            unhealthy, expected_latency = self._routing_score(api_key)
+            keys[api_key] = {
+                **stats.snapshot(),
+                "provider": self._key_meta[api_key][1],
+                "benched": api_key in self._cooldown_clients,
+                "routing_healthy": not unhealthy,
+                "routing_expected_latency": expected_latency,
+            }
+        return {
+            "keys": keys,
+            "providers": {base_url: stats.snapshot()
+                          for base_url, stats in self._provider_stats.items()},
+            "decisions": list(self._routing_log),
+            "hedging": {
+                "requests": self._hedged_requests,
+                "hedges": self._hedges_sent,
+                "hedge_wins": self._hedge_wins,
+            },
+        }
+
+    def token_headroom(self) -> float | None:
+        """
+        Returns the unused share (0-1) of the per-minute token limits of the active keys,
+        or None if no key has a configured token limit.
+        """
+        limit = used = 0
+        for api_key, limiter in self._limiters.items():
+            if limiter.tpm and api_key not in self._cooldown_clients:
+                limit += limiter.tpm
+                used += limiter.stats()["tokens_last_minute"]
+        if not limit:
+            return None
+        return max(1.0 - used / limit, 0.0)
+
+    def rate_limit_stats(self) -> dict[str, dict]:
+        """
+        Returns the rate limit utilisation of every API key (see KeyRateLimiter.stats).
+        """
+        return {api_key: limiter.stats() for api_key, limiter in self._limiters.items()}
+
     def chat(self, messages: list[ChatCompletionMessageParam], temperature: float) -> str:
         """
         Sends a chat request using the OpenAI API, rotating through clients.
         Automatically uses the corresponding model and base_url for each API key.
+        Waits for a key with enough rate limit budget if all active keys are exhausted,
+        and for the first key to cool down if all of them are benched.
+        Cached responses are returned without sending a request.
+        With a hedge policy, the request is sent through `achat` on a private event loop.
         """
-        self._restore_cooled_down_clients()
+        cached = self._cache_get(messages, temperature)
+        if cached is not None:
+            self.last_finish_reason = None
+            return cached
+
+        if self._hedge_policy is not None:
+            if self._sync_loop is None:
+                self._sync_loop = asyncio.new_event_loop()
+            route = {}
+            content = self._sync_loop.run_until_complete(self.achat(messages, temperature, route))
+            self.last_finish_reason = route.get("finish_reason")
+            return content
 
         total_clients = len(self._all_keys)                # all known API keys (active + cooldown)
-        active_clients = len(self._clients)                # not currently on cooldown
-        attempts = active_clients
+        attempts = total_clients * MAX_ATTEMPTS_PER_KEY
+        tokens = self._estimate_request_tokens(messages)
 
         for _ in range(attempts):
-            client = self._clients[0]
-            api_key = client.api_key
+            api_key = self._wait_for_ready_key(tokens)
+            client = self._sync_clients[api_key]
             model, base_url = self._key_meta[api_key]
-            index = self._all_keys.index(api_key) + 1
+            index = self._key_index[api_key]
+            active_clients = self._active_count()              # not currently on cooldown
 
             #temp
 
             print(f"Used client {index}/{total_clients} (active: {active_clients}): {base_url}")
 
+            started = time.monotonic()
             try:
-                response = client.chat.completions.create(
+                raw_response = client.chat.completions.with_raw_response.create(
                     messages=messages,
                     model=model,
                     temperature=temperature
                 )
-                returncontent = response.choices[0].message.content
-                self._clients.rotate(-1) # circ buffer shift
-                return returncontent
-
-            except (APIStatusError, APITimeoutError, APIConnectionError, TypeError) as e:
-                print(e)
-                message = str(e)
-                cooldown_seconds = self._extract_cooldown_seconds(message) or DEFAULT_COOLDOWN
-                retry_at = time.time() + cooldown_seconds
-
-                self._cooldown_clients[api_key] = retry_at
-                self._clients.popleft()
-                print(f"[WARNING] Rate limit hit for {api_key}, retry in {cooldown_seconds:.1f}s.")
+                response = self._record_response(api_key, tokens, raw_response, started)
+                content = response.choices[0].message.content
+                self.last_finish_reason = getattr(response.choices[0], "finish_reason", None)
+                self._cache_put(messages, temperature, content)
+                return content
+
+            except _REQUEST_ERRORS as e:
+                self._record_error(api_key)
+                self._bench_client(api_key, e)
                 continue
 
-        raise RuntimeError("All API keys are currently rate-limited.")
+        raise RuntimeError(f"Request failed {attempts} times, giving up.")
+
+    def _read_stream(self, api_key: str, tokens: int, raw_response,
+                     monitor: StreamingDivergenceMonitor, started: float) -> str:
+        limiter = self._limiters[api_key]
+        limiter.update_from_headers(raw_response.headers)
+        stream = raw_response.parse()
+        self.last_finish_reason = None
+        used_tokens = completion_tokens = None
+        try:
+            for chunk in stream:
+                usage = getattr(chunk, "usage", None)
+                if usage is not None:
+                    used_tokens = usage.total_tokens
+                    completion_tokens = usage.completion_tokens
+                if not chunk.choices:
+                    continue
+                self.last_finish_reason = getattr(chunk.choices[0], "finish_reason", None) \
+                    or self.last_finish_reason
+                delta = chunk.choices[0].delta.content
+                if delta and monitor.feed(delta):
+                    break
+        finally:
+            # closing the response before the end cancels the generation
+            stream.close()
+        limiter.record_usage(tokens, used_tokens)
+        content = monitor.finish()
+        if monitor.diverged:
+            # a cancelled generation is not a completed request of the key
+            self._record_cancelled(api_key, started)
+        else:
+            self._record_success(api_key, started, completion_tokens)
+        return content
+
+    def chat_stream(self, messages: list[ChatCompletionMessageParam], temperature: float,
+                    added_tol: int, removed_tol: int) -> tuple[str, bool]:
+        """
+        Streaming variant of `chat`. The response is aligned against the input text
+        (the last message) while it arrives, and the request is cancelled as soon as
+        more than `added_tol` words were added or `removed_tol` words removed.
+        Reasoning `<think>` blocks are dropped from the returned text.
+
+        :return: The response text (partial if cancelled) and whether it diverged.
+        """
+        cached = self._cache_get(messages, temperature)
+        if cached is not None:
+            self.last_finish_reason = None
+            return cached, False
+
+        total_clients = len(self._all_keys)
+        attempts = total_clients * MAX_ATTEMPTS_PER_KEY
+        tokens = self._estimate_request_tokens(messages)
+
+        for _ in range(attempts):
+            api_key = self._wait_for_ready_key(tokens)
+            client = self._sync_clients[api_key]
+            model, base_url = self._key_meta[api_key]
+            index = self._key_index[api_key]
+
+            print(f"Used client {index}/{total_clients} "
+                  f"(active: {self._active_count()}, stream): {base_url}")
+
+            monitor = StreamingDivergenceMonitor(messages[-1]["content"], added_tol, removed_tol)
+            started = time.monotonic()
+            try:
+                raw_response = client.chat.completions.with_raw_response.create(
+                    messages=messages,
+                    model=model,
+                    temperature=temperature,
+                    stream=True,
+                    # the last chunk carries the usage (not sent for a cancelled generation)
+                    stream_options={"include_usage": True}
+                )
+                content = self._read_stream(api_key, tokens, raw_response, monitor, started)
+
+            except _REQUEST_ERRORS as e:
+                self._record_error(api_key)
+                self._bench_client(api_key, e)
+                continue
+
+            if monitor.diverged:
+                print(f"[INFO] Response diverged (added: {monitor.added}, "
+                      f"removed: {monitor.removed}), generation cancelled.")
+            else:
+                self._cache_put(messages, temperature, content)
+            return content, monitor.diverged
+
+        raise RuntimeError(f"Request failed {attempts} times, giving up.")
+
+    async def _acquire_key(self, tokens: int, exclude_base_url: str | None = None) -> str:
+        async with self._key_released:
+            while True:
+                self._restore_cooled_down_clients()
+                api_key, wait = self._next_ready_key(tokens, check_in_flight=True,
+                                                     exclude_base_url=exclude_base_url)
+                if api_key is not None:
+                    self._limiters[api_key].acquire(tokens)
+                    self._key_in_flight[api_key] = self._key_in_flight.get(api_key, 0) + 1
+                    return api_key
+                if not self._all_keys:
+                    raise RuntimeError("No API keys are configured.")
+                wait = min(wait, self._cooldown_wait())
+                try:
+                    # woken up early when another request releases its key
+                    await asyncio.wait_for(self._key_released.wait(),
+                                           None if wait == float("inf") else wait)
+                except asyncio.TimeoutError:
+                    pass
+
+    async def _release_key(self, api_key: str):
+        async with self._key_released:
+            self._key_in_flight[api_key] -= 1
+            self._key_released.notify_all()
+
+    def _get_async_client(self, api_key: str) -> AsyncOpenAI:
+        client = self._async_clients.get(api_key)
+        if client is None:
+            _, base_url = self._key_meta[api_key]
+            if base_url not in self._async_http_clients:
+                self._async_http_clients[base_url] = httpx.AsyncClient(
+                    limits=self._http_limits(), http2=HTTP2)
+            client = AsyncOpenAI(api_key=api_key, base_url=base_url,
+                                 http_client=self._async_http_clients[base_url])
+            self._async_clients[api_key] = client
+        return client
+
+    async def _close_async_http_clients(self):
+        for http_client in self._async_http_clients.values():
+            await http_client.aclose()
+        self._async_http_clients.clear()
+        self._async_clients.clear()
+
+    async def aclose(self):
+        """
+        Closes the HTTP connection pools of the async clients (call from the running event loop).
+        """
+        await self._close_async_http_clients()
+
+    def close(self):
+        """
+        Closes the shared HTTP connection pools of the synchronous clients
+        (and the event loop of hedged synchronous requests).
+        """
+        for http_client in self._http_clients.values():
+            http_client.close()
+        if self._sync_loop is not None:
+            self._sync_loop.run_until_complete(self._close_async_http_clients())
+            self._sync_loop.close()
+            self._sync_loop = None
+
+    async def achat(self, messages: list[ChatCompletionMessageParam], temperature: float,
+                    route: dict | None = None) -> str:
+        """
+        Async counterpart of `chat`. Waits for a free in-flight slot and a key
+        below its concurrency limit, rotating through keys and benching the failing ones.
+        Slow requests are hedged when a hedge policy is set.
+
+        :param route: Filled with the "base_url" and "finish_reason" of the request
+                      that answered ("length" when it was truncated; the shared
+                      `last_finish_reason` is only set by the synchronous methods).
+        """
+        route = {} if route is None else route
+        cached = self._cache_get(messages, temperature)
+        if cached is not None:
+            route["finish_reason"] = None
+            return cached
+
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # async connection pools are bound to the event loop that opened them
+            self._async_http_clients.clear()
+            self._async_clients.clear()
+            self._loop = loop
+            self._in_flight = asyncio.Semaphore(self._max_in_flight)
+            self._key_released = asyncio.Condition()
+
+        tokens = self._estimate_request_tokens(messages)
+
+        if self._hedge_policy is None:
+            content = await self._achat_attempts(messages, temperature, tokens, route)
+        else:
+            content = await self._achat_hedged(messages, temperature, tokens, route)
+        self._cache_put(messages, temperature, content)
+        return content
+
+    async def _achat_attempts(self, messages: list[ChatCompletionMessageParam],
+                              temperature: float, tokens: int, route: dict | None = None,
+                              exclude_base_url: str | None = None) -> str:
+        # pylint: disable=too-many-arguments
+        """
+        Sends the request, retrying on other keys. The base URL and send time
+        of the current attempt, and the finish reason of the response, are stored in `route`.
+        """
+        attempts = len(self._all_keys) * MAX_ATTEMPTS_PER_KEY
+        route = {} if route is None else route
+
+        async with self._in_flight:
+            for _ in range(attempts):
+                api_key = await self._acquire_key(tokens, exclude_base_url)
+                model, base_url = self._key_meta[api_key]
+                index = self._key_index[api_key]
+
+                print(f"Used client {index}/{len(self._all_keys)} "
+                      f"(active: {self._active_count()}, async): {base_url}")
+
+                started = time.monotonic()
+                route["base_url"] = base_url
+                route["sent_at"] = started
+                try:
+                    client = self._get_async_client(api_key)
+                    raw_response = await client.chat.completions.with_raw_response.create(
+                        messages=messages,
+                        model=model,
+                        temperature=temperature
+                    )
+                    response = self._record_response(api_key, tokens, raw_response, started)
+                    route["finish_reason"] = getattr(response.choices[0], "finish_reason", None)
+                    return response.choices[0].message.content
+
+                except _REQUEST_ERRORS as e:
+                    self._record_error(api_key)
+                    self._bench_client(api_key, e)
+                    continue
+
+                except asyncio.CancelledError:
+                    # lost the race against a hedge, the key was at least this slow
+                    self._record_cancelled(api_key, started)
+                    raise
+
+                finally:
+                    await self._release_key(api_key)
+
+        raise RuntimeError(f"Request failed {attempts} times, giving up.")
+
+    def _hedge_delay(self, base_url: str) -> float:
+        policy = self._hedge_policy
+        if policy.delay is not None:
+            return policy.delay
+        p95 = self._provider_stats[base_url].p95()
+        if p95 is None:
+            return policy.fallback_delay
+        return max(p95, policy.min_delay)
+
+    def _can_hedge(self, base_url: str) -> bool:
+        """True if the hedge budget allows one more hedge and another provider has an active key."""
+        if self._hedges_sent + 1 > self._hedge_policy.budget * self._hedged_requests:
+            return False
+        return any(self._key_meta[key][1] != base_url and key not in self._cooldown_clients
+                   for key in self._all_keys)
+
+    async def _achat_hedged(self, messages: list[ChatCompletionMessageParam],
+                            temperature: float, tokens: int, route: dict) -> str:
+        self._hedged_requests += 1
+        primary = asyncio.create_task(self._achat_attempts(messages, temperature, tokens, route))
+        tasks = [primary]
+
+        try:
+            # wait until the primary request has run for the hedge delay of its provider
+            while not primary.done():
+                timeout = HEDGE_CHECK_INTERVAL
+                if "sent_at" in route:
+                    remaining = route["sent_at"] + self._hedge_delay(route["base_url"]) \
+                        - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    timeout = min(timeout, remaining)
+                await asyncio.wait({primary}, timeout=timeout)
+
+            if primary.done() or not self._can_hedge(route["base_url"]):
+                return await primary
+
+            print(f"[INFO] Hedging slow request to {route['base_url']}.")
+            self._hedges_sent += 1
+            hedge_route = {}
+            hedge = asyncio.create_task(self._achat_attempts(
+                messages, temperature, tokens, hedge_route, exclude_base_url=route["base_url"]))
+            tasks.append(hedge)
+
+            pending = {primary, hedge}
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None and task.result():
+                        if task is hedge:
+                            self._hedge_wins += 1
+                            route.update(hedge_route)
+                        return task.result()
+
+            # neither request returned a valid response
+            return primary.result()
+
+        finally:
+            # the loser, or every request when this one was cancelled, gives back its key
+            unfinished = [task for task in tasks if not task.done()]
+            for task in unfinished:
+                task.cancel()
+            if unfinished:
+                await asyncio.gather(*unfinished, return_exceptions=True)
+
+    async def agather(self, messages_list: list[list[ChatCompletionMessageParam]],
+                      temperature: float) -> list[str | Exception]:
+        """
+        Sends all chat requests concurrently (up to max_in_flight at a time).
+        Results are returned in the order of `messages_list`; a request that failed
+        on every key is returned as its exception.
+        """
+        return await asyncio.gather(
+            *(self.achat(messages, temperature) for messages in messages_list),
+            return_exceptions=True
+        )
+
+    def chat_many(self, messages_list: list[list[ChatCompletionMessageParam]],
+                  temperature: float) -> list[str | Exception]:
+        """
+        Blocking wrapper around `agather` for synchronous callers.
+        """
+        async def gather_and_close():
+            try:
+                return await self.agather(messages_list, temperature)
+            finally:
+                await self._close_async_http_clients()
+
+        return asyncio.run(gather_and_close())
@@ -0,0 +1,109 @@
+"""
+Tests of the hedged requests of OpenAIClientManager.
+
+Run from the llm_requests folder:
+    python -m pytest openai_api_buffer_test.py
+"""
+
+import asyncio
+import types
+
+import pytest
+
+from openai_api_buffer import OpenAIClientManager, HedgePolicy
+
+MESSAGES = [{"role": "user", "content": "Ahoj světe"}]
+BASE_URLS = {"model-a": "https://a.example/v1", "model-b": "https://b.example/v1"}
+
+
+class FakeAsyncClient:
+    # pylint: disable=too-few-public-methods
+    """Async client answering after the delay of its call (in the order of the calls)."""
+
+    def __init__(self, delays: list[float], calls: list[dict]):
+        self._delays = delays
+        self._calls = calls
+        self.chat = types.SimpleNamespace(completions=types.SimpleNamespace(
+            with_raw_response=types.SimpleNamespace(create=self._create)))
+
+    async def _create(self, **kwargs):
+        call = {"model": kwargs["model"], "cancelled": False}
+        self._calls.append(call)
+        try:
+            await asyncio.sleep(self._delays[len(self._calls) - 1])
+        except asyncio.CancelledError:
+            call["cancelled"] = True
+            raise
+        response = types.SimpleNamespace(
+            choices=[types.SimpleNamespace(finish_reason="stop",
+                                           message=types.SimpleNamespace(content=call["model"]))],
+            usage=types.SimpleNamespace(total_tokens=10, completion_tokens=5))
+        return types.SimpleNamespace(headers={}, parse=lambda: response)
+
+
+@pytest.fixture(name="hedged_manager")
+def fixture_hedged_manager(monkeypatch):
+    """Returns a function creating a hedging manager of two providers with fake clients."""
+    def create(delays: list[float]) -> tuple[OpenAIClientManager, list[dict]]:
+        manager = OpenAIClientManager(
+            [{"keys": [f"key-{model}"], "model": model, "base_url": base_url}
+             for model, base_url in BASE_URLS.items()],
+            hedge_policy=HedgePolicy(delay=0.05, budget=1.0))
+        calls = []
+        client = FakeAsyncClient(delays, calls)
+        monkeypatch.setattr(manager, "_get_async_client", lambda api_key: client)
+        return manager, calls
+    return create
+
+
+def assert_no_leftovers(manager: OpenAIClientManager):
+    """No request task is left running and every key was given back."""
+    assert [task for task in asyncio.all_tasks() if task is not asyncio.current_task()] == []
+    assert set(manager._key_in_flight.values()) == {0}  # pylint: disable=protected-access
+
+
+def test_hedge_wins_and_the_primary_is_cancelled(hedged_manager):
+    """A slow request is hedged to the other provider, the loser is cancelled."""
+    manager, calls = hedged_manager([5.0, 0.01])
+
+    async def run():
+        route = {}
+        content = await manager.achat(MESSAGES, 0.0, route)
+        assert_no_leftovers(manager)
+        return content, route
+
+    content, route = asyncio.run(run())
+    assert [call["cancelled"] for call in calls] == [True, False]
+    assert content == calls[1]["model"]
+    assert route["base_url"] == BASE_URLS[content]
+    assert manager.routing_stats()["hedging"] == {"requests": 1, "hedges": 1, "hedge_wins": 1}
+    manager.close()
+
+
+def test_fast_request_is_not_hedged(hedged_manager):
+    """A request answered within the hedge delay is sent once."""
+    manager, calls = hedged_manager([0.0])
+    assert asyncio.run(manager.achat(MESSAGES, 0.0)) == calls[0]["model"]
+    assert len(calls) == 1
+    assert manager.routing_stats()["hedging"] == {"requests": 1, "hedges": 0, "hedge_wins": 0}
+    manager.close()
+
+
+def test_cancelled_request_cancels_its_hedge(hedged_manager):
+    """Cancelling a hedged request cancels both requests and releases their keys."""
+    manager, calls = hedged_manager([5.0, 5.0])
+
+    async def run():
+        task = asyncio.create_task(manager.achat(MESSAGES, 0.0))
+        while len(calls) < 2:
+            await asyncio.sleep(0.01)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        assert_no_leftovers(manager)
+
+    asyncio.run(run())
+    assert [call["cancelled"] for call in calls] == [True, True]
+    stats = manager.routing_stats()["keys"]
+    assert all(key_stats["requests"] == 0 for key_stats in stats.values())
+    manager.close()
@@ -4,14 +4,20 @@ import os
 import json
 import re
 
-from constants import TAGS, TEXT_CHUNK_WORD_OVERLAP_TOL, OMITTED_TAGS, \
-    OUTPUT_LOGS_FOLDER, LOGS_CATEGORY_WORDS, LOGS_LATEST_POS, LOGS_CHANGES, MAIN_OUTPUT
+from category_rules import filter_section
+from section_array import SectionArray, NEW_SPECIAL_PATTERN, LAST_SPECIAL_PATTERN
+
+from constants import TEXT_CHUNK_WORD_OVERLAP_TOL, \
+    OUTPUT_LOGS_FOLDER, LOGS_CATEGORY_WORDS, LOGS_LATEST_POS, LOGS_CHANGES, MAIN_OUTPUT, \
+    MAIN_OUTPUT_LOG, LOGS_QUARANTINE
     # OUTPUT_PROCESSED_TEMP_FILE, INPUT_TEXT_TEMP_FILE, \
 
+# text file tell() cookies (latest positions of the former text-mode reader)
+_TELL_COOKIE_OFFSET_MASK = (1 << 64) - 1
+_TELL_COOKIE_PENDING_CR = 1
 
 
 def parse_tagged_text(text):
-    # pylint: disable=too-many-locals
     """
     Parses a text string looking for specific tagged sections.
 
@@ -37,52 +43,18 @@ def parse_tagged_text(text):
     :param text: The input text string containing tagged sections.
     :return: A list of dictionaries separating words by category.
     """
-    tag_pattern = re.compile(r'<(/?)(\w+)>')
-
-    result = []
-    current_words = []
-    current_category = None
-    tag_stack = []
-
-    pos = 0
-    while pos < len(text):
-        match = tag_pattern.search(text, pos)
-        if not match:
-            break
-
-        start, end = match.span()
-        tag_is_closing, tag_name = match.groups()
-
-        pre_tag_text = text[pos:start].strip()
-        pre_words = pre_tag_text.split(" ") if pre_tag_text else []
-        if pre_words:
-            current_words.extend(pre_words)
-
-        if tag_is_closing:
-            if tag_stack and tag_stack[-1] == tag_name:
-                tag_stack.pop()
-                if not tag_stack:
-                    result.append({"words": current_words, "category": current_category})
-                    current_words = []
-                    current_category = None
-        else:
-            if tag_name in TAGS.values() and not tag_stack:
-                if current_words:
-                    result.append({"words": current_words, "category": current_category})
-                    current_words = []
-                current_category = tag_name
-                tag_stack.append(tag_name)
+    return [{"words": words, "category": category}
+            for category, words in SectionArray.from_tagged_text(text)]
 
-        pos = end
 
-    post_text = text[pos:].strip()
-    post_words = post_text.split(" ") if post_text else []
-    if post_words:
-        current_words.extend(post_words)
-    if current_words:
-        result.append({"words": current_words, "category": current_category})
+def remove_reasoning(text: str) -> str:
+    """
+    Removes <think>...</think> blocks produced by reasoning models.
 
-    return result
+    :param text: Raw LLM response.
+    :return: Response without the reasoning blocks.
+    """
+    return re.sub(r'<think>.*?</think>', '', text, flags=re.DOTALL)
 
 
 def object_to_json(python_object):
@@ -122,10 +94,8 @@ def reconstruct_text(processed_data):
             continue
         first_word = entry["words"][0]
         prev_last_word = reconstructed_text[-1]
-        is_new_special = \
-                bool(re.match(r"^[,.!?;:\"'\)\]\}»…\\/]+$", first_word))
-        is_last_special = \
-            bool(re.match(r"^[\"'\(\[\{\\/]+$", prev_last_word))
+        is_new_special = NEW_SPECIAL_PATTERN.match(first_word) is not None
+        is_last_special = LAST_SPECIAL_PATTERN.match(prev_last_word) is not None
         if prev_category != entry["category"] and is_new_special ^ is_last_special:
             reconstructed_text[-1] += first_word
         else:
@@ -142,58 +112,108 @@ def reconstruct_text(processed_data):
 
 def append_json_string_to_file(json_data: str, input_file_path: str):
     """
-    Appends a JSON string (representing an array) to an existing JSON file as a string.
-    - If the file is empty or does not exist, it initializes it with the given JSON array.
-    - If the file contains a JSON array,
-      it appends the new JSON objects while preserving valid JSON format.
-    - If the last object in the file and the first object in json_data have `category: null`,
-      they are merged.
+    Appends a JSON string (representing an array) to the append-only output log
+    `{OUTPUT_LOGS_FOLDER}/name_of_input_file/{MAIN_OUTPUT_LOG}` as one line,
+    so the cost of a chunk does not grow with the output.
+    - An older `{MAIN_OUTPUT}` JSON array is taken over first (see `ensure_output_log`).
+    - Null-category sections at the seams of the lines are merged when the log is read
+      (see `read_output_log` and `export_main_output`).
 
     :param json_data: A JSON string representing an array of objects.
     :param input_file_path: The path to the input file.
     """
-    folder_name = os.path.basename(input_file_path)
-    file_path = os.path.join(OUTPUT_LOGS_FOLDER, folder_name, MAIN_OUTPUT)
+    new_objects = json_to_object(json_data)
+    if not isinstance(new_objects, list):
+        raise ValueError("Input json_data must be a JSON array.")
 
-    if os.path.exists(file_path) and os.path.getsize(file_path) > 0:
-        with open(file_path, "r+", encoding="utf-8") as file:
-            file.seek(0, os.SEEK_END)
+    with open(ensure_output_log(input_file_path), "a", encoding="utf-8") as file:
+        file.write(json.dumps(new_objects, ensure_ascii=False) + "\n")
 
-            # Read last JSON array safely
-            file.seek(0)
-            existing_json_str = file.read().strip()
-            if not existing_json_str.endswith("]"):
-                raise ValueError("File content is not a valid JSON array.")
 
-            # Parse existing JSON data
-            existing_json = json_to_object(existing_json_str)
+def ensure_output_log(input_file_path: str) -> str:
+    """
+    Returns the path of the output log of an input file. If the log does not exist
+    but an older `{MAIN_OUTPUT}` JSON array does, the array becomes the first line of the log.
+
+    :param input_file_path: The path to the input file.
+    :return: Path to `{OUTPUT_LOGS_FOLDER}/name_of_input_file/{MAIN_OUTPUT_LOG}`.
+    """
+    folder_path = os.path.join(OUTPUT_LOGS_FOLDER, os.path.basename(input_file_path))
+    log_path = os.path.join(folder_path, MAIN_OUTPUT_LOG)
+
+    if not os.path.exists(log_path):
+        output_path = os.path.join(folder_path, MAIN_OUTPUT)
+        if os.path.exists(output_path) and os.path.getsize(output_path) > 0:
+            with open(output_path, "r", encoding="utf-8") as file:
+                existing_json = json_to_object(file.read())
             if not isinstance(existing_json, list):
                 raise ValueError("File content is not a valid JSON array.")
+            with open(log_path, "w", encoding="utf-8") as file:
+                file.write(json.dumps(existing_json, ensure_ascii=False) + "\n")
+    return log_path
 
-            # Extract last object from existing JSON
-            last_object = existing_json[-1] if existing_json else None
 
-            # Extract first object from new JSON data
-            new_objects = json_to_object(json_data)
-            if not isinstance(new_objects, list):
-                raise ValueError("Input json_data must be a JSON array.")
-            first_object = new_objects[0] if new_objects else None
+def read_output_log(input_file_path: str):
+    """
+    Reads the output log of an input file section by section, merging a null-category
+    section at the end of a chunk with a null-category section starting the next one.
 
-            # Check if merging is possible
-            if last_object and first_object and last_object.get("category") is None \
-            and first_object.get("category") is None:
-                last_object["words"].extend(first_object["words"])
-                new_objects.pop(0)  # Remove first object since it's merged
+    :param input_file_path: The path to the input file.
+    :return: Generator of the sections (dicts with "words" and "category").
+    """
+    log_path = os.path.join(OUTPUT_LOGS_FOLDER, os.path.basename(input_file_path),
+                            MAIN_OUTPUT_LOG)
+    if not os.path.exists(log_path):
+        return
 
-            # Write updated JSON back
-            file.seek(0)
-            file.write(object_to_json(existing_json[:-1] + [last_object] + new_objects))
-            file.truncate()
+    last_object = None
+    with open(log_path, "r", encoding="utf-8") as file:
+        for line in file:
+            if not line.strip():
+                continue
+            new_objects = json_to_object(line)
+            if not new_objects:
+                continue
+            if last_object is not None:
+                if last_object.get("category") is None \
+                and new_objects[0].get("category") is None:
+                    last_object["words"].extend(new_objects.pop(0)["words"])
+                    if not new_objects:
+                        continue
+                yield last_object
+            yield from new_objects[:-1]
+            last_object = new_objects[-1]
+
+    if last_object is not None:
+        yield last_object
+
+
+def export_main_output(input_file_path: str, output_path: str | None = None) -> int:
+    """
+    Writes the output log as a single JSON array (formatted like `object_to_json`),
+    by default to `{OUTPUT_LOGS_FOLDER}/name_of_input_file/{MAIN_OUTPUT}`, which is
+    the file read by the validation scripts. The sections are written one at a time
+    and the file is replaced only when complete.
 
-    else:
-        # Create new file if empty or missing
-        with open(file_path, "w", encoding="utf-8") as file:
-            file.write(json_data)
+    :param input_file_path: The path to the input file.
+    :param output_path: Path of the JSON file to write.
+    :return: Number of sections written.
+    """
+    if output_path is None:
+        output_path = os.path.join(OUTPUT_LOGS_FOLDER, os.path.basename(input_file_path),
+                                   MAIN_OUTPUT)
+    temp_path = output_path + ".tmp"
+
+    count = 0
+    with open(temp_path, "w", encoding="utf-8") as file:
+        for section in read_output_log(input_file_path):
+            # the same layout as json.dumps(list, indent=2), written section by section
+            section_json = object_to_json(section).replace("\n", "\n  ")
+            file.write(("[\n  " if count == 0 else ",\n  ") + section_json)
+            count += 1
+        file.write("\n]" if count else "[]")
+    os.replace(temp_path, output_path)
+    return count
 
 
 
@@ -271,10 +291,13 @@ def get_latest_position(input_file_path: str) -> int:
 
     - If the folder does not exist, it creates it.
     - If the latest position file exists, it reads the first line and converts it to an integer.
+      A position written by the former text-mode reader is converted to a byte offset
+      (see `_position_from_tell_cookie`).
     - If the file does not exist, it returns 0.
 
     :param input_file_path: Path to the input file.
     :return: The last recorded position as an integer, or 0 if not found.
+    :raises ValueError: If the position is past the end of the input file and can not be converted.
     """
     folder_name = os.path.basename(input_file_path)
     log_folder_path = os.path.join(OUTPUT_LOGS_FOLDER, folder_name)
@@ -286,10 +309,42 @@ def get_latest_position(input_file_path: str) -> int:
     if os.path.exists(latest_pos_file):
         with open(latest_pos_file, "r", encoding="utf-8") as file:
             first_line = file.readline().strip()
-            return int(first_line) if first_line.isdigit() else 0
+        if first_line.isdigit():
+            return _position_from_tell_cookie(input_file_path, int(first_line))
     return 0
 
 
+def _position_from_tell_cookie(input_file_path: str, position: int) -> int:
+    """
+    Converts a latest position written by the former text-mode reader to a byte offset.
+
+    The former reader recorded `tell()` cookies of a text file: the byte offset is in the low
+    64 bits and the decoder state above them. For LF line ends the state is always zero and
+    the cookie is the byte offset itself. After a word followed by CRLF the newline decoder
+    may hold a pending "\r"; the cookie then points past that "\r", while the word end
+    position of the byte-offset reader is right before it.
+
+    :param input_file_path: Path to the input file.
+    :param position: The recorded position.
+    :return: The byte offset.
+    :raises ValueError: If the position is past the end of the file and is not such a cookie.
+    """
+    if not os.path.isfile(input_file_path):
+        return position     # e.g. the output path of a shard
+    file_size = os.path.getsize(input_file_path)
+    if position <= file_size:
+        return position
+
+    offset, decoder_state = position & _TELL_COOKIE_OFFSET_MASK, position >> 64
+    if decoder_state == _TELL_COOKIE_PENDING_CR and 0 < offset <= file_size:
+        with open(input_file_path, "rb") as file:
+            file.seek(offset - 1)
+            if file.read(1) == b"\r":
+                return offset - 1
+    raise ValueError(f"The latest position {position} of {input_file_path} is past the end "
+                     f"of the file ({file_size} bytes). Remove or correct the position file.")
+
+
 def write_tagged_sections_to_files(parsed_data, input_file_path: str):
     """
     Writes each section with a category (not None) into separate text files 
@@ -330,6 +385,20 @@ def append_to_changes_log(input_file_path: str, log_entry: str):
     with open(log_file_path, "a", encoding="utf-8") as file:
         file.write(log_entry + "\n")
 
+def append_to_quarantine_log(input_file_path: str, log_entry: str):
+    """
+    Appends a quarantined span (position and text of a chunk the model keeps mangling)
+    to `{OUTPUT_LOGS_FOLDER}/name_of_input_file/{LOGS_QUARANTINE}`.
+
+    :param input_file_path: The path to the input file.
+    :param log_entry: The string to append to the log file.
+    """
+    folder_name = os.path.basename(input_file_path)
+    log_file_path = os.path.join(OUTPUT_LOGS_FOLDER, folder_name, LOGS_QUARANTINE)
+
+    with open(log_file_path, "a", encoding="utf-8") as file:
+        file.write(log_entry + "\n")
+
 def write_latest_position(input_file_path: str, position: int) -> None:
     """
     Writes the given position number to the latest position tracking file.
@@ -351,14 +420,9 @@ def write_latest_position(input_file_path: str, position: int) -> None:
 
 # additional filtering
 def filter_categories(processed_data: list[dict]) -> None:
-    # pylint: disable=line-too-long
-    # pylint: disable=too-many-locals
-    # pylint: disable=too-many-branches
-    # pylint: disable=too-many-statements
     """
-    Modifies the input list of dictionaries by applying various category filtering rules.
-    Each category's "category" field is set to None based on specific conditions.
-    The modified list is rebuilt using a buffer and replaced in-place.
+    Modifies the input list of dictionaries by applying the category filtering rules
+    (see `filter_section`). The modified list is rebuilt using a buffer and replaced in-place.
     """
     if not processed_data:
         return
@@ -366,195 +430,8 @@ def filter_categories(processed_data: list[dict]) -> None:
     filtered = []
 
     for obj in processed_data:
-        category = obj.get("category")
-        words = obj.get("words", [])
-
-        # Default to keeping the category
-        keep_category = True
-
-        if category in OMITTED_TAGS:
-            keep_category = False
-
-        elif category == TAGS["CASE_NUMBER"]:
-            has_two_digits = any(re.search(r'\d{2,}', word) for word in words)
-            has_slash = any('/' in word for word in words)
-
-            if not (has_two_digits and has_slash):
-                keep_category = False
-            else:
-                # Check for specific keywords that trigger a split
-                special_keywords = {"čj.", "j.", "zn.", "č.j.", "sp.zn.", "zn", "čj", ".", "j.:", "zn.:", "značka:", "číslo:", "jednací:", "spisu:", "značkou"}
-                split_index = None
-
-                for i, word in enumerate(words):
-                    if word.lower() in special_keywords:
-                        split_index = i
-                        break
-
-                if split_index is not None:
-                    # First part goes into a null category
-                    null_part = {
-                        "category": None,
-                        "words": words[:split_index + 1]
-                    }
-                    # Remaining part stays as CASE_NUMBER
-                    remaining_part = {
-                        "category": category,
-                        "words": words[split_index + 1:]
-                    }
-
-                    # Add both parts and skip normal append
-                    filtered.append(null_part)
-                    if remaining_part["words"]:  # Avoid empty word lists
-                        filtered.append(remaining_part)
-                    continue  # Skip normal append outside
-
-
-        elif category == TAGS["ZIPCODE"]:
-            zip_index = None
-
-            for i in range(len(words) - 1):
-                if words[i].isdigit() and len(words[i]) == 3 and \
-                words[i + 1].isdigit() and len(words[i + 1]) == 2:
-                    zip_index = i
-                    break
-
-            if zip_index is None:
-                keep_category = False
-            else:
-                # Split into parts: before, zipcode, after
-                before = words[:zip_index]
-                zipcode = words[zip_index:zip_index + 2]
-                after = words[zip_index + 2:]
-
-                if before:
-                    filtered.append({"category": None, "words": before})
-                filtered.append({"category": category, "words": zipcode})
-                if after:
-                    filtered.append({"category": None, "words": after})
-                continue  # Skip normal append outside
-
-
-        elif category == TAGS["EMAIL"]:
-            at_index = next((i for i, word in enumerate(words) if "@" in word), None)
-
-            if at_index is None:
-                keep_category = False
-            else:
-                before = words[:at_index]
-                email = [words[at_index]]
-                after = words[at_index + 1:]
-
-                if before:
-                    filtered.append({"category": None, "words": before})
-                filtered.append({"category": category, "words": email})
-                if after:
-                    filtered.append({"category": None, "words": after})
-                continue  # Skip the default append
-
-
-        elif category == TAGS["PHONE"]:
-            # Count total digits in the words
-            total_digits = sum(char.isdigit() for word in words for char in word)
-
-            if total_digits < 9:
-                keep_category = False
-            else:
-                # Create lists to hold the parts of the words
-                null_part_before = []
-                null_part_after = []
-                digits_and_special = []  # Keep this as a list of words, not a concatenated string
-
-                # Split the words into parts before digits/special characters (but not letters)
-                i = 0
-                while i < len(words) and any(char.isalpha() for char in words[i]):
-                    null_part_before.append(words[i])
-                    i += 1
-
-                # Collect all words with digits and special characters
-                while i < len(words) and any(char.isdigit() or not char.isalpha() for char in words[i]):
-                    digits_and_special.append(words[i])  # keep words with digits and special characters separate
-                    i += 1
-
-                # Collect all words after digits that contain letters
-                while i < len(words):
-                    null_part_after.append(words[i])
-                    i += 1
-
-                # Add parts to filtered list
-                if null_part_before:
-                    filtered.append({"category": None, "words": null_part_before})
-                if digits_and_special:
-                    filtered.append({"category": category, "words": digits_and_special})  # Add the phone number part
-                if null_part_after:
-                    filtered.append({"category": None, "words": null_part_after})
-
-                continue  # Skip normal append outside
-
-
-        elif category == TAGS["WEB"]:
-            dot_index = next((i for i, word in enumerate(words) if "." in word), None)
-
-            if dot_index is None:
-                keep_category = False
-            else:
-                before = words[:dot_index]
-                web_word = [words[dot_index]]
-                after = words[dot_index + 1:]
-
-                if before:
-                    filtered.append({"category": None, "words": before})
-                filtered.append({"category": category, "words": web_word})
-                if after:
-                    filtered.append({"category": None, "words": after})
-
-                continue  # Skip normal append outside
-
-        elif category == TAGS["LOCATION"]:
-            # Check if there's at least one capital letter or digit
-            if not any(word[0].isupper() or any(char.isdigit() for char in word) for word in words):
-                # If no capital letter or digit, classify as None
-                filtered.append({"category": None, "words": words})
-            else:
-                # Look for a 3-digit word followed by a 2-digit word
-                for i in range(len(words) - 1):
-                    if words[i].isdigit() and len(words[i]) == 3 and words[i+1].isdigit() and len(words[i+1]) == 2:
-                        # Split the words
-                        before_zipcode = words[:i]
-                        zipcode = [words[i], words[i+1]]
-                        after_zipcode = words[i+2:]
-
-                        # Add the words before the zipcode to LOCATION
-                        if before_zipcode:
-                            filtered.append({"category": TAGS["LOCATION"], "words": before_zipcode})
-
-                        # Add the zipcode to the ZIPCODE category
-                        filtered.append({"category": TAGS["ZIPCODE"], "words": zipcode})
-
-                        # Add the words after the zipcode to LOCATION
-                        if after_zipcode:
-                            filtered.append({"category": TAGS["LOCATION"], "words": after_zipcode})
-
-                        break  # Stop after processing the first match
-                else:
-                    # If no 3-digit + 2-digit pair is found, keep as LOCATION
-                    filtered.append({"category": category, "words": words})
-
-            continue  # Skip the default append outside
-
-        elif category in [TAGS["INSTITUTION"], TAGS["COMPANY"]]:
-            if not any(word and (word[0].isupper() or word[0].isdigit()) for word in words):
-                keep_category = False
-
-        elif category == TAGS["PERSONAL_NAME"]:
-            if not any(word and word[0].isupper() for word in words):
-                keep_category = False
-
-        # Apply change
-        filtered.append({
-            "category": category if keep_category else None,
-            "words": words
-        })
+        for category, words in filter_section(obj.get("category"), obj.get("words", [])):
+            filtered.append({"category": category, "words": words})
 
     # Replace the original list content
     processed_data.clear()
@@ -608,6 +485,21 @@ def clean_up_categories(processed_data: list[dict]) -> None:
         step(processed_data)
 
 
+def parse_and_clean_up(text: str) -> tuple[list[dict], str]:
+    """
+    Parses a tagged response, reconstructs its plain text and cleans up its categories
+    on the compact SectionArray form (piece offsets into the response), converting only
+    the cleaned-up sections to dictionaries. Gives the same results as
+    `parse_tagged_text`, `reconstruct_text` of the parsed sections and `clean_up_categories`.
+
+    :param text: The response text containing tagged sections.
+    :return: The cleaned-up sections and the reconstructed text (of the sections as tagged,
+             for `text_changes_check`).
+    """
+    sections = SectionArray.from_tagged_text(text)
+    return sections.to_cleaned_dicts(), sections.reconstruct_text()
+
+
 
 
 TEST_TEXT_TAGGED_PATH = \
@@ -0,0 +1,381 @@
+"""
+Copy of the response post-processing of output_conversion.py before the fused pass,
+kept unchanged as the baseline of output_conversion_benchmark.py: `parse_tagged_text`
+compiles the tag pattern per call, `reconstruct_text` matches uncompiled patterns per
+section, `filter_section` rebuilds the case number keyword set per section and
+`clean_up_categories` rebuilds the list twice.
+"""
+
+import re
+
+from constants import TAGS, OMITTED_TAGS
+
+
+def parse_tagged_text(text):
+    # pylint: disable=too-many-locals
+    """
+    Parses a text string looking for specific tagged sections.
+
+    The tags it looks for are defined in the TAGS dictionary (imported from tag_constants),
+    using the dictionary values as valid tags.
+    Any unrecognized tags are ignored. If a tag is not properly closed,
+    all nested tags are ignored until the closing tag appears.
+
+    The function returns a list of dictionaries, each containing:
+      - "words": A list of words belonging to the section
+      - "category": The tag name if within a valid tagged section, otherwise None
+
+    Words and punctuation are preserved in order, allowing the original text to be reconstructed.
+
+    Example:
+        Input:  "Ahoj já jsem <pname>Honza</pname>, jdu domu."
+        Output: [
+            {"words": ["Ahoj", "já", "jsem"], "category": None},
+            {"words": ["Honza"], "category": "pname"},
+            {"words": [", jdu domu."], "category": None}
+        ]
+
+    :param text: The input text string containing tagged sections.
+    :return: A list of dictionaries separating words by category.
+    """
+    tag_pattern = re.compile(r'<(/?)(\w+)>')
+
+    result = []
+    current_words = []
+    current_category = None
+    tag_stack = []
+
+    pos = 0
+    while pos < len(text):
+        match = tag_pattern.search(text, pos)
+        if not match:
+            break
+
+        start, end = match.span()
+        tag_is_closing, tag_name = match.groups()
+
+        pre_tag_text = text[pos:start].strip()
+        pre_words = pre_tag_text.split(" ") if pre_tag_text else []
+        if pre_words:
+            current_words.extend(pre_words)
+
+        if tag_is_closing:
+            if tag_stack and tag_stack[-1] == tag_name:
+                tag_stack.pop()
+                if not tag_stack:
+                    result.append({"words": current_words, "category": current_category})
+                    current_words = []
+                    current_category = None
+        else:
+            if tag_name in TAGS.values() and not tag_stack:
+                if current_words:
+                    result.append({"words": current_words, "category": current_category})
+                    current_words = []
+                current_category = tag_name
+                tag_stack.append(tag_name)
+
+        pos = end
+
+    post_text = text[pos:].strip()
+    post_words = post_text.split(" ") if post_text else []
+    if post_words:
+        current_words.extend(post_words)
+    if current_words:
+        result.append({"words": current_words, "category": current_category})
+
+    return result
+
+
+
+def reconstruct_text(processed_data):
+    """
+    Converts the parsed output back into a plain text string, 
+    ensuring punctuation marks like ",", "." are correctly placed 
+    without adding extra spaces after a category change.
+    
+    :param processed_data: The output of process_tagged_text function.
+    :return: A string with words joined by spaces.
+    """
+    reconstructed_text = [""]
+    prev_category = ""
+
+    for entry in processed_data:
+        if len(entry["words"]) == 0:
+            continue
+        first_word = entry["words"][0]
+        prev_last_word = reconstructed_text[-1]
+        is_new_special = \
+                bool(re.match(r"^[,.!?;:\"'\)\]\}»…\\/]+$", first_word))
+        is_last_special = \
+            bool(re.match(r"^[\"'\(\[\{\\/]+$", prev_last_word))
+        if prev_category != entry["category"] and is_new_special ^ is_last_special:
+            reconstructed_text[-1] += first_word
+        else:
+            reconstructed_text.append(first_word)
+
+        for word in entry["words"][1:]:
+            reconstructed_text.append(word)
+
+        prev_category = entry["category"]
+
+    return " ".join(reconstructed_text)
+
+
+
+# additional filtering
+def filter_section(category: str | None, words: list[str]) -> list[tuple[str | None, list[str]]]:
+    # pylint: disable=line-too-long
+    # pylint: disable=too-many-locals
+    # pylint: disable=too-many-branches
+    # pylint: disable=too-many-statements
+    # pylint: disable=too-many-return-statements
+    """
+    Applies the category filtering rules to one section.
+    The category is dropped (set to None) or the section is split based on specific conditions.
+
+    :param category: Category of the section.
+    :param words: Words of the section.
+    :return: List of (category, words) parts replacing the section.
+    """
+    parts = []
+
+    # Default to keeping the category
+    keep_category = True
+
+    if category in OMITTED_TAGS:
+        keep_category = False
+
+    elif category == TAGS["CASE_NUMBER"]:
+        has_two_digits = any(re.search(r'\d{2,}', word) for word in words)
+        has_slash = any('/' in word for word in words)
+
+        if not (has_two_digits and has_slash):
+            keep_category = False
+        else:
+            # Check for specific keywords that trigger a split
+            special_keywords = {"čj.", "j.", "zn.", "č.j.", "sp.zn.", "zn", "čj", ".", "j.:", "zn.:", "značka:", "číslo:", "jednací:", "spisu:", "značkou"}
+            split_index = None
+
+            for i, word in enumerate(words):
+                if word.lower() in special_keywords:
+                    split_index = i
+                    break
+
+            if split_index is not None:
+                # First part goes into a null category
+                parts.append((None, words[:split_index + 1]))
+                # Remaining part stays as CASE_NUMBER
+                if words[split_index + 1:]:  # Avoid empty word lists
+                    parts.append((category, words[split_index + 1:]))
+                return parts
+
+
+    elif category == TAGS["ZIPCODE"]:
+        zip_index = None
+
+        for i in range(len(words) - 1):
+            if words[i].isdigit() and len(words[i]) == 3 and \
+            words[i + 1].isdigit() and len(words[i + 1]) == 2:
+                zip_index = i
+                break
+
+        if zip_index is None:
+            keep_category = False
+        else:
+            # Split into parts: before, zipcode, after
+            before = words[:zip_index]
+            zipcode = words[zip_index:zip_index + 2]
+            after = words[zip_index + 2:]
+
+            if before:
+                parts.append((None, before))
+            parts.append((category, zipcode))
+            if after:
+                parts.append((None, after))
+            return parts
+
+
+    elif category == TAGS["EMAIL"]:
+        at_index = next((i for i, word in enumerate(words) if "@" in word), None)
+
+        if at_index is None:
+            keep_category = False
+        else:
+            before = words[:at_index]
+            email = [words[at_index]]
+            after = words[at_index + 1:]
+
+            if before:
+                parts.append((None, before))
+            parts.append((category, email))
+            if after:
+                parts.append((None, after))
+            return parts
+
+
+    elif category == TAGS["PHONE"]:
+        # Count total digits in the words
+        total_digits = sum(char.isdigit() for word in words for char in word)
+
+        if total_digits < 9:
+            keep_category = False
+        else:
+            # Create lists to hold the parts of the words
+            null_part_before = []
+            null_part_after = []
+            digits_and_special = []  # Keep this as a list of words, not a concatenated string
+
+            # Split the words into parts before digits/special characters (but not letters)
+            i = 0
+            while i < len(words) and any(char.isalpha() for char in words[i]):
+                null_part_before.append(words[i])
+                i += 1
+
+            # Collect all words with digits and special characters
+            while i < len(words) and any(char.isdigit() or not char.isalpha() for char in words[i]):
+                digits_and_special.append(words[i])  # keep words with digits and special characters separate
+                i += 1
+
+            # Collect all words after digits that contain letters
+            while i < len(words):
+                null_part_after.append(words[i])
+                i += 1
+
+            # Add parts to filtered list
+            if null_part_before:
+                parts.append((None, null_part_before))
+            if digits_and_special:
+                parts.append((category, digits_and_special))  # Add the phone number part
+            if null_part_after:
+                parts.append((None, null_part_after))
+
+            return parts
+
+
+    elif category == TAGS["WEB"]:
+        dot_index = next((i for i, word in enumerate(words) if "." in word), None)
+
+        if dot_index is None:
+            keep_category = False
+        else:
+            before = words[:dot_index]
+            web_word = [words[dot_index]]
+            after = words[dot_index + 1:]
+
+            if before:
+                parts.append((None, before))
+            parts.append((category, web_word))
+            if after:
+                parts.append((None, after))
+
+            return parts
+
+    elif category == TAGS["LOCATION"]:
+        # Check if there's at least one capital letter or digit
+        if not any(word[0].isupper() or any(char.isdigit() for char in word) for word in words):
+            # If no capital letter or digit, classify as None
+            parts.append((None, words))
+        else:
+            # Look for a 3-digit word followed by a 2-digit word
+            for i in range(len(words) - 1):
+                if words[i].isdigit() and len(words[i]) == 3 and words[i+1].isdigit() and len(words[i+1]) == 2:
+                    # Split the words
+                    before_zipcode = words[:i]
+                    zipcode = [words[i], words[i+1]]
+                    after_zipcode = words[i+2:]
+
+                    # Add the words before the zipcode to LOCATION
+                    if before_zipcode:
+                        parts.append((TAGS["LOCATION"], before_zipcode))
+
+                    # Add the zipcode to the ZIPCODE category
+                    parts.append((TAGS["ZIPCODE"], zipcode))
+
+                    # Add the words after the zipcode to LOCATION
+                    if after_zipcode:
+                        parts.append((TAGS["LOCATION"], after_zipcode))
+
+                    break  # Stop after processing the first match
+            else:
+                # If no 3-digit + 2-digit pair is found, keep as LOCATION
+                parts.append((category, words))
+
+        return parts
+
+    elif category in [TAGS["INSTITUTION"], TAGS["COMPANY"]]:
+        if not any(word and (word[0].isupper() or word[0].isdigit()) for word in words):
+            keep_category = False
+
+    elif category == TAGS["PERSONAL_NAME"]:
+        if not any(word and word[0].isupper() for word in words):
+            keep_category = False
+
+    # Apply change
+    parts.append((category if keep_category else None, words))
+    return parts
+
+
+def filter_categories(processed_data: list[dict]) -> None:
+    """
+    Modifies the input list of dictionaries by applying the category filtering rules
+    (see `filter_section`). The modified list is rebuilt using a buffer and replaced in-place.
+    """
+    if not processed_data:
+        return
+
+    filtered = []
+
+    for obj in processed_data:
+        for category, words in filter_section(obj.get("category"), obj.get("words", [])):
+            filtered.append({"category": category, "words": words})
+
+    # Replace the original list content
+    processed_data.clear()
+    processed_data.extend(filtered)
+
+
+def merge_null_category_sections(data: list[dict]) -> None:
+    """
+    Merges consecutive dictionaries in the input list where the "category" is None.
+    All "words" fields from dictionaries with a None category are combined into a single
+    entry with the "category" set to None. Non-null category entries are kept separate.
+    The input list is modified in place.
+    """
+    if not data:
+        return
+
+    merged = []
+    buffer = None
+
+    for item in data:
+        if item.get("category") is None:
+            if buffer is None:
+                buffer = {"category": None, "words": []}
+            buffer["words"].extend(item["words"])
+        else:
+            if buffer:
+                merged.append(buffer)
+                buffer = None
+            merged.append(item)
+
+    if buffer:
+        merged.append(buffer)
+
+    data.clear()
+    data.extend(merged)
+
+
+def clean_up_categories(processed_data: list[dict]) -> None:
+    """
+    Applies a sequence of cleanup transformations to processed_data.
+
+    Modifies the list in-place.
+    """
+
+    cleanup_steps = [
+        filter_categories,
+        merge_null_category_sections
+    ]
+
+    for step in cleanup_steps:
+        step(processed_data)
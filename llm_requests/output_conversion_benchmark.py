@@ -0,0 +1,105 @@
+"""
+Micro-benchmark of the response post-processing on the manually tagged validation text.
+
+Three variants are compared, used the same way as in pipeline_runner.py (the reconstructed
+text is computed from the sections as tagged, then the sections are cleaned up):
+- baseline: `parse_tagged_text`, `reconstruct_text` and `clean_up_categories` as they were
+  before the fused pass (copied in output_conversion_baseline.py): uncompiled `re.match`
+  per section, the case number keyword set rebuilt per section,
+- chain: the same three steps as they are now (patterns compiled once, rule registry),
+- fused: `parse_and_clean_up` (one pass over the SectionArray of the response).
+
+The variants run interleaved, as the timings of single runs on a busy machine vary a lot;
+the best and the median time of each are printed. The difference between chain and fused
+is the gain of the fusion itself, which is small: most of the gain over the baseline comes
+from the precompiled patterns and the rule registry. The counters of the category rules
+are printed for one pass.
+"""
+
+import os
+import time
+import statistics
+
+import output_conversion_baseline as baseline
+from output_conversion import parse_tagged_text, reconstruct_text, clean_up_categories, \
+    parse_and_clean_up, object_to_json
+from category_rules import category_rule_stats, reset_category_rule_stats
+
+BENCHMARK_FILE = os.path.join(os.path.dirname(__file__), "..", "validation_text_manual_tags.txt")
+REPEATS = 300
+
+
+def post_process_chain(text: str) -> tuple[list[dict], str]:
+    """
+    Post-processes a tagged response with the separate steps.
+
+    :param text: The response text containing tagged sections.
+    :return: The cleaned-up sections and the reconstructed text.
+    """
+    response_parsed_object = parse_tagged_text(text)
+    reconstructed_text = reconstruct_text(response_parsed_object)
+    clean_up_categories(response_parsed_object)
+    return response_parsed_object, reconstructed_text
+
+
+def post_process_baseline(text: str) -> tuple[list[dict], str]:
+    """
+    Post-processes a tagged response with the baseline steps.
+
+    :param text: The response text containing tagged sections.
+    :return: The cleaned-up sections and the reconstructed text.
+    """
+    response_parsed_object = baseline.parse_tagged_text(text)
+    reconstructed_text = baseline.reconstruct_text(response_parsed_object)
+    baseline.clean_up_categories(response_parsed_object)
+    return response_parsed_object, reconstructed_text
+
+
+def interleaved_times(post_processes: dict, text: str) -> dict:
+    """
+    Runs the post-processing variants REPEATS times in turn.
+
+    :param post_processes: Functions taking the text, by name.
+    :param text: The response text containing tagged sections.
+    :return: (best, median) wall time of each variant in seconds, by name.
+    """
+    times = {name: [] for name in post_processes}
+    for _ in range(REPEATS):
+        for name, post_process in post_processes.items():
+            start = time.perf_counter()
+            post_process(text)
+            times[name].append(time.perf_counter() - start)
+    return {name: (min(values), statistics.median(values)) for name, values in times.items()}
+
+
+if __name__ == "__main__":
+    with open(BENCHMARK_FILE, "r", encoding="utf-8") as file:
+        tagged_text = file.read()
+
+    variants = {
+        "baseline": post_process_baseline,
+        "chain": post_process_chain,
+        "fused": parse_and_clean_up
+    }
+
+    fused_data, fused_text = parse_and_clean_up(tagged_text)
+    for variant in ("baseline", "chain"):
+        variant_data, variant_text = variants[variant](tagged_text)
+        identical = object_to_json(variant_data) == object_to_json(fused_data) \
+            and variant_text == fused_text
+        print(f"{variant} / fused sections: {len(variant_data)} / {len(fused_data)}, "
+              f"identical: {identical}")
+
+    reset_category_rule_stats()
+    parse_and_clean_up(tagged_text)
+    for category, stats in category_rule_stats().items():
+        print(f"{category:>3} {stats['rule']:26} {stats['calls']:6} calls, "
+              f"{stats['kept']:6} kept, {stats['changed']:6} changed, "
+              f"{stats['demoted']:6} demoted, {stats['seconds'] * 1000:6.2f} ms")
+
+    results = interleaved_times(variants, tagged_text)
+    baseline_best = results["baseline"][0]
+    for variant, (best, median) in results.items():
+        print(f"{variant:8} best {best * 1000:8.2f} ms, median {median * 1000:8.2f} ms "
+              f"(speed-up over the baseline {baseline_best / best:.2f}x)")
+    print(f"fusion alone (chain / fused): {results['chain'][0] / results['fused'][0]:.2f}x")
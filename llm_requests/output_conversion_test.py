@@ -0,0 +1,85 @@
+"""
+Tests of the output conversion functions.
+
+Run from the llm_requests folder:
+    python -m pytest output_conversion_test.py
+"""
+
+import pytest
+
+from output_conversion import get_latest_position, write_latest_position, read_output_log, \
+    append_json_string_to_file, object_to_json
+from text_file_extraction import read_text_file_bytes
+
+INPUT_TEXT = "První slovo \r\ndruhé slovo\r\n\r\ntřetí  \r\nčtvrté \tpáté\r\n"
+
+
+def text_mode_word_end_positions(input_file: str) -> list[int]:
+    """Returns the word end positions as the former text-mode reader recorded them (tell())."""
+    positions = []
+    previous_was_space = True
+    with open(input_file, "r", encoding="utf-8") as file:
+        while char := file.read(1):
+            if char.isspace() and not previous_was_space:
+                positions.append(file.tell())
+            previous_was_space = char.isspace()
+    return positions
+
+
+@pytest.fixture(name="crlf_input_file")
+def fixture_crlf_input_file(input_file):
+    """The input file with CRLF line ends kept (written in binary mode)."""
+    with open(input_file, "wb") as file:
+        file.write(INPUT_TEXT.encode("utf-8"))
+    return input_file
+
+
+def test_text_mode_positions_are_converted_to_byte_offsets(crlf_input_file):
+    """tell() cookies of the former reader resume at the byte offsets of the current one."""
+    cookies = text_mode_word_end_positions(crlf_input_file)
+    _, byte_offsets = read_text_file_bytes(crlf_input_file, 0, len(INPUT_TEXT))
+    assert any(cookie > len(INPUT_TEXT.encode("utf-8")) for cookie in cookies)
+    assert len(cookies) == len(byte_offsets)
+
+    for cookie, byte_offset in zip(cookies, byte_offsets):
+        write_latest_position(crlf_input_file, cookie)
+        assert get_latest_position(crlf_input_file) == byte_offset
+
+
+def test_position_past_the_end_is_rejected(crlf_input_file):
+    """A position past the end of the file that is not a tell() cookie stops the run."""
+    write_latest_position(crlf_input_file, len(INPUT_TEXT.encode("utf-8")) + 1)
+    with pytest.raises(ValueError):
+        get_latest_position(crlf_input_file)
+
+    # a pending "\r" cookie that does not point past a "\r"
+    write_latest_position(crlf_input_file, (1 << 64) + 3)
+    with pytest.raises(ValueError):
+        get_latest_position(crlf_input_file)
+
+
+def test_byte_offset_positions_are_kept(input_file):
+    """Positions within the file are byte offsets already."""
+    assert get_latest_position(input_file) == 0
+    write_latest_position(input_file, 7)
+    assert get_latest_position(input_file) == 7
+
+
+def test_null_sections_are_merged_across_chunks(input_file):
+    """Untagged sections at the end of one chunk and the start of the next one are merged."""
+    chunks = [
+        [{"words": ["První"], "category": "p"}, {"words": ["slovo"], "category": None}],
+        [{"words": ["druhé"], "category": None}],
+        [{"words": ["slovo"], "category": None}, {"words": ["třetí"], "category": "o"}],
+        [{"words": ["čtvrté"], "category": "o"}],
+    ]
+    get_latest_position(input_file)   # creates the log folder
+    for chunk in chunks:
+        append_json_string_to_file(object_to_json(chunk), input_file)
+
+    assert list(read_output_log(input_file)) == [
+        {"words": ["První"], "category": "p"},
+        {"words": ["slovo", "druhé", "slovo"], "category": None},
+        {"words": ["třetí"], "category": "o"},
+        {"words": ["čtvrté"], "category": "o"},
+    ]
@@ -0,0 +1,268 @@
+"""
+Module for writing the per-chunk outputs of an input file together.
+
+OutputWriter keeps the output files of an input file open (main output log,
+changes log, quarantine log, category words and span log), buffers the writes of several
+chunks and commits them as a group: the buffered data is written (and fsynced),
+then a checkpoint with the new latest position and the sizes of all output files
+is atomically replaced, and `latest_position.txt` is updated from it.
+
+If the process dies before a checkpoint, the next OutputWriter truncates the
+outputs back to the sizes of the last checkpoint, so the outputs and the latest
+position always describe the same chunks and a restart neither duplicates nor
+loses output.
+"""
+
+import os
+import json
+import time
+import shutil
+
+from output_conversion import ensure_output_log, get_latest_position, write_latest_position
+
+from constants import OUTPUT_LOGS_FOLDER, LOGS_CATEGORY_WORDS, LOGS_CHANGES, \
+    LOGS_QUARANTINE, MAIN_OUTPUT_SPANS, LOGS_CHECKPOINT, OUTPUT_COMMIT_CHUNKS, \
+    OUTPUT_COMMIT_INTERVAL, OUTPUT_FSYNC
+
+
+def _fsync_directory(path: str) -> None:
+    directory = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(directory)
+    finally:
+        os.close(directory)
+
+
+class OutputWriter:
+    # pylint: disable=too-many-instance-attributes
+    """
+    Group-commit writer of the outputs of one input file.
+
+    Usage:
+        with OutputWriter(input_file_path) as writer:
+            position = writer.position
+            ...
+            writer.write_chunk(parsed_sections, position, changes_entry)
+
+    Leaving the with block on an exception aborts the writer instead of committing.
+    """
+
+    def __init__(self, input_file_path: str, commit_chunks: int = OUTPUT_COMMIT_CHUNKS,
+                 commit_interval: float = OUTPUT_COMMIT_INTERVAL, fsync: bool = OUTPUT_FSYNC):
+        """
+        Opens the outputs of an input file and recovers them to the last checkpoint
+        when the previous writer did not close cleanly.
+
+        :param input_file_path: The path to the input file (its name selects the output folder).
+        :param commit_chunks: Commit after this many chunks.
+        :param commit_interval: Commit when the last commit is older than this (seconds).
+        :param fsync: Flush the outputs and the checkpoint to disk on every commit.
+        """
+        self.input_file_path = input_file_path
+        self.commit_chunks = commit_chunks
+        self.commit_interval = commit_interval
+        self.fsync = fsync
+
+        self.folder_path = os.path.join(OUTPUT_LOGS_FOLDER, os.path.basename(input_file_path))
+        os.makedirs(os.path.join(self.folder_path, LOGS_CATEGORY_WORDS), exist_ok=True)
+        self._checkpoint_path = os.path.join(self.folder_path, LOGS_CHECKPOINT)
+        self._main_output_log = os.path.relpath(ensure_output_log(input_file_path),
+                                                self.folder_path)
+
+        self._handles = {}      # relative path -> open file
+        self._buffers = {}      # relative path -> list of strings
+        self._unsynced = set()  # relative paths written since the last commit
+        self._pending_chunks = 0
+        self._last_commit = time.monotonic()
+        self.commits = 0
+
+        self.position = self._recover()
+        self._pending_position = self.position
+        self._write_checkpoint(clean=False)
+
+    def _output_files(self) -> list[str]:
+        category_folder = os.path.join(self.folder_path, LOGS_CATEGORY_WORDS)
+        files = [self._main_output_log, MAIN_OUTPUT_SPANS, LOGS_CHANGES, LOGS_QUARANTINE]
+        files += [os.path.join(LOGS_CATEGORY_WORDS, name)
+                  for name in sorted(os.listdir(category_folder))]
+        return [file for file in files if os.path.exists(os.path.join(self.folder_path, file))]
+
+    def _recover(self) -> int:
+        """Truncates the outputs to the last checkpoint, returns the latest position."""
+        if not os.path.exists(self._checkpoint_path):
+            return get_latest_position(self.input_file_path)
+        with open(self._checkpoint_path, "r", encoding="utf-8") as file:
+            checkpoint = json.load(file)
+        if checkpoint["clean"]:
+            # the outputs may have been appended to since (e.g. sharded_runner.py)
+            return get_latest_position(self.input_file_path)
+
+        truncated = []
+        for file_name in self._output_files():
+            path = os.path.join(self.folder_path, file_name)
+            size = checkpoint["sizes"].get(file_name)
+            if size is None:
+                os.remove(path)     # created after the checkpoint
+                truncated.append(file_name)
+            elif os.path.getsize(path) > size:
+                os.truncate(path, size)
+                truncated.append(file_name)
+        if truncated:
+            print(f"[WARNING] Outputs {truncated} truncated to the checkpoint "
+                  f"at {checkpoint['position']}.")
+
+        write_latest_position(self.input_file_path, checkpoint["position"])
+        return checkpoint["position"]
+
+    def _write_checkpoint(self, clean: bool) -> None:
+        checkpoint = {
+            "position": self.position,
+            "clean": clean,
+            "sizes": {file_name: os.path.getsize(os.path.join(self.folder_path, file_name))
+                      for file_name in self._output_files()},
+        }
+        temp_path = self._checkpoint_path + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as file:
+            json.dump(checkpoint, file)
+            if self.fsync:
+                file.flush()
+                os.fsync(file.fileno())
+        os.replace(temp_path, self._checkpoint_path)
+        if self.fsync:
+            _fsync_directory(self.folder_path)
+
+    def _append(self, file_name: str, text: str) -> None:
+        self._buffers.setdefault(file_name, []).append(text)
+
+    def log_changes(self, log_entry: str) -> None:
+        """Adds an entry to the changes log (written with the next commit)."""
+        self._append(LOGS_CHANGES, log_entry + "\n")
+
+    def log_quarantine(self, log_entry: str) -> None:
+        """Adds a quarantined span to the quarantine log (written with the next commit)."""
+        self._append(LOGS_QUARANTINE, log_entry + "\n")
+
+    def write_spans(self, chunk_start: int, chunk_end: int,
+                    spans: list[tuple[int, int, str]]) -> None:
+        """
+        Adds the spans of a chunk to the span log (written with the next commit).
+        Call before `write_chunk` of the same chunk.
+
+        :param chunk_start: Byte offset of the chunk start.
+        :param chunk_end: Byte offset of the chunk end (the latest position after it).
+        :param spans: Spans of byte offsets into the input file (see span_output.py).
+        """
+        self._append(MAIN_OUTPUT_SPANS, json.dumps(
+            {"start": chunk_start, "end": chunk_end, "spans": spans}, ensure_ascii=False) + "\n")
+
+    def write_chunk(self, parsed_data: list[dict], position: int,
+                    changes: str | None = None, quarantine: str | None = None) -> None:
+        """
+        Buffers the outputs of a chunk and commits when the group is full or old enough.
+
+        :param parsed_data: Cleaned-up sections of the chunk (dicts with "words" and "category").
+        :param position: Latest position after the chunk.
+        :param changes: Changes log entry of the chunk.
+        :param quarantine: Quarantine log entry of the chunk.
+        """
+        if changes is not None:
+            self.log_changes(changes)
+        if quarantine is not None:
+            self.log_quarantine(quarantine)
+        self._append(self._main_output_log, json.dumps(parsed_data, ensure_ascii=False) + "\n")
+
+        # the same layout as write_tagged_sections_to_files
+        categorized_data = {}
+        for section in parsed_data:
+            if section["category"] is not None:
+                categorized_data.setdefault(section["category"], []).append(
+                    " ".join(section["words"]))
+        for category, lines in categorized_data.items():
+            self._append(os.path.join(LOGS_CATEGORY_WORDS, f"{category}.txt"),
+                         "\n".join(lines) + "\n")
+
+        self._pending_position = position
+        self._pending_chunks += 1
+        if self._pending_chunks >= self.commit_chunks \
+                or time.monotonic() - self._last_commit >= self.commit_interval:
+            self.commit()
+
+    def append_file(self, file_name: str, source_path: str) -> None:
+        """
+        Appends a whole file to an output (e.g. the same output of a shard). It is copied
+        right away instead of being buffered, but like the buffered writes it is only kept
+        by the next commit: the recovery removes it if the process dies before that.
+
+        :param file_name: Output file, relative to the output folder.
+        :param source_path: Path to the file to append.
+        """
+        self.commit()   # the buffered outputs come first
+        with open(source_path, "r", encoding="utf-8") as source:
+            shutil.copyfileobj(source, self._handle(file_name))
+        self._unsynced.add(file_name)
+
+    def advance(self, position: int) -> None:
+        """
+        Sets the latest position of the next commit, for outputs written
+        without `write_chunk` (see `append_file`).
+        """
+        self._pending_position = position
+
+    def _handle(self, file_name: str):
+        handle = self._handles.get(file_name)
+        if handle is None:
+            path = os.path.join(self.folder_path, file_name)
+            handle = open(path, "a", encoding="utf-8") # pylint: disable=consider-using-with
+            self._handles[file_name] = handle
+        return handle
+
+    def commit(self) -> None:
+        """Writes the buffered outputs and moves the checkpoint to the latest chunk."""
+        if not self._buffers and not self._unsynced and self._pending_position == self.position:
+            return
+
+        for file_name, parts in self._buffers.items():
+            self._handle(file_name).write("".join(parts))
+            self._unsynced.add(file_name)
+        self._buffers = {}
+        for file_name in self._unsynced:
+            handle = self._handles[file_name]
+            handle.flush()
+            if self.fsync:
+                os.fsync(handle.fileno())
+        self._unsynced = set()
+
+        self.position = self._pending_position
+        self._write_checkpoint(clean=False)
+        write_latest_position(self.input_file_path, self.position)
+        self._pending_chunks = 0
+        self._last_commit = time.monotonic()
+        self.commits += 1
+
+    def close(self) -> None:
+        """Commits the buffered outputs and closes the files."""
+        self.commit()
+        for handle in self._handles.values():
+            handle.close()
+        self._handles = {}
+        self._write_checkpoint(clean=True)
+
+    def abort(self) -> None:
+        """
+        Closes the files without committing, the next OutputWriter rolls the outputs
+        back to the last commit.
+        """
+        self._buffers = {}
+        for handle in self._handles.values():
+            handle.close()
+        self._handles = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            # the outputs of a failed run are rolled back to the last commit
+            self.abort()
@@ -0,0 +1,90 @@
+"""
+Tests of the group-commit output writer and its recovery to the last checkpoint.
+
+Run from the llm_requests folder:
+    python -m pytest output_writer_test.py
+"""
+
+import os
+
+import pytest
+
+from conftest import output_words, read_log
+from output_writer import OutputWriter
+from output_conversion import get_latest_position
+
+from constants import OUTPUT_LOGS_FOLDER, LOGS_CHANGES, LOGS_CATEGORY_WORDS
+
+INPUT_TEXT = "Honza jel do Prahy. Vrátil se až večer. Petr zůstal v Brně.\n"
+CHUNKS = [("Honza jel do Prahy.", 20), ("Vrátil se až večer.", 40),
+          ("Petr zůstal v Brně.", 62)]
+
+
+def sections(text: str) -> list[dict]:
+    """Sections of a chunk, its last word tagged as a location."""
+    *words, last = text.split()
+    return [{"words": words, "category": None}, {"words": [last], "category": "l"}]
+
+
+def write_chunks(writer: OutputWriter, chunks: list[tuple[str, int]]) -> None:
+    """Writes the chunks with their end positions."""
+    for text, position in chunks:
+        writer.write_chunk(sections(text), position, f"chunk {position}")
+
+
+def output_path(input_file: str, file_name: str) -> str:
+    """Returns the path of an output of the input file."""
+    return os.path.join(OUTPUT_LOGS_FOLDER, os.path.basename(input_file), file_name)
+
+
+def test_outputs_are_truncated_to_the_checkpoint(input_file):
+    """Writes after the last commit of a writer that was not closed are rolled back."""
+    writer = OutputWriter(input_file, commit_chunks=1, commit_interval=float("inf"))
+    write_chunks(writer, CHUNKS[:2])
+
+    # the process dies in the middle of the next commit
+    writer.commit_chunks = 2
+    write_chunks(writer, CHUNKS[2:])
+    for file_name, parts in writer._buffers.items():  # pylint: disable=protected-access
+        with open(output_path(input_file, file_name), "a", encoding="utf-8") as file:
+            file.write("".join(parts)[:-3])
+    writer.abort()
+
+    writer = OutputWriter(input_file)
+    assert writer.position == get_latest_position(input_file) == CHUNKS[1][1]
+    assert output_words(input_file) == " ".join(text for text, _ in CHUNKS[:2]).split()
+    assert read_log(input_file, LOGS_CHANGES) == "chunk 20\nchunk 40\n"
+    assert read_log(input_file, os.path.join(LOGS_CATEGORY_WORDS, "l.txt")) == \
+        "Prahy.\nvečer.\n"
+    writer.close()
+
+
+def test_outputs_after_a_clean_close_are_kept(input_file):
+    """Outputs appended after a clean close are not truncated (e.g. a shard merge)."""
+    with OutputWriter(input_file) as writer:
+        write_chunks(writer, CHUNKS[:1])
+    with open(output_path(input_file, LOGS_CHANGES), "a", encoding="utf-8") as file:
+        file.write("merged\n")
+
+    with OutputWriter(input_file) as writer:
+        assert writer.position == CHUNKS[0][1]
+        write_chunks(writer, CHUNKS[1:])
+    assert read_log(input_file, LOGS_CHANGES) == "chunk 20\nmerged\nchunk 40\nchunk 62\n"
+    assert get_latest_position(input_file) == CHUNKS[2][1]
+
+
+def test_exception_aborts_the_writer(input_file):
+    """A with block left on an exception does not commit the buffered chunks."""
+    with OutputWriter(input_file, commit_chunks=2) as writer:
+        write_chunks(writer, CHUNKS[:2])
+
+    with pytest.raises(RuntimeError):
+        with OutputWriter(input_file, commit_chunks=2) as writer:
+            writer.append_file(os.path.join(LOGS_CATEGORY_WORDS, "o.txt"), input_file)
+            write_chunks(writer, CHUNKS[2:])
+            raise RuntimeError("failed")
+
+    with OutputWriter(input_file) as writer:
+        assert writer.position == get_latest_position(input_file) == CHUNKS[1][1]
+    assert output_words(input_file) == " ".join(text for text, _ in CHUNKS[:2]).split()
+    assert not os.path.exists(output_path(input_file, os.path.join(LOGS_CATEGORY_WORDS, "o.txt")))
@@ -0,0 +1,360 @@
+"""
+Module for a pipelined version of the continuous_llm_requests.py loop.
+
+Instead of reading, requesting, checking and writing one chunk at a time,
+the stages run concurrently and are connected by bounded queues:
+
+1. the producer reads chunks ahead of the requests (at most `window`
+   chunks are read but not yet committed),
+2. request workers send them through `OpenAIClientManager.achat`
+   (many requests in flight), re-send responses over the resend tolerances
+   (a chunk rejected too many times is split in halves, or quarantined
+   when it is too short to split) and clean up the accepted ones,
+3. the committer takes the results from a reorder buffer and writes the main
+   output, category words, changes log and latest position strictly in input order
+   (through an OutputWriter, which commits them together in groups).
+
+A chunk cut at an article end never has its last tagged section re-sent, so the next
+chunk can be read right away. Any other chunk (cut in the middle of a sentence, or at
+a sentence end, which is only guessed and may split an entity) is rewound by
+`correct_object_and_get_reverse_index`, so the producer waits until it is committed
+and continues from the rewound position.
+"""
+
+import time
+import asyncio
+
+from text_file_extraction import TextChunkReader
+from word_offset_index import load_word_index
+from output_conversion import parse_and_clean_up, correct_object_and_get_reverse_index, \
+    remove_reasoning, export_main_output
+from output_writer import OutputWriter
+from text_changes_check import text_changes_check, text_changes_string
+from openai_api_buffer import OpenAIClientManager, DEFAULT_MAX_IN_FLIGHT
+from chunk_size_controller import ChunkSizeController
+from fair_scheduler import FairScheduler
+from span_output import parse_tagged_spans, clean_up_spans, spans_to_byte_offsets
+
+from constants import SYSTEM_PROMPT, TEMPERATURE, ADDED_RESEND_TOL, REMOVED_RESEND_TOL, \
+    API_INFO, CHOSEN_TOKEN_ESTIMATE, TEXT_CHUNK_WORD_OVERLAP_TOL, \
+    CHUNK_RETRY_LIMIT, MIN_SPLIT_WORDS
+
+PIPELINE_WORKERS = DEFAULT_MAX_IN_FLIGHT
+# chunks read ahead of the last committed one, per worker
+PIPELINE_WINDOW_PER_WORKER = 4
+
+# chunks ending at these boundaries are not rewound after their response
+NO_REWIND_BOUNDARIES = ("article", "eof")
+
+
+class PipelineRunner:
+    # pylint: disable=too-many-instance-attributes
+    """
+    Processes an input file with many requests in flight, committing results in input order.
+
+    Usage:
+        runner = PipelineRunner(OpenAIClientManager(API_INFO), input_file_path)
+        runner.run()
+    """
+
+    def __init__(self, client_manager: OpenAIClientManager, input_file_path: str,
+                 char_count: int = 1000,
+                 token_budget: int | None = None,
+                 workers: int = PIPELINE_WORKERS, window: int | None = None,
+                 temperature: float = TEMPERATURE,
+                 chunk_size: ChunkSizeController | None = None,
+                 start_position: int = 0, end_position: int | None = None,
+                 output_file_path: str | None = None,
+                 scheduler: FairScheduler | None = None, close_client: bool = True,
+                 span_output: bool = False):
+        # pylint: disable=too-many-arguments
+        # pylint: disable=too-many-positional-arguments
+        """
+        :param client_manager: Client manager sending the requests (its max_in_flight
+                               should be at least `workers`).
+        :param input_file_path: Path to the input text file.
+        :param char_count: Chunk size in characters (when token_budget is None).
+        :param token_budget: Estimated tokens per chunk, enables token-budget chunking.
+        :param workers: Number of concurrent request workers.
+        :param window: Maximum number of chunks read but not committed yet.
+        :param temperature: Sampling temperature.
+        :param chunk_size: Adapts the token budget (or char_count) of the chunks read next.
+        :param start_position: Byte offset to start from when no position is recorded yet.
+        :param end_position: Word end byte offset to stop at (None for the end of the file).
+        :param output_file_path: Path whose name selects the output folder (and position file),
+                                 defaults to the input file (see sharded_runner.py).
+        :param scheduler: Shares the requests in flight with other runners
+                          (see multi_file_runner.py), the output file path is
+                          the name of this runner's flow.
+        :param close_client: Close the async connection pools of the client manager when done
+                             (not when the client manager is shared with other runners).
+        :param span_output: Also write the tagged sections as byte offset spans
+                            into the input file (see span_output.py).
+        """
+        self.client_manager = client_manager
+        self.input_file_path = input_file_path
+        self.output_file_path = output_file_path or input_file_path
+        self.start_position = start_position
+        self.end_position = end_position
+        self.char_count = char_count
+        self.token_budget = token_budget
+        self.workers = workers
+        self.window = window or workers * PIPELINE_WINDOW_PER_WORKER
+        self.temperature = temperature
+        self.chunk_size = chunk_size
+        self.scheduler = scheduler
+        self.close_client = close_client
+        self.span_output = span_output
+
+        self.committed = 0
+        self.resends = 0
+        self.splits = 0
+        self.quarantined = 0
+
+        self._reader = None
+        self._word_index = None
+        self._writer = None
+        self._chunks = None     # producer -> workers
+        self._slots = None      # free places in the window
+        self._ready = None      # guards the reorder buffer
+        self._buffer = {}       # seq -> (chunk, result) waiting for the commit
+        self._end = None        # number of chunks, once the producer is done
+
+    def run(self, request_count: int = -1) -> None:
+        """
+        Blocking wrapper around `arun`.
+
+        :param request_count: Maximum number of chunks to process, -1 for the whole file.
+        """
+        asyncio.run(self.arun(request_count))
+
+    async def arun(self, request_count: int = -1) -> None:
+        """
+        Processes the input file from its latest recorded position.
+
+        :param request_count: Maximum number of chunks to process, -1 for the whole file.
+        """
+        self._writer = OutputWriter(self.output_file_path)
+        position = max(self._writer.position, self.start_position)
+        self._word_index = load_word_index(self.input_file_path)
+        self._reader = TextChunkReader(self.input_file_path, self.char_count, position,
+            token_budget=self.token_budget,
+            bytes_per_token=CHOSEN_TOKEN_ESTIMATE["bytes_per_token"], end=self.end_position)
+        self._chunks = asyncio.Queue(maxsize=self.workers)
+        self._slots = asyncio.Semaphore(self.window)
+        self._ready = asyncio.Condition()
+        self._buffer = {}
+        self._end = None
+
+        started = time.monotonic()
+        tasks = [asyncio.create_task(self._produce(position, request_count)),
+                 asyncio.create_task(self._commit())]
+        tasks += [asyncio.create_task(self._work()) for _ in range(self.workers)]
+        try:
+            await asyncio.gather(*tasks)
+
+            elapsed = time.monotonic() - started
+            summary = f"Pipeline: {self.committed} chunks in {elapsed:.1f}s, " \
+                f"{self.resends} re-sent, {self.splits} split, {self.quarantined} quarantined, " \
+                f"bytes sent: {self._reader.bytes_sent}"
+            print(summary)
+            # committed with the last chunks when the writer is closed
+            self._writer.log_changes(summary)
+        finally:
+            for task in tasks:
+                task.cancel()
+            self._reader.close()
+            self._word_index.close()
+            self._writer.close()
+            if self.close_client:
+                await self.client_manager.aclose()
+
+        await asyncio.to_thread(export_main_output, self.output_file_path)
+
+    async def _produce(self, position: int, request_count: int) -> None:
+        seq = 0
+        while seq != request_count:
+            await self._slots.acquire()
+            if self.chunk_size is not None:
+                if self.token_budget:
+                    self._reader.token_budget = self.chunk_size.size
+                else:
+                    self._reader.char_count = self.chunk_size.size
+            self._reader.seek(position)
+            text, positions = self._reader.read_chunk()
+            if not positions or positions[-1] == position:
+                self._slots.release()
+                print(f"End of text file (most likely) reached ({position})")
+                break
+
+            chunk = {
+                "seq": seq,
+                "start": position,
+                "text": text,
+                "positions": positions,
+                "boundary": self._reader.last_boundary,
+                "size": self._reader.token_budget or self._reader.char_count,
+                "rewound": None,
+            }
+            # a chunk not longer than the overlap (end of file) has nothing to rewind to
+            if chunk["boundary"] not in NO_REWIND_BOUNDARIES \
+                    and len(positions) > TEXT_CHUNK_WORD_OVERLAP_TOL:
+                chunk["rewound"] = asyncio.get_running_loop().create_future()
+
+            await self._chunks.put(chunk)
+            seq += 1
+
+            if chunk["rewound"] is None:
+                position = positions[-1]
+            else:
+                # the next chunk starts where the committed output of this one ends
+                position = await chunk["rewound"]
+
+        async with self._ready:
+            self._end = seq
+            self._ready.notify_all()
+        for _ in range(self.workers):
+            await self._chunks.put(None)
+
+    async def _work(self) -> None:
+        while True:
+            chunk = await self._chunks.get()
+            if chunk is None:
+                return
+            parts = await self._request(chunk)
+            async with self._ready:
+                self._buffer[chunk["seq"]] = (chunk, parts)
+                self._ready.notify_all()
+
+    async def _request(self, chunk: dict) -> list[dict]:
+        return await self._request_span(chunk["start"], chunk["text"], chunk["positions"])
+
+    async def _achat(self, chat_prompt: list[dict]) -> tuple[str, float, bool]:
+        """
+        Sends a request (in a scheduler slot, if shared) and returns the response,
+        latency and whether the response was truncated.
+        """
+        route = {}
+        if self.scheduler is None:
+            started = time.monotonic()
+            content = await self.client_manager.achat(chat_prompt, self.temperature, route)
+        else:
+            async with self.scheduler.slot(self.output_file_path):
+                started = time.monotonic()
+                content = await self.client_manager.achat(chat_prompt, self.temperature, route)
+        return content, time.monotonic() - started, route.get("finish_reason") == "length"
+
+    async def _request_span(self, start: int, text: str, positions: list[int]) -> list[dict]:
+        # pylint: disable=too-many-locals
+        """
+        Requests one span of the input. A span rejected more than CHUNK_RETRY_LIMIT times
+        is split in halves (requested concurrently), a span too short to split is quarantined.
+
+        :return: Results of the consecutive parts of the span.
+        """
+        chat_prompt = [
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": text}
+        ]
+        part = {"start": start, "text": text, "positions": positions}
+
+        for retry in range(CHUNK_RETRY_LIMIT + 1):
+            llm_response_text, latency, truncated = await self._achat(chat_prompt)
+            llm_response_text = remove_reasoning(llm_response_text)
+            response_parsed_object, reconstructed_text = parse_and_clean_up(llm_response_text)
+            a, r = text_changes_check(text, reconstructed_text)
+            accepted = len(a) <= ADDED_RESEND_TOL and len(r) <= REMOVED_RESEND_TOL
+            if self.chunk_size is not None:
+                self.chunk_size.record(latency, resent=not accepted, truncated=truncated,
+                                       headroom=self.client_manager.token_headroom())
+
+            if accepted:
+                spans = clean_up_spans(text, parse_tagged_spans(llm_response_text, text)[0]) \
+                    if self.span_output else None
+                return [{**part, "parsed": response_parsed_object, "spans": spans,
+                         "added": a, "removed": r, "resends": retry, "quarantined": False}]
+
+            print(f"Too many changes in chunk {start} (added: {len(a)}, "
+                  f"removed: {len(r)}), resending")
+            self.client_manager.discard_cached(chat_prompt, self.temperature)
+            self.resends += 1
+
+        words = text.split()
+        if len(positions) >= 2 * MIN_SPLIT_WORDS and len(words) == len(positions):
+            print(f"Chunk {start} rejected {CHUNK_RETRY_LIMIT + 1} times, splitting it")
+            self.splits += 1
+            middle = len(positions) // 2
+            first, second = await asyncio.gather(
+                self._request_span(start, " ".join(words[:middle]), positions[:middle]),
+                self._request_span(positions[middle - 1], " ".join(words[middle:]),
+                                   positions[middle:]))
+            return first + second
+
+        # too short to split, keep the text untagged so the output stays complete
+        print(f"Chunk {start} rejected {CHUNK_RETRY_LIMIT + 1} times, quarantining it")
+        self.quarantined += 1
+        return [{**part, "parsed": [{"words": words, "category": None}],
+                 "spans": [] if self.span_output else None, "added": [], "removed": [],
+                 "resends": CHUNK_RETRY_LIMIT + 1, "quarantined": True}]
+
+    async def _commit(self) -> None:
+        seq = 0
+        while True:
+            async with self._ready:
+                await self._ready.wait_for(lambda: seq in self._buffer or seq == self._end)
+                if seq == self._end:
+                    return
+                chunk, parts = self._buffer.pop(seq)
+
+            position = await asyncio.to_thread(self._write, chunk, parts)
+            self.committed += 1
+            self._slots.release()
+            if chunk["rewound"] is not None:
+                chunk["rewound"].set_result(position)
+            seq += 1
+
+    def _write(self, chunk: dict, parts: list[dict]) -> int:
+        """Writes the outputs of one chunk and returns the position the next chunk starts at."""
+        for i, part in enumerate(parts):
+            positions = part["positions"]
+            position = positions[-1]
+            response_parsed_object = part["parsed"]
+
+            position_string = \
+                f"----- {part['start']:16} - {position:16} " \
+                f"({self._word_index.progress(position):7.2%}) -----"
+            print(position_string)
+            if part["quarantined"]:
+                changes_output = f"{position_string}\nQUARANTINED after {part['resends']} resends"
+                quarantine = "\n".join([position_string, part["text"]])
+            else:
+                quarantine = None
+                changes_output = "\n".join([position_string,
+                    text_changes_string(part["added"], part["removed"])])
+                if part["resends"]:
+                    changes_output += f"\nResends: {part['resends']}"
+            if i == 0:
+                changes_output += f"\nChunk size: {chunk['size']}"
+
+            if i == len(parts) - 1 and chunk["rewound"] is not None and not part["quarantined"]:
+                #modifies response_parsed_object
+                reverse_index = correct_object_and_get_reverse_index(
+                    response_parsed_object, part["text"])
+                position = positions[reverse_index]
+
+            if part["spans"] is not None:
+                spans = spans_to_byte_offsets(self.input_file_path, part["start"], positions[-1],
+                                              part["text"], part["spans"])
+                # spans of the words re-sent with the next chunk are written with it
+                self._writer.write_spans(part["start"], position,
+                                         [span for span in spans if span[1] <= position])
+            self._writer.write_chunk(response_parsed_object, position, changes_output, quarantine)
+
+        return position
+
+
+if __name__ == "__main__":
+    INPUT_FILE = \
+        r"" # <Cesta ke vstupnímu textovému souboru, který má být zpracován>
+
+    PipelineRunner(OpenAIClientManager(API_INFO), INPUT_FILE).run()
@@ -0,0 +1,86 @@
+"""
+Tests of the splitting and quarantining of rejected chunks in the pipelined runner.
+
+Run from the llm_requests folder:
+    python -m pytest pipeline_runner_test.py
+"""
+
+import pytest
+
+pytest.importorskip("openai")
+
+# pylint: disable=wrong-import-position
+from conftest import output_words, read_log
+from pipeline_runner import PipelineRunner
+
+from constants import LOGS_CHANGES, LOGS_QUARANTINE, CHUNK_RETRY_LIMIT, MIN_SPLIT_WORDS
+
+POISON = "Jed."
+INPUT_TEXT = "\n\n".join(
+    f"Článek {i}. Honza jel do Prahy. Vrátil se až večer." + (f" {POISON}" if i == 17 else "")
+    for i in range(40)) + "\n"
+
+
+class RejectingClient:
+    """
+    Async client manager answering a chunk with its text (the first word tagged as a location),
+    or with nothing when the chunk is longer than `max_words` or contains POISON.
+    """
+
+    def __init__(self, max_words: int):
+        self.max_words = max_words
+        self.requests = []
+
+    async def achat(self, messages: list[dict], temperature: float, route: dict) -> str:
+        # pylint: disable=unused-argument
+        """Answers one request."""
+        text = messages[-1]["content"]
+        self.requests.append(text)
+        if len(text.split()) > self.max_words or POISON in text:
+            return ""
+        first, rest = text.split(" ", 1)
+        return f"<l>{first}</l> {rest}"
+
+    def discard_cached(self, messages: list[dict], temperature: float) -> None:
+        """Nothing is cached."""
+
+    def token_headroom(self) -> None:
+        """No rate limits are known."""
+
+    async def aclose(self) -> None:
+        """No connections to close."""
+
+
+def run_pipeline(input_file: str, max_words: int) -> tuple[PipelineRunner, RejectingClient]:
+    """Processes the whole input file with a RejectingClient."""
+    client = RejectingClient(max_words)
+    runner = PipelineRunner(client, input_file, char_count=1000, workers=4)
+    runner.run()
+    return runner, client
+
+
+def test_rejected_chunks_are_split(input_file):
+    """Chunks rejected CHUNK_RETRY_LIMIT + 1 times are split until the halves are accepted."""
+    with open(input_file, "w", encoding="utf-8") as file:
+        file.write(INPUT_TEXT.replace(f" {POISON}", ""))
+    runner, _ = run_pipeline(input_file, 4 * MIN_SPLIT_WORDS)
+
+    assert output_words(input_file) == INPUT_TEXT.replace(f" {POISON}", "").split()
+    assert runner.splits > 0
+    assert runner.quarantined == 0
+    assert runner.resends == runner.splits * (CHUNK_RETRY_LIMIT + 1)
+    assert "QUARANTINED" not in read_log(input_file, LOGS_CHANGES)
+
+
+def test_short_rejected_span_is_quarantined(input_file):
+    """A span too short to split is written untagged and logged in the quarantine log."""
+    runner, client = run_pipeline(input_file, len(INPUT_TEXT.split()))
+
+    assert output_words(input_file) == INPUT_TEXT.split()
+    assert runner.quarantined == 1
+    assert runner.splits > 0
+
+    poisoned = [text for text in client.requests if POISON in text]
+    assert MIN_SPLIT_WORDS <= len(poisoned[-1].split()) < 2 * MIN_SPLIT_WORDS
+    assert poisoned[-1] in read_log(input_file, LOGS_QUARANTINE)
+    assert read_log(input_file, LOGS_CHANGES).count("QUARANTINED") == 1
@@ -0,0 +1,222 @@
+"""
+Module for proactive per-key rate limiting of API requests.
+
+Each API key gets a KeyRateLimiter with token buckets for the configured
+request/token limits (per minute and per day) and the budgets reported by
+providers in `x-ratelimit-*` response headers. The client manager asks
+the limiter how long a key has to wait before a request of a given size,
+so keys are paced instead of being benched only after a 429.
+"""
+
+import re
+import time
+from collections import deque
+
+_DURATION_PATTERN = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+_DURATION_UNITS = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+
+UTILISATION_WINDOW = 60
+
+
+def parse_reset_seconds(value: str | None, now: float | None = None) -> float | None:
+    """
+    Converts a rate limit reset header value into seconds from now.
+
+    Accepts durations ("2m59.56s", "20ms", "7"), Unix timestamps in seconds
+    or milliseconds (OpenRouter) and returns None for missing or invalid values.
+
+    :param value: Header value.
+    :param now: Current Unix time, defaults to time.time().
+    :return: Number of seconds until the reset, or None.
+    """
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        number = float(value)
+    except ValueError:
+        parts = _DURATION_PATTERN.findall(value)
+        if not parts:
+            return None
+        return sum(float(amount) * _DURATION_UNITS[unit] for amount, unit in parts)
+
+    now = time.time() if now is None else now
+    if number > 1e12:
+        return max(number / 1000 - now, 0.0)
+    if number > 1e9:
+        return max(number - now, 0.0)
+    return number
+
+
+def retry_after_seconds(headers) -> float | None:
+    """
+    Returns the delay requested by a rate limited response (retry-after headers), or None.
+
+    :param headers: Response headers (dict-like).
+    """
+    if not headers:
+        return None
+    headers = {key.lower(): value for key, value in headers.items()}
+    if "retry-after-ms" in headers:
+        return parse_reset_seconds(headers["retry-after-ms"] + "ms")
+    return parse_reset_seconds(headers.get("retry-after"))
+
+
+class TokenBucket:
+    """
+    Token bucket holding up to `capacity` units, refilled evenly over `period` seconds.
+    """
+
+    def __init__(self, capacity: float, period: float):
+        self.capacity = capacity
+        self.rate = capacity / period
+        self.level = capacity
+        self._updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.level = min(self.capacity, self.level + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        """Returns the seconds until `amount` units (at most the capacity) are available."""
+        self._refill(now)
+        missing = min(amount, self.capacity) - self.level
+        return max(missing / self.rate, 0.0)
+
+    def consume(self, amount: float, now: float) -> None:
+        """Takes `amount` units; the level may go negative when the real usage was higher."""
+        self._refill(now)
+        self.level -= amount
+
+
+class KeyRateLimiter:
+    # pylint: disable=too-many-instance-attributes
+    """
+    Tracks the request and token budget of one API key.
+
+    Configured limits (rpm, tpm, rpd, tpd) are enforced with token buckets,
+    budgets reported in response headers are enforced until their reset time.
+    """
+
+    def __init__(self, rpm: int | None = None, tpm: int | None = None,
+                 rpd: int | None = None, tpd: int | None = None):
+        self._request_buckets = [TokenBucket(limit, period)
+                                 for limit, period in ((rpm, 60), (rpd, 86400)) if limit]
+        self._token_buckets = [TokenBucket(limit, period)
+                               for limit, period in ((tpm, 60), (tpd, 86400)) if limit]
+        self.rpm = rpm
+        self.tpm = tpm
+
+        # (remaining, reset deadline on the monotonic clock) reported by the provider
+        self._header_requests = None
+        self._header_tokens = None
+
+        self.requests_sent = 0
+        self.tokens_used = 0
+        self._window = deque()  # (monotonic time, tokens) of recent requests
+
+    def wait_time(self, tokens: int, now: float | None = None) -> float:
+        """
+        Returns how many seconds the key has to wait before sending a request
+        of the given estimated size (0 if it can be sent right away).
+
+        :param tokens: Estimated total tokens (prompt + completion) of the request.
+        :param now: Current monotonic time, defaults to time.monotonic().
+        """
+        now = time.monotonic() if now is None else now
+        waits = [bucket.wait_time(1, now) for bucket in self._request_buckets]
+        waits += [bucket.wait_time(tokens, now) for bucket in self._token_buckets]
+
+        if self._header_requests:
+            remaining, reset_at = self._header_requests
+            if remaining < 1 and reset_at > now:
+                waits.append(reset_at - now)
+        if self._header_tokens:
+            remaining, reset_at = self._header_tokens
+            if remaining < tokens and reset_at > now:
+                waits.append(reset_at - now)
+
+        return max(waits, default=0.0)
+
+    def acquire(self, tokens: int) -> None:
+        """
+        Reserves the budget for a request that is about to be sent.
+
+        :param tokens: Estimated total tokens of the request.
+        """
+        now = time.monotonic()
+        for bucket in self._request_buckets:
+            bucket.consume(1, now)
+        for bucket in self._token_buckets:
+            bucket.consume(tokens, now)
+
+        if self._header_requests:
+            remaining, reset_at = self._header_requests
+            self._header_requests = (remaining - 1, reset_at)
+        if self._header_tokens:
+            remaining, reset_at = self._header_tokens
+            self._header_tokens = (remaining - tokens, reset_at)
+
+        self.requests_sent += 1
+
+    def record_usage(self, estimated_tokens: int, used_tokens: int | None) -> None:
+        """
+        Corrects the reserved token budget with the real usage of a finished request.
+
+        :param estimated_tokens: Tokens reserved by `acquire`.
+        :param used_tokens: Tokens reported in the response usage, if any.
+        """
+        now = time.monotonic()
+        used_tokens = estimated_tokens if used_tokens is None else used_tokens
+        for bucket in self._token_buckets:
+            bucket.consume(used_tokens - estimated_tokens, now)
+
+        self.tokens_used += used_tokens
+        self._window.append((now, used_tokens))
+
+    def update_from_headers(self, headers) -> None:
+        """
+        Reads `x-ratelimit-*` headers of a response (Groq/OpenAI/Together style
+        `...-requests`/`...-tokens` headers, or OpenRouter style plain ones).
+
+        :param headers: Response headers (dict-like).
+        """
+        if not headers:
+            return
+        headers = {key.lower(): value for key, value in headers.items()}
+        now = time.monotonic()
+
+        def budget(suffix: str):
+            remaining = headers.get(f"x-ratelimit-remaining{suffix}")
+            reset = parse_reset_seconds(headers.get(f"x-ratelimit-reset{suffix}"))
+            if remaining is None:
+                return None
+            try:
+                return float(remaining), now + (reset or 0.0)
+            except ValueError:
+                return None
+
+        self._header_requests = budget("-requests") or budget("") or self._header_requests
+        self._header_tokens = budget("-tokens") or self._header_tokens
+
+    def stats(self) -> dict:
+        """
+        Returns the usage of the key: totals, requests and tokens in the last minute,
+        utilisation of the configured per-minute limits and the header budgets.
+        """
+        now = time.monotonic()
+        while self._window and now - self._window[0][0] > UTILISATION_WINDOW:
+            self._window.popleft()
+        recent_requests = len(self._window)
+        recent_tokens = sum(tokens for _, tokens in self._window)
+
+        return {
+            "requests": self.requests_sent,
+            "tokens": self.tokens_used,
+            "requests_last_minute": recent_requests,
+            "tokens_last_minute": recent_tokens,
+            "rpm_utilisation": recent_requests / self.rpm if self.rpm else None,
+            "tpm_utilisation": recent_tokens / self.tpm if self.tpm else None,
+            "remaining_requests": self._header_requests[0] if self._header_requests else None,
+            "remaining_tokens": self._header_tokens[0] if self._header_tokens else None,
+        }
@@ -0,0 +1,122 @@
+"""
+Tests of the per-key rate limiters.
+
+Run from the llm_requests folder:
+    python -m pytest rate_limits_test.py
+"""
+
+import types
+
+import pytest
+
+import rate_limits
+from rate_limits import KeyRateLimiter, TokenBucket, parse_reset_seconds, retry_after_seconds
+
+NOW = 1_700_000_000.0
+
+
+@pytest.fixture(name="clock")
+def fixture_clock(monkeypatch):
+    """Fake clock of the rate_limits module (monotonic time starts at 0, Unix time at NOW)."""
+    clock = types.SimpleNamespace(now=0.0)
+    monkeypatch.setattr(rate_limits, "time", types.SimpleNamespace(
+        monotonic=lambda: clock.now, time=lambda: NOW + clock.now))
+    return clock
+
+
+@pytest.mark.parametrize("value, seconds", [
+    ("2m59.56s", 179.56), ("20ms", 0.02), ("1h", 3600), ("7", 7), ("0.5", 0.5),
+    (str(NOW + 12), 12), (str((NOW + 3) * 1000), 3), (str(NOW - 5), 0),
+    ("", None), (None, None), ("soon", None)])
+def test_parse_reset_seconds(value, seconds):
+    """Durations, Unix timestamps in seconds or milliseconds, and invalid values."""
+    result = parse_reset_seconds(value, now=NOW)
+    assert result == (None if seconds is None else pytest.approx(seconds))
+
+
+def test_retry_after_seconds():
+    """retry-after-ms takes precedence over retry-after, header names are case-insensitive."""
+    assert retry_after_seconds({"Retry-After": "4"}) == 4
+    assert retry_after_seconds({"retry-after-ms": "250", "retry-after": "4"}) == 0.25
+    assert retry_after_seconds({"content-type": "application/json"}) is None
+    assert retry_after_seconds(None) is None
+
+
+def test_token_bucket_refills_evenly(clock):
+    """A bucket refills capacity / period units per second, up to its capacity."""
+    bucket = TokenBucket(60, 60)
+    bucket.consume(60, clock.now)
+    assert bucket.wait_time(10, 0.0) == pytest.approx(10)
+    assert bucket.wait_time(10, 4.0) == pytest.approx(6)
+    assert bucket.wait_time(1000, 4.0) == pytest.approx(56)   # at most the capacity
+    assert bucket.wait_time(10, 500.0) == 0
+
+
+def test_request_limit_paces_the_key(clock):
+    """After rpm requests the next one waits until a request is refilled."""
+    limiter = KeyRateLimiter(rpm=2)
+    assert limiter.wait_time(100) == 0
+    limiter.acquire(100)
+    limiter.acquire(100)
+    assert limiter.wait_time(100) == pytest.approx(30)
+    clock.now = 30
+    assert limiter.wait_time(100) == pytest.approx(0)
+
+
+@pytest.mark.usefixtures("clock")
+def test_token_limit_is_corrected_by_the_real_usage():
+    """The reserved estimate is replaced by the usage reported in the response."""
+    limiter = KeyRateLimiter(tpm=1200)
+    limiter.acquire(1000)
+    assert limiter.wait_time(400) == pytest.approx(10)    # 200 tokens missing, 20 per second
+    limiter.record_usage(1000, 700)
+    assert limiter.wait_time(400) == 0
+    limiter.record_usage(100, None)                       # no usage reported, estimate kept
+    assert limiter.stats()["tokens"] == 800
+
+
+def test_header_budgets(clock):
+    """Budgets reported in the headers block the key until their reset time."""
+    limiter = KeyRateLimiter()
+    limiter.update_from_headers({
+        "x-ratelimit-remaining-requests": "1", "x-ratelimit-reset-requests": "2m",
+        "x-ratelimit-remaining-tokens": "300", "x-ratelimit-reset-tokens": "20s"})
+    assert limiter.wait_time(200) == 0
+    assert limiter.wait_time(400) == pytest.approx(20)
+
+    limiter.acquire(200)
+    assert limiter.wait_time(50) == pytest.approx(120)    # no request left
+    assert limiter.stats()["remaining_requests"] == 0
+    assert limiter.stats()["remaining_tokens"] == 100
+
+    clock.now = 121
+    assert limiter.wait_time(400) == 0
+
+
+@pytest.mark.usefixtures("clock")
+def test_openrouter_style_headers():
+    """Plain x-ratelimit-* headers with a reset timestamp in milliseconds."""
+    limiter = KeyRateLimiter()
+    limiter.update_from_headers({"X-RateLimit-Remaining": "0",
+                                 "X-RateLimit-Reset": str(int((NOW + 5) * 1000))})
+    assert limiter.wait_time(10) == pytest.approx(5)
+    # headers without a budget keep the last one
+    limiter.update_from_headers({"x-ratelimit-remaining-requests": "invalid"})
+    assert limiter.wait_time(10) == pytest.approx(5)
+
+
+def test_stats_utilisation(clock):
+    """Requests and tokens of the last minute relative to the configured limits."""
+    limiter = KeyRateLimiter(rpm=10, tpm=1000)
+    for _ in range(2):
+        limiter.acquire(100)
+        limiter.record_usage(100, 150)
+    stats = limiter.stats()
+    assert (stats["requests"], stats["tokens"]) == (2, 300)
+    assert stats["rpm_utilisation"] == pytest.approx(0.2)
+    assert stats["tpm_utilisation"] == pytest.approx(0.3)
+
+    clock.now = 61
+    stats = limiter.stats()
+    assert (stats["requests_last_minute"], stats["tokens_last_minute"]) == (0, 0)
+    assert stats["requests"] == 2
@@ -0,0 +1,134 @@
+"""
+Module for a persistent, content-addressed cache of LLM responses.
+
+Responses are stored in a local SQLite file under the SHA-256 hash of the
+request (messages, model and temperature). When the stored responses
+exceed the size limit, the least recently used ones are evicted.
+"""
+
+import json
+import time
+import sqlite3
+import hashlib
+
+DEFAULT_CACHE_MAX_BYTES = 512 * 1024 * 1024
+
+
+def request_hash(messages: list[dict], model: str, temperature: float) -> str:
+    """
+    Returns the cache key of a chat request.
+
+    :param messages: Chat messages of the request.
+    :param model: Model identifier.
+    :param temperature: Sampling temperature.
+    :return: Hex digest identifying the request.
+    """
+    payload = json.dumps(
+        {"messages": messages, "model": model, "temperature": temperature},
+        ensure_ascii=False, sort_keys=True
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """
+    SQLite backed response cache with size-based LRU eviction and hit/miss counters.
+    """
+
+    def __init__(self, path: str, max_bytes: int = DEFAULT_CACHE_MAX_BYTES):
+        """
+        :param path: Path to the SQLite file (created if missing).
+        :param max_bytes: Maximum total size of the stored responses (UTF-8 bytes).
+        """
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._connection = sqlite3.connect(path)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, response TEXT NOT NULL, "
+            "size INTEGER NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._connection.execute(
+            "CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used)")
+        self._connection.commit()
+
+        self._total_bytes = self._connection.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+
+    def get(self, key: str) -> str | None:
+        """
+        Returns the cached response for the key (and marks it as recently used), or None.
+
+        :param key: Request hash from `request_hash`.
+        """
+        row = self._connection.execute(
+            "SELECT response FROM responses WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self._connection.execute(
+            "UPDATE responses SET last_used = ? WHERE key = ?", (time.time(), key))
+        self._connection.commit()
+        return row[0]
+
+    def put(self, key: str, response: str) -> None:
+        """
+        Stores a response and evicts the least recently used ones over the size limit.
+
+        :param key: Request hash from `request_hash`.
+        :param response: Response text.
+        """
+        size = len(response.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+
+        self.discard(key, commit=False)
+        self._connection.execute(
+            "INSERT INTO responses (key, response, size, last_used) VALUES (?, ?, ?, ?)",
+            (key, response, size, time.time()))
+        self._total_bytes += size
+
+        while self._total_bytes > self.max_bytes:
+            oldest_key, oldest_size = self._connection.execute(
+                "SELECT key, size FROM responses ORDER BY last_used LIMIT 1").fetchone()
+            self._connection.execute("DELETE FROM responses WHERE key = ?", (oldest_key,))
+            self._total_bytes -= oldest_size
+            self.evictions += 1
+
+        self._connection.commit()
+
+    def discard(self, key: str, commit: bool = True) -> None:
+        """
+        Removes a response from the cache (e.g. when it was rejected and has to be re-requested).
+
+        :param key: Request hash from `request_hash`.
+        :param commit: Commit the deletion right away.
+        """
+        row = self._connection.execute(
+            "SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+        if row is not None:
+            self._connection.execute("DELETE FROM responses WHERE key = ?", (key,))
+            self._total_bytes -= row[0]
+            if commit:
+                self._connection.commit()
+
+    def stats(self) -> dict:
+        """Returns the hit/miss/eviction counters and the stored size."""
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else None,
+            "evictions": self.evictions,
+            "bytes": self._total_bytes,
+        }
+
+    def close(self) -> None:
+        """Closes the database connection."""
+        self._connection.close()
@@ -0,0 +1,79 @@
+"""
+Tests of the persistent response cache.
+
+Run from the llm_requests folder:
+    python -m pytest response_cache_test.py
+"""
+
+import itertools
+import types
+
+import pytest
+
+import response_cache
+from response_cache import ResponseCache, request_hash
+
+MESSAGES = [{"role": "system", "content": "Oprav text."}, {"role": "user", "content": "ahoj"}]
+
+
+@pytest.fixture(name="cache_path")
+def fixture_cache_path(tmp_path, monkeypatch):
+    """Path of the SQLite file, the cache clock ticks by one second per call."""
+    ticks = itertools.count()
+    monkeypatch.setattr(response_cache, "time", types.SimpleNamespace(time=lambda: next(ticks)))
+    return str(tmp_path / "cache.sqlite")
+
+
+def test_request_hash():
+    """The key depends on the messages, the model and the temperature, not on the key order."""
+    key = request_hash(MESSAGES, "gpt-4o", 0.0)
+    assert key == request_hash([dict(reversed(message.items())) for message in MESSAGES],
+                               "gpt-4o", 0.0)
+    assert key != request_hash(MESSAGES[1:], "gpt-4o", 0.0)
+    assert key != request_hash(MESSAGES, "gpt-4o-mini", 0.0)
+    assert key != request_hash(MESSAGES, "gpt-4o", 0.2)
+
+
+def test_hits_and_misses(cache_path):
+    """Stored responses are returned and counted as hits, unknown keys as misses."""
+    cache = ResponseCache(cache_path)
+    assert cache.get("a") is None
+    cache.put("a", "odpověď")
+    assert cache.get("a") == "odpověď"
+    cache.discard("a")
+    assert cache.get("a") is None
+
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["bytes"]) == (1, 2, 0)
+    assert stats["hit_rate"] == pytest.approx(1 / 3)
+    cache.close()
+
+
+def test_least_recently_used_are_evicted(cache_path):
+    """Over the size limit the least recently used responses are evicted."""
+    cache = ResponseCache(cache_path, max_bytes=10)
+    cache.put("a", "aaaa")
+    cache.put("b", "bbbb")
+    assert cache.get("a") == "aaaa"            # "b" is now the least recently used
+    cache.put("c", "cccc")
+    assert cache.get("b") is None
+    assert (cache.get("a"), cache.get("c")) == ("aaaa", "cccc")
+
+    cache.put("a", "ááá")                       # replacing a response frees its old size
+    assert cache.stats()["bytes"] == 10
+    cache.put("d", "x" * 11)                    # larger than the whole cache, not stored
+    assert cache.get("d") is None
+    assert cache.stats()["evictions"] == 1
+    cache.close()
+
+
+def test_responses_persist(cache_path):
+    """A reopened cache keeps the responses and their total size."""
+    cache = ResponseCache(cache_path)
+    cache.put("a", "čeština")
+    cache.close()
+
+    cache = ResponseCache(cache_path)
+    assert cache.stats()["bytes"] == len("čeština".encode("utf-8"))
+    assert cache.get("a") == "čeština"
+    cache.close()
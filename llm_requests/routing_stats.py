@@ -0,0 +1,107 @@
+"""
+Module for rolling latency and success statistics of API keys and providers.
+
+OpenAIClientManager keeps one RoutingStats per key and per base URL and
+routes each request to the ready key with the lowest expected latency
+(EWMA latency inflated by the error rate). Keys without samples fall back
+to the statistics of their provider, or are tried first when the provider
+is unknown too.
+"""
+
+from collections import deque
+
+EWMA_ALPHA = 0.2
+LATENCY_WINDOW = 100
+
+# keys failing more often than this are only used when no healthy key is ready
+UNHEALTHY_ERROR_RATE = 0.5
+
+# lower bound of the success rate used to inflate the expected latency
+_MIN_SUCCESS_RATE = 0.05
+
+
+class RoutingStats:
+    """
+    EWMA latency, p95 latency (over the last LATENCY_WINDOW requests),
+    EWMA error rate and EWMA completion tokens per second of one key or provider.
+    """
+
+    def __init__(self, alpha: float = EWMA_ALPHA, window: int = LATENCY_WINDOW):
+        self.alpha = alpha
+        self.requests = 0
+        self.errors = 0
+        self.ewma_latency = None
+        self.error_rate = 0.0
+        self.tokens_per_second = None
+        self._latencies = deque(maxlen=window)
+
+    def _ewma(self, current: float | None, value: float) -> float:
+        if current is None:
+            return value
+        return current + self.alpha * (value - current)
+
+    def record_success(self, latency: float, completion_tokens: int | None = None) -> None:
+        """
+        Records a successful request.
+
+        :param latency: Seconds from sending the request to the end of the response.
+        :param completion_tokens: Generated tokens, used for the tokens per second rate.
+        """
+        self.requests += 1
+        self.record_latency(latency)
+        self.error_rate = self._ewma(self.error_rate, 0.0)
+        if completion_tokens and latency > 0:
+            self.tokens_per_second = self._ewma(self.tokens_per_second,
+                                                completion_tokens / latency)
+
+    def record_latency(self, latency: float) -> None:
+        """
+        Records a latency sample, also for a request cancelled before it finished
+        (the elapsed time is a lower bound of its latency).
+        """
+        self.ewma_latency = self._ewma(self.ewma_latency, latency)
+        self._latencies.append(latency)
+
+    def record_error(self) -> None:
+        """Records a failed request."""
+        self.requests += 1
+        self.errors += 1
+        self.error_rate = self._ewma(self.error_rate, 1.0)
+
+    @property
+    def has_samples(self) -> bool:
+        """True once at least one request finished successfully."""
+        return self.ewma_latency is not None
+
+    @property
+    def healthy(self) -> bool:
+        """False while the recent error rate is above UNHEALTHY_ERROR_RATE."""
+        return self.error_rate <= UNHEALTHY_ERROR_RATE
+
+    def p95(self) -> float | None:
+        """Returns the 95th percentile of the recent latencies, or None without samples."""
+        if not self._latencies:
+            return None
+        latencies = sorted(self._latencies)
+        return latencies[min(int(len(latencies) * 0.95), len(latencies) - 1)]
+
+    def expected_latency(self) -> float:
+        """
+        Returns the EWMA latency divided by the success rate
+        (the expected time until a successful response), 0 without samples.
+        """
+        if self.ewma_latency is None:
+            return 0.0
+        return self.ewma_latency / max(1.0 - self.error_rate, _MIN_SUCCESS_RATE)
+
+    def snapshot(self) -> dict:
+        """Returns the statistics as a dictionary."""
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "error_rate": self.error_rate,
+            "ewma_latency": self.ewma_latency,
+            "p95_latency": self.p95(),
+            "tokens_per_second": self.tokens_per_second,
+            "healthy": self.healthy,
+        }
@@ -0,0 +1,357 @@
+"""
+Module with a compact representation of the parsed sections.
+
+The pipeline passes the sections around as lists of {"words": [...], "category": ...}
+dictionaries, i.e. a dictionary, a list and a string object per section and word.
+SectionArray keeps one shared text buffer (the tagged response itself) and the sections
+in parallel arrays: the start and end offsets of their pieces in the buffer (a piece is
+a run of words separated by single spaces, e.g. the text between two tags), the end index
+of the pieces of each section and a small-int category code (0 for no category).
+The words are only split out of the buffer when they are needed.
+
+Parsing, the category clean-up and the text reconstruction run on it directly and give
+the same results as their dictionary versions in output_conversion.py;
+`from_dicts` and `to_dicts` convert between the two forms.
+"""
+
+import re
+from array import array
+
+from category_rules import filter_section
+
+from constants import TAGS
+
+# category of each code, code 0 is no category
+CATEGORIES = [None] + list(dict.fromkeys(TAGS.values()))
+_CATEGORY_CODES = {category: code for code, category in enumerate(CATEGORIES)}
+
+TAG_PATTERN = re.compile(r'<(/?)(\w+)>')
+TAG_NAMES = frozenset(TAGS.values())
+# not anchored at the start, so they also match a word within a text (match with pos, endpos)
+NEW_SPECIAL_PATTERN = re.compile(r"[,.!?;:\"'\)\]\}»…\\/]+$")
+LAST_SPECIAL_PATTERN = re.compile(r"[\"'\(\[\{\\/]+$")
+_NEW_SPECIAL_CHARS = frozenset(",.!?;:\"')]}»…\\/")
+_LAST_SPECIAL_CHARS = frozenset("\"'([{\\/")
+
+
+def category_code(category: str | None) -> int:
+    """
+    Returns the code of a category, registering categories that are not in TAGS
+    (e.g. from older outputs).
+    """
+    code = _CATEGORY_CODES.get(category)
+    if code is None:
+        code = len(CATEGORIES)
+        CATEGORIES.append(category)
+        _CATEGORY_CODES[category] = code
+    return code
+
+
+class SectionArray:
+    """
+    Sections as pieces of one text buffer, section end indices and category codes.
+
+    Usage:
+        sections = SectionArray.from_tagged_text(llm_response_text)
+        reconstructed_text = sections.reconstruct_text()
+        processed_data = sections.clean_up_categories().to_dicts()
+    """
+
+    __slots__ = ("text", "piece_starts", "piece_ends", "section_ends", "codes")
+
+    def __init__(self, text: str = ""):
+        """
+        :param text: Text buffer the piece offsets point into.
+        """
+        self.text = text
+        self.piece_starts = array("I")  # offset of the first character of each piece
+        self.piece_ends = array("I")    # offset after the last character of each piece
+        self.section_ends = array("I")  # end index (exclusive) of the pieces of each section
+        self.codes = array("B")         # category code of each section
+
+    def __len__(self) -> int:
+        return len(self.codes)
+
+    def __iter__(self):
+        """Yields the (category, words) pairs of the sections."""
+        start = 0
+        for end, code in zip(self.section_ends, self.codes):
+            yield CATEGORIES[code], self.words(start, end)
+            start = end
+
+    def words(self, start: int, end: int) -> list[str]:
+        """Returns the words of the pieces with indices from `start` to `end` (exclusive)."""
+        text = self.text
+        if end - start == 1:
+            return text[self.piece_starts[start]:self.piece_ends[start]].split(" ")
+        words = []
+        for piece in range(start, end):
+            words += text[self.piece_starts[piece]:self.piece_ends[piece]].split(" ")
+        return words
+
+    def add_piece(self, start: int, end: int) -> None:
+        """Adds the words of text[start:end] (separated by single spaces) to the last section."""
+        self.piece_starts.append(start)
+        self.piece_ends.append(end)
+
+    def end_section(self, code: int, merge_null: bool = False) -> None:
+        """
+        Ends a section after the last piece added.
+
+        :param code: Category code of the section.
+        :param merge_null: Extend the last section instead if both have no category.
+        """
+        if merge_null and code == 0 and self.codes and self.codes[-1] == 0:
+            self.section_ends[-1] = len(self.piece_starts)
+        else:
+            self.section_ends.append(len(self.piece_starts))
+            self.codes.append(code)
+
+    def append_words(self, words: list[str]) -> None:
+        """Adds words that are not in the text buffer as a new piece at its end."""
+        start = len(self.text) + 1
+        self.text = " ".join([self.text, *words])
+        self.add_piece(start, len(self.text))
+
+    @classmethod
+    def from_dicts(cls, processed_data: list[dict]) -> "SectionArray":
+        """
+        Converts a list of {"words", "category"} dictionaries, the words (without spaces,
+        as `parse_tagged_text` splits them) are joined into a new text buffer.
+        """
+        section_texts = []
+        sections = cls()
+        offset = 0
+        for item in processed_data:
+            if item["words"]:
+                section_text = " ".join(item["words"])
+                section_texts.append(section_text)
+                sections.add_piece(offset, offset + len(section_text))
+                offset += len(section_text) + 1
+            sections.end_section(category_code(item.get("category")))
+        sections.text = " ".join(section_texts)
+        return sections
+
+    def to_dicts(self) -> list[dict]:
+        """Converts to a list of dictionaries (keys in the order of the cleaned-up output)."""
+        text = self.text
+        piece_starts = self.piece_starts
+        piece_ends = self.piece_ends
+        processed_data = []
+        start = 0
+        for end, code in zip(self.section_ends, self.codes):
+            if end - start == 1:
+                words = text[piece_starts[start]:piece_ends[start]].split(" ")
+            else:
+                words = self.words(start, end)
+            processed_data.append({"category": CATEGORIES[code], "words": words})
+            start = end
+        return processed_data
+
+    @classmethod
+    def from_tagged_text(cls, text: str) -> "SectionArray":
+        # pylint: disable=too-many-locals
+        """
+        Parses a tagged text like `parse_tagged_text`, the text is the buffer
+        of the sections.
+        """
+        sections = cls(text)
+        piece_starts = sections.piece_starts
+        piece_ends = sections.piece_ends
+        section_ends = sections.section_ends
+        codes = sections.codes
+        current_code = 0
+        current_start = 0
+        tag_stack = []
+
+        pos = 0
+        for match in TAG_PATTERN.finditer(text):
+            start, end = match.span()
+            tag_is_closing, tag_name = match.groups()
+
+            if start > pos:
+                pre_tag_text = text[pos:start]
+                stripped = pre_tag_text.strip()
+                if stripped:
+                    piece_start = pos + pre_tag_text.find(stripped[0])
+                    piece_starts.append(piece_start)
+                    piece_ends.append(piece_start + len(stripped))
+
+            if tag_is_closing:
+                if tag_stack and tag_stack[-1] == tag_name:
+                    tag_stack.pop()
+                    if not tag_stack:
+                        section_ends.append(len(piece_starts))
+                        codes.append(current_code)
+                        current_start = len(piece_starts)
+                        current_code = 0
+            else:
+                if tag_name in TAG_NAMES and not tag_stack:
+                    if len(piece_starts) > current_start:
+                        section_ends.append(len(piece_starts))
+                        codes.append(current_code)
+                        current_start = len(piece_starts)
+                    current_code = _CATEGORY_CODES[tag_name]
+                    tag_stack.append(tag_name)
+
+            pos = end
+
+        post_text = text[pos:]
+        stripped = post_text.strip()
+        if stripped:
+            piece_start = pos + post_text.find(stripped[0])
+            piece_starts.append(piece_start)
+            piece_ends.append(piece_start + len(stripped))
+        if len(piece_starts) > current_start:
+            section_ends.append(len(piece_starts))
+            codes.append(current_code)
+
+        return sections
+
+    def clean_up_categories(self) -> "SectionArray":
+        """
+        Applies the category filtering rules (see `filter_section`) and merges
+        the consecutive sections without a category, like `clean_up_categories`.
+
+        :return: The cleaned-up sections, sharing the text buffer (words created
+                 by a rule are appended to a copy of it).
+        """
+        cleaned = SectionArray(self.text)
+        piece_starts = self.piece_starts
+        piece_ends = self.piece_ends
+        cleaned_section_ends = cleaned.section_ends
+        cleaned_codes = cleaned.codes
+        text = self.text
+        start = 0
+        for end, code in zip(self.section_ends, self.codes):
+            if code:
+                if end - start == 1:
+                    words = text[piece_starts[start]:piece_ends[start]].split(" ")
+                else:
+                    words = self.words(start, end)
+                category = CATEGORIES[code]
+                parts = filter_section(category, words)
+                if len(parts) != 1 or parts[0][1] != words:
+                    cleaned.add_parts(parts, words, self._word_offsets(start, end))
+                    start = end
+                    continue
+                if parts[0][0] != category:
+                    code = category_code(parts[0][0])
+
+            # the section is kept (with the category of the rule)
+            if end - start == 1:
+                cleaned.piece_starts.append(piece_starts[start])
+                cleaned.piece_ends.append(piece_ends[start])
+            else:
+                cleaned.piece_starts += piece_starts[start:end]
+                cleaned.piece_ends += piece_ends[start:end]
+            if code == 0 and cleaned_codes and cleaned_codes[-1] == 0:
+                cleaned_section_ends[-1] = len(cleaned.piece_starts)
+            else:
+                cleaned_section_ends.append(len(cleaned.piece_starts))
+                cleaned_codes.append(code)
+            start = end
+        return cleaned
+
+    def to_cleaned_dicts(self) -> list[dict]:
+        """
+        Converts to a list of dictionaries with the category rules applied and the null
+        sections merged, like `clean_up_categories(...).to_dicts()` without building
+        the cleaned-up SectionArray.
+        """
+        text = self.text
+        piece_starts = self.piece_starts
+        piece_ends = self.piece_ends
+        cleaned = []
+        null_words = None
+        start = 0
+        for end, code in zip(self.section_ends, self.codes):
+            if end - start == 1:
+                words = text[piece_starts[start]:piece_ends[start]].split(" ")
+            else:
+                words = self.words(start, end)
+            parts = filter_section(CATEGORIES[code], words) if code else ((None, words),)
+            for part_category, part_words in parts:
+                if part_category is None:
+                    if null_words is None:
+                        null_words = []
+                        cleaned.append({"category": None, "words": null_words})
+                    null_words += part_words
+                else:
+                    null_words = None
+                    cleaned.append({"category": part_category, "words": part_words})
+            start = end
+        return cleaned
+
+    def _word_offsets(self, start: int, end: int) -> list[tuple[int, int]]:
+        """Returns the (start, end) offsets of the words of the pieces."""
+        offsets = []
+        for piece in range(start, end):
+            offset = self.piece_starts[piece]
+            for word in self.text[offset:self.piece_ends[piece]].split(" "):
+                offsets.append((offset, offset + len(word)))
+                offset += len(word) + 1
+        return offsets
+
+    def add_parts(self, parts: list[tuple[str | None, list[str]]], words: list[str],
+                   offsets: list[tuple[int, int]]) -> None:
+        """
+        Adds the parts a rule split a section into as sections, the words of a part
+        that are the next words of the section are kept as pieces of the buffer.
+        """
+        index = 0
+        for part_category, part_words in parts:
+            count = len(part_words)
+            if part_words == words[index:index + count]:
+                if count:
+                    piece_start, piece_end = offsets[index]
+                    for word_start, word_end in offsets[index + 1:index + count]:
+                        if word_start != piece_end + 1:
+                            self.add_piece(piece_start, piece_end)
+                            piece_start = word_start
+                        piece_end = word_end
+                    self.add_piece(piece_start, piece_end)
+                index += count
+            else:
+                self.append_words(part_words)
+            self.end_section(category_code(part_category), merge_null=True)
+
+    def reconstruct_text(self) -> str:
+        # pylint: disable=too-many-locals
+        """Converts the sections back into plain text like `reconstruct_text`."""
+        text = self.text
+        piece_starts = self.piece_starts
+        piece_ends = self.piece_ends
+        new_special = NEW_SPECIAL_PATTERN.match
+        last_special = LAST_SPECIAL_PATTERN.match
+        reconstructed_text = [""]
+        last_word = ""      # last word of reconstructed_text (with a joined first word)
+        prev_code = -1
+        start = 0
+        for end, code in zip(self.section_ends, self.codes):
+            if end == start:
+                continue
+            if end - start == 1:
+                section_text = text[piece_starts[start]:piece_ends[start]]
+            else:
+                section_text = " ".join(text[piece_starts[piece]:piece_ends[piece]]
+                                        for piece in range(start, end))
+            first_end = section_text.find(" ")
+            if first_end == -1:
+                first_end = len(section_text)
+            # the patterns only match words made of their characters
+            is_new_special = section_text[:1] in _NEW_SPECIAL_CHARS \
+                and new_special(section_text, 0, first_end) is not None
+            is_last_special = last_word[:1] in _LAST_SPECIAL_CHARS \
+                and last_special(last_word) is not None
+            if prev_code != code and is_new_special ^ is_last_special:
+                reconstructed_text[-1] += section_text
+                last_word = last_word + section_text if first_end == len(section_text) \
+                    else section_text[section_text.rfind(" ") + 1:]
+            else:
+                reconstructed_text.append(section_text)
+                last_word = section_text[section_text.rfind(" ") + 1:]
+            prev_code = code
+            start = end
+
+        return " ".join(reconstructed_text)
@@ -0,0 +1,105 @@
+"""
+Tests of the compact section representation.
+
+Run from the llm_requests folder:
+    python -m pytest section_array_test.py
+"""
+
+import copy
+import random
+
+import pytest
+
+import category_rules
+from category_rules import CategoryRule
+from output_conversion import parse_tagged_text, reconstruct_text, clean_up_categories, \
+    parse_and_clean_up
+from section_array import SectionArray
+
+from constants import TAGS
+
+TAGGED_TEXT = " Volal <pn>Jan  Novák</pn>, bytem <l>Praha 120 00 Vinohrady</l>( " \
+    "<e>kontakt jan@novak.cz</e>) <d>1. 5.</d>konec "
+
+WORDS = ["Ahoj", "praha", "123", "45", "a@b.cz", "www.x", ",", ".", "(", "čj.", "12/2020",
+         "Honza", "777", "888999", "\"", ""]
+
+
+def random_tagged_text(generator: random.Random) -> str:
+    """Returns a random text with matching, stray and unknown tags."""
+    tags = list(dict.fromkeys(TAGS.values())) + ["xx"]
+    parts = []
+    for _ in range(generator.randint(0, 12)):
+        value = generator.random()
+        if value < 0.2:
+            parts.append(f"<{generator.choice(tags)}>")
+        elif value < 0.4:
+            parts.append(f"</{generator.choice(tags)}>")
+        else:
+            parts.append(generator.choice(WORDS))
+    return generator.choice([" ", ""]).join(parts)
+
+
+def test_parse_pieces_point_into_the_text():
+    """The pieces are offsets into the response, the words are split out only on request."""
+    sections = SectionArray.from_tagged_text(TAGGED_TEXT)
+    assert sections.text is TAGGED_TEXT
+    assert list(sections) == [
+        (None, ["Volal"]), ("pn", ["Jan", "", "Novák"]), (None, [",", "bytem"]),
+        ("l", ["Praha", "120", "00", "Vinohrady"]), (None, ["("]),
+        ("e", ["kontakt", "jan@novak.cz"]), (None, [")"]), ("d", ["1.", "5."]),
+        (None, ["konec"])]
+    # ", bytem" is one piece between two tags
+    assert len(sections.piece_starts) == len(sections)
+    assert [section["words"] for section in sections.to_dicts()] == \
+        [section["words"] for section in parse_tagged_text(TAGGED_TEXT)]
+
+
+def test_dict_round_trip():
+    """from_dicts joins the words into a new buffer, to_dicts gives the same dictionaries."""
+    processed_data = [{"words": ["a", "b"], "category": "pn"}, {"words": [], "category": None},
+                      {"words": ["c"], "category": "unknown"}]
+    sections = SectionArray.from_dicts(processed_data)
+    assert sections.text == "a b c"
+    assert sections.to_dicts() == [{"category": "pn", "words": ["a", "b"]},
+                                   {"category": None, "words": []},
+                                   {"category": "unknown", "words": ["c"]}]
+
+
+def test_clean_up_and_reconstruct_match_the_dict_versions():
+    """Random tagged texts give the results of the dictionary functions."""
+    generator = random.Random(1)
+    for text in [TAGGED_TEXT] + [random_tagged_text(generator) for _ in range(3000)]:
+        processed_data = parse_tagged_text(text)
+        expected_text = reconstruct_text(processed_data)
+        expected_data = copy.deepcopy(processed_data)
+        clean_up_categories(expected_data)
+
+        sections = SectionArray.from_tagged_text(text)
+        assert sections.reconstruct_text() == expected_text, text
+        assert sections.clean_up_categories().to_dicts() == expected_data, text
+        assert sections.to_cleaned_dicts() == expected_data, text
+        assert parse_and_clean_up(text) == (expected_data, expected_text), text
+
+
+def test_words_created_by_a_rule_are_appended_to_the_buffer(monkeypatch):
+    """A rule returning words that are not in the section appends them to a copy of the text."""
+    def lower_rule(category, words):
+        return [(None, words[:1]), (category, [word.lower() for word in words[1:]])]
+    monkeypatch.setitem(category_rules.CATEGORY_RULES, TAGS["EMAIL"], CategoryRule(lower_rule))
+
+    sections = SectionArray.from_tagged_text("Pište na <e>adresu Jan@Novak.CZ</e> dnes")
+    cleaned = sections.clean_up_categories()
+    assert cleaned.to_dicts() == [{"category": None, "words": ["Pište", "na", "adresu"]},
+                                  {"category": "e", "words": ["jan@novak.cz"]},
+                                  {"category": None, "words": ["dnes"]}]
+    assert sections.text == "Pište na <e>adresu Jan@Novak.CZ</e> dnes"
+    assert cleaned.text.endswith(" jan@novak.cz")
+
+
+@pytest.mark.parametrize("text", ["", "   ", "<pn></pn>", "<pn> </pn> <xx> "])
+def test_texts_without_sections(text):
+    """Texts without words give no sections."""
+    sections = SectionArray.from_tagged_text(text)
+    assert sections.to_dicts() == parse_tagged_text(text)
+    assert sections.reconstruct_text() == reconstruct_text(parse_tagged_text(text))
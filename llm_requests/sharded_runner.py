@@ -0,0 +1,243 @@
+"""
+Module for processing one large input file in several processes at once.
+
+1. `shard_ranges` splits the unprocessed rest of the input file into byte
+   ranges with roughly equal word counts, moved to the nearest article end
+   (blank line) where possible.
+2. `run_sharded` starts one process per range. Each runs a PipelineRunner
+   limited to its range, with its own position file and outputs in the log
+   folder of "<input name>.shard-<i>", and its own share of the API keys.
+3. `merge_shards` stitches the shard outputs (main output and span logs, category
+   words, changes and quarantine logs) back into the outputs of the input file in order,
+   removes the shard folders and exports the main output.
+
+Interrupted shards continue from their own positions when `run_sharded` is run again,
+and an interrupted merge continues with the first shard not merged yet.
+"""
+
+import os
+import re
+import shutil
+import multiprocessing
+
+from word_offset_index import load_word_index
+from openai_api_buffer import OpenAIClientManager
+from pipeline_runner import PipelineRunner
+from output_conversion import get_latest_position, export_main_output
+from output_writer import OutputWriter
+
+from constants import API_INFO, OUTPUT_LOGS_FOLDER, MAIN_OUTPUT_LOG, MAIN_OUTPUT_SPANS, \
+    LOGS_CATEGORY_WORDS, LOGS_CHANGES, LOGS_QUARANTINE
+
+SHARD_COUNT = 4
+# how far past an even split a shard boundary may move to reach an article end
+SHARD_ALIGN_WINDOW = 64 * 1024
+
+_BLANK_LINE_PATTERN = re.compile(rb"\n[ \t\r]*\n")
+
+
+def shard_output_path(input_file_path: str, index: int) -> str:
+    """
+    Returns the path whose name selects the output folder of a shard
+    (the file itself does not exist).
+    """
+    return f"{input_file_path}.shard-{index:03d}"
+
+
+def shard_ranges(input_file_path: str, shards: int, start: int = 0,
+                 align_articles: bool = True) -> list[tuple[int, int]]:
+    """
+    Splits the input file from `start` into byte ranges with roughly equal word counts.
+    Every boundary is a word end position; with `align_articles` it is moved forward
+    to the last word before the next blank line, if there is one within SHARD_ALIGN_WINDOW.
+
+    :param input_file_path: Path to the input text file.
+    :param shards: Number of ranges.
+    :param start: Byte offset (word end) to start from.
+    :param align_articles: Move boundaries to article ends.
+    :return: List of (start, end) byte offsets.
+    """
+    index = load_word_index(input_file_path)
+    try:
+        first = index.words_before(start)
+        count = len(index)
+        bounds = [start]
+        with open(input_file_path, "rb") as file:
+            for part in range(1, shards):
+                word_index = first + (count - first) * part // shards
+                if word_index == 0:
+                    continue
+                bound = index[word_index - 1]
+
+                if align_articles:
+                    file.seek(bound)
+                    match = _BLANK_LINE_PATTERN.search(file.read(SHARD_ALIGN_WINDOW))
+                    if match:
+                        # word end positions include the first separator character
+                        blank_line_end = bound + match.start() + 2
+                        bound = index[index.words_before(blank_line_end) - 1]
+
+                if bound > bounds[-1]:
+                    bounds.append(bound)
+
+        end = index[count - 1] if count else start
+        if end > bounds[-1]:
+            bounds.append(end)
+        return list(zip(bounds, bounds[1:]))
+    finally:
+        index.close()
+
+
+def partition_api_info(configs: list[dict], parts: int, part: int) -> list[dict]:
+    """
+    Returns the API configs with every `parts`-th key, so that concurrent processes
+    do not share keys (and their rate limits). Falls back to all keys when there
+    are fewer keys than processes.
+
+    :param configs: API configs (see OpenAIClientManager).
+    :param parts: Number of processes.
+    :param part: Index of the process.
+    """
+    all_keys = [(config_index, key) for config_index, config in enumerate(configs)
+                for key in config.get("keys", [])]
+    if len(all_keys) < parts:
+        return configs
+
+    own_keys = all_keys[part::parts]
+    partitioned = []
+    for config_index, config in enumerate(configs):
+        keys = [key for key_config, key in own_keys if key_config == config_index]
+        if keys:
+            partitioned.append({**config, "keys": keys})
+    return partitioned
+
+
+def _run_shard(input_file_path: str, shards: int, index: int, start: int, end: int) -> None:
+    # pylint: disable=too-many-arguments
+    client_manager = OpenAIClientManager(partition_api_info(API_INFO, shards, index))
+    try:
+        PipelineRunner(client_manager, input_file_path, start_position=start,
+                       end_position=end,
+                       output_file_path=shard_output_path(input_file_path, index)).run()
+    finally:
+        client_manager.close()
+
+
+def run_sharded(input_file_path: str, shards: int = SHARD_COUNT) -> None:
+    """
+    Processes the rest of the input file in `shards` processes and merges the results.
+
+    The ranges are derived from the latest position of the input file, so they stay
+    the same when an interrupted run is started again (with the same shard count).
+
+    :param input_file_path: Path to the input text file.
+    :param shards: Number of processes.
+    """
+    start = get_latest_position(input_file_path)
+    ranges = shard_ranges(input_file_path, shards, start)
+    check_shard_folders(input_file_path, ranges)
+
+    processes = [
+        multiprocessing.Process(target=_run_shard,
+                                args=(input_file_path, len(ranges), index, shard_start, shard_end))
+        for index, (shard_start, shard_end) in enumerate(ranges)
+    ]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+
+    merge_shards(input_file_path, ranges)
+
+
+def _shard_folder(input_file_path: str, index: int) -> str:
+    shard_path = shard_output_path(input_file_path, index)
+    return os.path.join(OUTPUT_LOGS_FOLDER, os.path.basename(shard_path))
+
+
+def _read_shard_file(shard_folder: str, name: str) -> str | None:
+    path = os.path.join(shard_folder, name)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as file:
+        return file.read()
+
+
+def check_shard_folders(input_file_path: str, ranges: list[tuple[int, int]]) -> None:
+    """
+    Checks that the existing shard folders belong to the given ranges, i.e. that
+    an interrupted run is not continued with other ranges (e.g. another shard count).
+
+    :raises RuntimeError: If the position of a shard is outside its range.
+    """
+    for index, (start, end) in enumerate(ranges):
+        if not os.path.isdir(_shard_folder(input_file_path, index)):
+            continue
+        position = get_latest_position(shard_output_path(input_file_path, index))
+        if position > end or 0 < position < start:
+            raise RuntimeError(
+                f"Shard {index} is at {position}, outside its range {start} - {end}. "
+                f"Merge or remove the shard folders of the previous run first.")
+
+
+def merge_shards(input_file_path: str, ranges: list[tuple[int, int]]) -> None:
+    """
+    Appends the outputs of finished shards to the outputs of the input file, in order,
+    and removes the shard folders.
+
+    Every shard is merged through an OutputWriter of the input file and committed
+    together with the end of its range as the latest position, so a merge interrupted
+    in a shard is rolled back to the end of the previous one, and running the merge
+    again skips the shards merged already.
+
+    :param input_file_path: Path to the input text file.
+    :param ranges: Shard ranges from `shard_ranges`.
+    :raises RuntimeError: If a shard has not reached the end of its range,
+                          or the input file position is not at a shard boundary.
+    """
+    with OutputWriter(input_file_path) as writer:
+        position = writer.position
+
+    remaining = [(index, start, end) for index, (start, end) in enumerate(ranges)
+                 if end > position]
+    unfinished = [index for index, _, end in remaining
+                  if get_latest_position(shard_output_path(input_file_path, index)) < end]
+    if unfinished:
+        raise RuntimeError(f"Shards {unfinished} are not finished, run them again.")
+    if remaining and position != remaining[0][1]:
+        raise RuntimeError(f"The input file position {position} does not match "
+                           f"the start of shard {remaining[0][0]}.")
+
+    for index, start, end in remaining:
+        shard_folder = _shard_folder(input_file_path, index)
+        file_names = [MAIN_OUTPUT_LOG, MAIN_OUTPUT_SPANS]
+        if os.path.isdir(os.path.join(shard_folder, LOGS_CATEGORY_WORDS)):
+            file_names += [os.path.join(LOGS_CATEGORY_WORDS, name) for name in
+                           sorted(os.listdir(os.path.join(shard_folder, LOGS_CATEGORY_WORDS)))]
+
+        # a partly merged shard is not committed
+        with OutputWriter(input_file_path) as writer:
+            for file_name in file_names:
+                if os.path.exists(os.path.join(shard_folder, file_name)):
+                    writer.append_file(file_name, os.path.join(shard_folder, file_name))
+
+            header = f"===== shard {index}: {start} - {end} ====="
+            changes = _read_shard_file(shard_folder, LOGS_CHANGES)
+            writer.log_changes(header + "\n" + (changes or "").rstrip("\n"))
+            quarantine = _read_shard_file(shard_folder, LOGS_QUARANTINE)
+            if quarantine:
+                writer.log_quarantine(header + "\n" + quarantine.rstrip("\n"))
+            writer.advance(end)
+
+    # the merged shards are behind the latest position of the input file now
+    for index, _ in enumerate(ranges):
+        shutil.rmtree(_shard_folder(input_file_path, index), ignore_errors=True)
+
+    export_main_output(input_file_path)
+
+
+if __name__ == "__main__":
+    INPUT_FILE = \
+        r"" # <Cesta ke vstupnímu textovému souboru, který má být zpracován>
+
+    run_sharded(INPUT_FILE)
@@ -0,0 +1,205 @@
+"""
+Module for the span output mode.
+
+Instead of splitting the response into word lists (`parse_tagged_text`) and
+guessing the spacing back (`reconstruct_text`), the response is aligned with
+the input chunk: the tags are removed, the remaining words are matched to the
+input words, and every tagged section becomes a (start, end, category) span of
+character offsets into the input chunk. The unmatched words are the changes
+the model made, so no reconstruction is needed to check them.
+
+`spans_to_byte_offsets` moves the spans to byte offsets into the input file,
+which is what the span log `main_output_spans.jsonl` stores (one line per chunk,
+see `OutputWriter.write_spans`), so the spans can be used for redaction or
+validation directly on the input file.
+"""
+
+import os
+import re
+import json
+import bisect
+from difflib import SequenceMatcher
+
+from output_conversion import filter_section
+
+from constants import TAGS, OUTPUT_LOGS_FOLDER, MAIN_OUTPUT_SPANS
+
+_TAG_PATTERN = re.compile(r'<(/?)(\w+)>')
+_WORD_PATTERN = re.compile(r'\S+')
+_TAG_NAMES = frozenset(TAGS.values())
+
+
+def _strip_tags(text: str) -> tuple[str, list[tuple[int, int, str]]]:
+    """
+    Removes the tags like `parse_tagged_text` (nested and unknown tags are dropped,
+    an unclosed tag lasts until the end of the text).
+
+    :return: Text without the tags and the tagged ranges in it.
+    """
+    parts = []
+    length = 0
+    ranges = []
+    tag_stack = []
+    open_start = 0
+
+    pos = 0
+    for match in _TAG_PATTERN.finditer(text):
+        parts.append(text[pos:match.start()])
+        length += match.start() - pos
+        tag_is_closing, tag_name = match.groups()
+
+        if tag_is_closing:
+            if tag_stack and tag_stack[-1] == tag_name:
+                tag_stack.pop()
+                if not tag_stack:
+                    ranges.append((open_start, length, tag_name))
+        elif tag_name in _TAG_NAMES and not tag_stack:
+            open_start = length
+            tag_stack.append(tag_name)
+
+        pos = match.end()
+
+    parts.append(text[pos:])
+    length += len(text) - pos
+    if tag_stack:
+        ranges.append((open_start, length, tag_stack[0]))
+    return "".join(parts), ranges
+
+
+def _word_spans(text: str) -> tuple[list[str], list[int], list[int]]:
+    words, starts, ends = [], [], []
+    for match in _WORD_PATTERN.finditer(text):
+        words.append(match.group())
+        starts.append(match.start())
+        ends.append(match.end())
+    return words, starts, ends
+
+
+def parse_tagged_spans(text: str, input_text: str) \
+        -> tuple[list[tuple[int, int, str]], list[str], list[str]]:
+    # pylint: disable=too-many-locals
+    """
+    Parses a tagged response into spans of the input chunk.
+
+    A span boundary inside a word that the model kept unchanged maps to the same
+    character of the input word; a boundary on a changed word moves inwards to the
+    nearest unchanged word, and a section without any unchanged word is dropped.
+
+    Example:
+        Input:  "Ahoj já jsem <pn>Honza</pn>, jdu domu."
+                "Ahoj já jsem Honza, jdu domu."
+        Output: ([(13, 18, "pn")], [], [])
+
+    :param text: The response text containing tagged sections.
+    :param input_text: The input chunk.
+    :return: Spans (start, end, category) of character offsets into input_text,
+             words added and words removed by the model.
+    """
+    plain_text, ranges = _strip_tags(text)
+    words, starts, ends = _word_spans(plain_text)
+    input_words, input_starts, input_ends = _word_spans(input_text)
+
+    matched = {}
+    added, removed = [], []
+    opcodes = SequenceMatcher(None, words, input_words, autojunk=False).get_opcodes()
+    for tag, i1, i2, j1, j2 in opcodes:
+        if tag == "equal":
+            matched.update(zip(range(i1, i2), range(j1, j2)))
+        else:
+            added += words[i1:i2]
+            removed += input_words[j1:j2]
+
+    spans = []
+    for start, end, category in ranges:
+        # words overlapping the range, then the unchanged ones among them
+        first = bisect.bisect_right(ends, start)
+        last = bisect.bisect_left(starts, end) - 1
+        kept = [i for i in range(first, last + 1) if i in matched]
+        if not kept:
+            continue
+
+        i = kept[0]
+        span_start = input_starts[matched[i]] + max(start - starts[i], 0)
+        i = kept[-1]
+        span_end = input_ends[matched[i]] - max(ends[i] - end, 0)
+        if span_start < span_end:
+            spans.append((span_start, span_end, category))
+
+    return spans, added, removed
+
+
+def clean_up_spans(input_text: str, spans: list[tuple[int, int, str]]) \
+        -> list[tuple[int, int, str]]:
+    """
+    Applies the category filtering rules (see `filter_section`) to the words of the spans,
+    dropping or narrowing them like `clean_up_categories` does with the sections.
+
+    :param input_text: The input chunk.
+    :param spans: Spans from `parse_tagged_spans`.
+    :return: The cleaned-up spans.
+    """
+    cleaned = []
+    for start, end, category in spans:
+        words, starts, ends = _word_spans(input_text[start:end])
+        index = 0
+        for part_category, part_words in filter_section(category, words):
+            if part_category is not None and part_words:
+                cleaned.append((start + starts[index],
+                                start + ends[index + len(part_words) - 1], part_category))
+            index += len(part_words)
+    return cleaned
+
+
+def spans_to_byte_offsets(input_file_path: str, chunk_start: int, chunk_end: int,
+                          input_text: str, spans: list[tuple[int, int, str]]) \
+        -> list[tuple[int, int, str]]:
+    # pylint: disable=too-many-arguments
+    """
+    Converts spans of a chunk to byte offsets into the input file.
+
+    :param input_file_path: Path to the input text file.
+    :param chunk_start: Byte offset the chunk was read from.
+    :param chunk_end: Byte offset of the last word end of the chunk.
+    :param input_text: Text of the chunk (as returned by the reader).
+    :param spans: Spans of character offsets into input_text.
+    :return: Spans of byte offsets into the input file.
+    :raises ValueError: If a word of the chunk is not found in the file.
+    """
+    with open(input_file_path, "rb") as file:
+        file.seek(chunk_start)
+        data = file.read(chunk_end - chunk_start)
+
+    words, starts, _ = _word_spans(input_text)
+    byte_starts = []
+    cursor = 0
+    for word in words:
+        word_bytes = word.encode("utf-8")
+        index = data.find(word_bytes, cursor)
+        if index < 0:
+            raise ValueError(f"Word {word!r} of the chunk at {chunk_start} is not in the file.")
+        byte_starts.append(chunk_start + index)
+        cursor = index + len(word_bytes)
+
+    def byte_offset(char_offset: int) -> int:
+        i = bisect.bisect_right(starts, char_offset) - 1
+        return byte_starts[i] + len(input_text[starts[i]:char_offset].encode("utf-8"))
+
+    return [(byte_offset(start), byte_offset(end), category) for start, end, category in spans]
+
+
+def read_span_log(input_file_path: str):
+    """
+    Reads the span log of an input file.
+
+    :param input_file_path: The path to the input file.
+    :return: Generator of (start, end, category) byte offsets into the input file.
+    """
+    log_path = os.path.join(OUTPUT_LOGS_FOLDER, os.path.basename(input_file_path),
+                            MAIN_OUTPUT_SPANS)
+    if not os.path.exists(log_path):
+        return
+    with open(log_path, "r", encoding="utf-8") as file:
+        for line in file:
+            if line.strip():
+                for start, end, category in json.loads(line)["spans"]:
+                    yield start, end, category
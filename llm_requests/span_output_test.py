@@ -0,0 +1,75 @@
+"""
+Tests of the span output mode.
+
+Run from the llm_requests folder:
+    python -m pytest span_output_test.py
+"""
+
+from output_writer import OutputWriter
+from span_output import parse_tagged_spans, clean_up_spans, spans_to_byte_offsets, read_span_log
+from text_file_extraction import read_text_file_bytes
+
+INPUT_TEXT = "Úvod\r\nŘekl  Jiří Čermák:\r\n\r\nžluťoučký kůň z Brna.\r\n"
+CHUNK_START = len("Úvod\r\n".encode("utf-8"))
+RESPONSE = "Řekl <pn>Jiří Čermák</pn>: žluťoučký kůň z <l>Brna</l>."
+
+
+def span_texts(text: str, spans: list[tuple[int, int, str]]) -> list[tuple[str, str]]:
+    """Returns the (text, category) pairs of the spans."""
+    return [(text[start:end], category) for start, end, category in spans]
+
+
+def test_spans_are_offsets_into_the_input_chunk():
+    """Sections map to the unchanged input words, also with different whitespace."""
+    assert parse_tagged_spans("Ahoj já jsem <pn>Honza</pn>, jdu domu.",
+                              "Ahoj já jsem Honza, jdu domu.") == ([(13, 18, "pn")], [], [])
+
+    input_text = "Volal  Jan Novák\nz Prahy. Psal na jan@novak.cz"
+    spans, added, removed = parse_tagged_spans(
+        "Volal <pn>Jan Nowak</pn> z <l>Prahy</l>. <i>Psali</i> na <e>kontakt jan@novak.cz",
+        input_text)
+    # a changed word moves the boundary inwards, a section of changed words is dropped,
+    # a boundary inside an unchanged word keeps its character ("Prahy" of "Prahy."),
+    # an unclosed tag lasts until the end
+    assert spans == [(7, 10, "pn"), (19, 24, "l"), (34, 46, "e")]
+    assert span_texts(input_text, spans) == [("Jan", "pn"), ("Prahy", "l"),
+                                             ("jan@novak.cz", "e")]
+    assert added == ["Nowak", "Psali", "kontakt"]
+    assert removed == ["Novák", "Psal"]
+
+
+def test_nested_and_unknown_tags_are_dropped():
+    """Only the outermost known tag makes a span."""
+    spans, _, _ = parse_tagged_spans("<l>Bydlí v <pn>Praha</pn> 120 00</l> <xx>x</xx>",
+                                     "Bydlí v Praha 120 00 x")
+    assert spans == [(0, 20, "l")]
+
+
+def test_clean_up_spans_narrows_and_splits_them():
+    """The category rules work on the words of the spans like on the sections."""
+    input_text = "Bydlí v Praha 120 00, psal na adresu jan@novak.cz pan novák"
+    spans = [(0, 20, "l"), (30, 49, "e"), (50, 59, "pn")]
+    assert span_texts(input_text, clean_up_spans(input_text, spans)) == \
+        [("Bydlí v Praha", "l"), ("120 00", "z"), ("jan@novak.cz", "e")]
+
+
+def test_spans_to_byte_offsets(input_file):
+    """Character offsets of a chunk move to byte offsets into the file (CRLF, diacritics)."""
+    with open(input_file, "wb") as file:
+        file.write(INPUT_TEXT.encode("utf-8"))
+    chunk, positions = read_text_file_bytes(input_file, CHUNK_START, 100)
+    spans = clean_up_spans(chunk, parse_tagged_spans(RESPONSE, chunk)[0])
+    assert span_texts(chunk, spans) == [("Jiří Čermák", "pn"), ("Brna", "l")]
+
+    byte_spans = spans_to_byte_offsets(input_file, CHUNK_START, positions[-1], chunk, spans)
+    with open(input_file, "rb") as file:
+        data = file.read()
+    assert [(data[start:end].decode("utf-8"), category) for start, end, category in byte_spans] \
+        == [("Jiří Čermák", "pn"), ("Brna", "l")]
+
+    # the span log keeps the byte offsets
+    writer = OutputWriter(input_file)
+    writer.write_spans(CHUNK_START, positions[-1], byte_spans)
+    writer.write_chunk([{"words": chunk.split(), "category": None}], positions[-1])
+    writer.close()
+    assert list(read_span_log(input_file)) == byte_spans
@@ -0,0 +1,134 @@
+"""
+Module for checking a streamed LLM response against the input text while it is generated.
+
+StreamingDivergenceMonitor receives the response deltas, drops reasoning
+`<think>` blocks on the fly, strips the category tags and aligns the
+completed words against the input words. As soon as the estimated number
+of added or removed words exceeds the resend tolerances, the caller can
+cancel the generation instead of waiting for the whole response.
+
+The alignment is a greedy approximation of `text_changes_check`;
+the full diff is still done on the finished response.
+"""
+
+import re
+
+_TAG_PATTERN = re.compile(r"</?\w+>")
+_PARTIAL_TAG_PATTERN = re.compile(r"<[/\w]*$")
+_THINK_OPEN = "<think>"
+_THINK_CLOSE = "</think>"
+
+
+class StreamingDivergenceMonitor:
+    # pylint: disable=too-many-instance-attributes
+    """
+    Incrementally aligns a streamed tagged response with the input text.
+
+    Usage:
+        monitor = StreamingDivergenceMonitor(input_text, 15, 15)
+        for delta in stream:
+            if monitor.feed(delta):
+                break  # diverged, cancel the request
+        response_text = monitor.finish()
+    """
+
+    def __init__(self, input_text: str, added_tol: int, removed_tol: int,
+                 lookahead: int | None = None):
+        """
+        :param input_text: Text sent to the model.
+        :param added_tol: Maximum number of added words.
+        :param removed_tol: Maximum number of removed words.
+        :param lookahead: How many input words ahead a mismatched word is searched for,
+                          defaults to the larger tolerance.
+        """
+        self._input_words = input_text.split()
+        self.added_tol = added_tol
+        self.removed_tol = removed_tol
+        self._lookahead = lookahead or max(added_tol, removed_tol, 1)
+
+        self._pending = ""        # raw text that may still end with a partial tag
+        self._in_think = False
+        self._response = []       # visible response text (tags kept, reasoning dropped)
+        self._partial_word = ""   # tag-free text of a word that is not finished yet
+        self._input_index = 0
+
+        self.added = 0
+        self.removed = 0
+
+    @property
+    def diverged(self) -> bool:
+        """True if the response already exceeds one of the tolerances."""
+        return self.added > self.added_tol or self.removed > self.removed_tol
+
+    def feed(self, delta: str) -> bool:
+        """
+        Processes the next piece of the streamed response.
+
+        :param delta: Response text delta.
+        :return: True if the response diverged and generation should be cancelled.
+        """
+        self._pending += delta
+
+        while self._pending:
+            if self._in_think:
+                end = self._pending.find(_THINK_CLOSE)
+                if end == -1:
+                    # keep a possible beginning of the closing tag
+                    self._pending = self._pending[-(len(_THINK_CLOSE) - 1):]
+                    break
+                self._pending = self._pending[end + len(_THINK_CLOSE):]
+                self._in_think = False
+                continue
+
+            start = self._pending.find(_THINK_OPEN)
+            if start != -1:
+                self._add_visible(self._pending[:start])
+                self._pending = self._pending[start + len(_THINK_OPEN):]
+                self._in_think = True
+                continue
+
+            partial = _PARTIAL_TAG_PATTERN.search(self._pending)
+            hold = partial.start() if partial else len(self._pending)
+            self._add_visible(self._pending[:hold])
+            self._pending = self._pending[hold:]
+            break
+
+        return self.diverged
+
+    def finish(self) -> str:
+        """
+        Processes the rest of the response.
+
+        :return: The visible response text (with tags, without reasoning blocks).
+        """
+        if not self._in_think:
+            self._add_visible(self._pending)
+        self._pending = ""
+        if self._partial_word:
+            self._align_word(self._partial_word)
+            self._partial_word = ""
+        return "".join(self._response)
+
+    def _add_visible(self, text: str) -> None:
+        if not text:
+            return
+        self._response.append(text)
+
+        words_text = self._partial_word + _TAG_PATTERN.sub("", text)
+        words = words_text.split()
+        if words and not words_text[-1].isspace():
+            self._partial_word = words.pop()
+        else:
+            self._partial_word = ""
+
+        for word in words:
+            self._align_word(word)
+
+    def _align_word(self, word: str) -> None:
+        end = min(self._input_index + self._lookahead + 1, len(self._input_words))
+        for i in range(self._input_index, end):
+            if self._input_words[i] == word:
+                self.removed += i - self._input_index
+                self._input_index = i + 1
+                return
+        self.added += 1
@@ -0,0 +1,66 @@
+"""
+Tests of the streamed response divergence monitor.
+
+Run from the llm_requests folder:
+    python -m pytest stream_alignment_test.py
+"""
+
+import pytest
+
+from stream_alignment import StreamingDivergenceMonitor
+
+INPUT_TEXT = "Jan Novák přijel do Prahy v pondělí a odjel v úterý večer ."
+RESPONSE = "<person>Jan Novák</person> přijel do <place>Prahy</place> v pondělí " \
+           "a odjel v úterý večer ."
+
+
+def feed_all(monitor: StreamingDivergenceMonitor, response: str, step: int) -> bool:
+    """Feeds the response in deltas of `step` characters, returns True on divergence."""
+    return any(monitor.feed(response[i:i + step]) for i in range(0, len(response), step))
+
+
+@pytest.mark.parametrize("step", [1, 3, 7, 1000])
+def test_matching_response(step):
+    """A tagged copy of the input does not diverge, whatever the delta boundaries are."""
+    monitor = StreamingDivergenceMonitor(INPUT_TEXT, 2, 2)
+    assert not feed_all(monitor, RESPONSE, step)
+    assert monitor.finish() == RESPONSE
+    assert (monitor.added, monitor.removed) == (0, 0)
+
+
+@pytest.mark.parametrize("step", [1, 4, 1000])
+def test_reasoning_is_dropped(step):
+    """<think> blocks are neither aligned nor part of the finished response."""
+    monitor = StreamingDivergenceMonitor(INPUT_TEXT, 2, 2)
+    response = "<think>Úplně jiná slova, která nejsou ve vstupu.</think>" + RESPONSE
+    assert not feed_all(monitor, response, step)
+    assert monitor.finish() == RESPONSE
+    assert (monitor.added, monitor.removed) == (0, 0)
+
+
+def test_added_words_diverge():
+    """Words that are not in the input are counted as added."""
+    monitor = StreamingDivergenceMonitor(INPUT_TEXT, 2, 10)
+    assert not monitor.feed("Jan Novák a jeho bratr ")
+    assert monitor.added == 2
+    assert monitor.feed("Petr přijel ")
+    assert monitor.diverged
+
+
+def test_removed_words_diverge():
+    """Skipped input words are counted as removed once a later word matches."""
+    monitor = StreamingDivergenceMonitor(INPUT_TEXT, 10, 3)
+    assert not monitor.feed("Jan Novák do Prahy ")
+    assert monitor.removed == 1
+    assert monitor.feed("odjel ")
+    assert (monitor.added, monitor.removed) == (0, 4)
+
+
+def test_unfinished_word_is_aligned_on_finish():
+    """The last word is only aligned once the response ends."""
+    monitor = StreamingDivergenceMonitor("Ahoj světe", 0, 0)
+    assert not monitor.feed("Ahoj svě")
+    assert not monitor.feed("ť")
+    assert monitor.added == 0
+    monitor.finish()
+    assert monitor.diverged
@@ -4,8 +4,34 @@ Module for reading a specified number of valid characters from a text file.
 This module provides a function to extract a given number of characters from a text file,
 ignoring line breaks and reducing consecutive spaces to a single space.
 It ensures that the extracted text does not end in the middle of a word.
+
+`read_text_file` walks the file character by character in text mode, while
+`read_text_file_bytes` reads it in large binary blocks and returns real byte offsets.
+`TextChunkReader` yields the same chunks one after another from a single open file handle,
+or, in token-budget mode, chunks cut preferably at article and sentence boundaries.
 """
 
+import codecs
+import re
+from collections import deque
+
+DEFAULT_BLOCK_SIZE = 1 << 13
+DEFAULT_BYTES_PER_TOKEN = 3.0
+
+# token-budget chunks are cut at an article (or sentence) end only if it keeps
+# at least this fraction of the budget, otherwise at the last whole word
+BOUNDARY_MIN_FILL = 0.5
+
+_WORD_PATTERN = re.compile(r"\S+")
+_SENTENCE_END_PATTERN = re.compile(r"[^\W\d_]{2,}[.!?…]+[\"'»“”)]*$")
+
+# abbreviations followed by a capitalised word that do not end a sentence
+_ABBREVIATIONS = {
+    "ing", "mgr", "bc", "judr", "mudr", "phdr", "rndr", "paeddr", "doc", "prof", "csc",
+    "phd", "dr", "tj", "tzn", "např", "atd", "apod", "čj", "sp", "zn", "odst", "písm",
+    "sb", "ul", "nám", "tel", "st", "mil", "tis", "kč", "mr", "ms", "sv", "gen", "plk"
+}
+
 
 def read_text_file(file_path: str, position: int, char_count: int) -> tuple[str, list[int]]:
     """
@@ -68,6 +94,383 @@ def read_text_file(file_path: str, position: int, char_count: int) -> tuple[str,
     return "".join(result), word_end_positions
 
 
+def _printable_spans(token: str, offset: int) -> list[tuple[int, int]]:
+    """
+    Splits a whitespace-free token on non-printable characters,
+    which the reader treats the same way as whitespace.
+
+    :param token: Token matched by `_WORD_PATTERN`.
+    :param offset: Index of the token in the decoded buffer.
+    :return: List of (start, end) buffer indices of the printable parts.
+    """
+    spans = []
+    start = None
+    for i, char in enumerate(token):
+        if char.isprintable():
+            if start is None:
+                start = i
+        elif start is not None:
+            spans.append((offset + start, offset + i))
+            start = None
+    if start is not None:
+        spans.append((offset + start, offset + len(token)))
+    return spans
+
+
+def _iter_words(file, block_size: int = DEFAULT_BLOCK_SIZE):
+    # pylint: disable=too-many-locals
+    """
+    Yields the words of a binary file handle, starting at its current position.
+
+    Each item is a tuple (word, end_position, separator_length, at_eof, paragraph_break):
+      - end_position: byte offset right after the first separator character following
+        the word, or the end of the file (the same place `read_text_file` records)
+      - separator_length: number of separator characters after the word ("\\r\\n" counts as one)
+      - at_eof: True if nothing but separators follows the word
+      - paragraph_break: True if the separator contains a blank line (end of an article)
+
+    :param file: File opened in binary mode.
+    :param block_size: Number of bytes read from the file at once.
+    """
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    buffer = ""
+    cursor_index = 0              # buffer index whose byte offset is known ...
+    cursor_position = file.tell() # ... and that byte offset, advanced lazily
+    eof = False
+    pending = None                # (word, end index) waiting for the separator that follows it
+    index = 0
+
+    def byte_offset(buffer_end: int) -> int:
+        nonlocal cursor_index, cursor_position
+        cursor_position += len(buffer[cursor_index:buffer_end].encode("utf-8"))
+        cursor_index = buffer_end
+        return cursor_position
+
+    def separator_info(start: int, end: int) -> tuple[int, int, bool]:
+        separator = buffer[start:end]
+        if not separator:
+            return byte_offset(start), 0, False
+        first = 2 if separator.startswith("\r\n") else 1
+        position = byte_offset(start) + len(separator[:first].encode("utf-8"))
+        return position, len(separator) - separator.count("\r\n"), separator.count("\n") > 1
+
+    while True:
+        match = _WORD_PATTERN.search(buffer, index)
+
+        if not eof and (match is None or match.end() == len(buffer)):
+            block = file.read(block_size)
+            eof = not block
+            keep = pending[1] if pending else index
+            byte_offset(keep)
+            buffer = buffer[keep:] + decoder.decode(block, final=eof)
+            index -= keep
+            cursor_index = 0
+            if pending:
+                pending = (pending[0], 0)
+            continue
+
+        if match is None:
+            break
+
+        token = match.group()
+        if token.isprintable():
+            spans = [match.span()]
+        else:
+            spans = _printable_spans(token, match.start())
+
+        for start, end in spans:
+            if pending:
+                position, separator_length, paragraph_break = separator_info(pending[1], start)
+                yield pending[0], position, separator_length, False, paragraph_break
+            pending = (buffer[start:end], end)
+
+        index = match.end()
+
+    if pending:
+        position, separator_length, paragraph_break = separator_info(pending[1], len(buffer))
+        yield pending[0], position, separator_length, True, paragraph_break
+
+
+def _collect_chunk(words, char_count: int) -> tuple[str, list[int]]:
+    # pylint: disable=too-many-return-statements
+    """
+    Builds one chunk of text from the word stream of `_iter_words`,
+    following the same cut-off rules as `read_text_file`.
+
+    :param words: Iterator produced by `_iter_words`.
+    :param char_count: Number of printable characters to read.
+    :return: Tuple of the text read and list of byte positions at the ends of words.
+    """
+    result = []
+    word_end_positions = []
+    valid_chars_seen = 0
+
+    for word, end_position, separator_length, at_eof, _ in words:
+        if valid_chars_seen + len(word) > char_count:
+            # the word would be cut in half
+            if result:
+                return " ".join(result), word_end_positions
+            return word[:char_count], word_end_positions
+
+        valid_chars_seen += len(word)
+
+        if separator_length == 0:
+            # EOF right after the word
+            result.append(word)
+            word_end_positions.append(end_position)
+            return " ".join(result), word_end_positions
+
+        if valid_chars_seen >= char_count:
+            # the separator after the word already exceeds the limit
+            if result:
+                return " ".join(result), word_end_positions
+            return word, word_end_positions
+
+        result.append(word)
+        word_end_positions.append(end_position)
+        valid_chars_seen += 1
+
+        if at_eof:
+            if separator_length == 1 or valid_chars_seen < char_count:
+                return " ".join(result) + " ", word_end_positions
+            return " ".join(result), word_end_positions
+
+    return " ".join(result), word_end_positions
+
+
+def estimate_tokens(text: str, bytes_per_token: float = DEFAULT_BYTES_PER_TOKEN) -> int:
+    """
+    Offline approximation of the number of tokens of a word or text,
+    based on its UTF-8 length (diacritics usually take extra tokens).
+
+    :param text: Word or text.
+    :param bytes_per_token: Average number of UTF-8 bytes per token for the model.
+    :return: Estimated token count (at least 1 for a non-empty text).
+    """
+    if not text:
+        return 0
+    return max(1, round((len(text.encode("utf-8")) + 1) / bytes_per_token))
+
+
+def _is_sentence_end(word: str) -> bool:
+    match = _SENTENCE_END_PATTERN.search(word)
+    if not match:
+        return False
+    return word.rstrip(".!?…\"'»“”)").lower() not in _ABBREVIATIONS
+
+
+def _collect_token_chunk(words, token_budget: int,
+                         bytes_per_token: float) -> tuple[str, list[int], str]:
+    # pylint: disable=too-many-locals
+    """
+    Builds one chunk of at most `token_budget` estimated tokens from the word stream
+    of `_iter_words`. The chunk is cut at the last article end (blank line) or, failing that,
+    the last sentence end, as long as the cut keeps at least BOUNDARY_MIN_FILL of the budget.
+
+    :param words: Iterator produced by `_iter_words`.
+    :param token_budget: Maximum estimated number of tokens in the chunk.
+    :param bytes_per_token: Average number of UTF-8 bytes per token for the model.
+    :return: Tuple of the text read, list of byte positions at the ends of words
+             and the kind of boundary the chunk ends at ("article", "sentence", "word", "eof").
+    """
+    result = []
+    word_end_positions = []
+    tokens = 0
+    article_cut = (0, 0)   # (word count, tokens)
+    sentence_cut = (0, 0)
+    sentence_candidate = False
+
+    for word, end_position, _, at_eof, paragraph_break in words:
+        cost = estimate_tokens(word, bytes_per_token)
+        if result and tokens + cost > token_budget:
+            break
+
+        if sentence_candidate and word[0].isupper():
+            sentence_cut = (len(result), tokens)
+
+        result.append(word)
+        word_end_positions.append(end_position)
+        tokens += cost
+
+        if at_eof:
+            return " ".join(result), word_end_positions, "eof"
+
+        if paragraph_break:
+            article_cut = (len(result), tokens)
+        sentence_candidate = _is_sentence_end(word)
+    else:
+        return " ".join(result), word_end_positions, "eof"
+
+    min_tokens = token_budget * BOUNDARY_MIN_FILL
+    cut, boundary = len(result), "word"
+    if article_cut[0] and article_cut[1] >= min_tokens:
+        cut, boundary = article_cut[0], "article"
+    elif sentence_cut[0] and sentence_cut[1] >= min_tokens:
+        cut, boundary = sentence_cut[0], "sentence"
+
+    return " ".join(result[:cut]), word_end_positions[:cut], boundary
+
+
+def read_text_file_bytes(file_path: str, position: int, char_count: int,
+                         block_size: int = DEFAULT_BLOCK_SIZE) -> tuple[str, list[int]]:
+    """
+    Reads a section of the file from a given byte position, ensuring whole words are not split.
+
+    Returns the same text as `read_text_file` (collapsed whitespace, non-printable characters
+    treated as spaces), but reads the file in binary blocks and the returned word end
+    positions are real byte offsets into the file instead of text-mode tell() cookies.
+
+    :param file_path: Path to the text file.
+    :param position: Starting byte offset in the file.
+    :param char_count: Number of printable characters to read.
+    :param block_size: Number of bytes read from the file at once.
+    :return: Tuple of the text read and list of byte positions at the ends of words.
+    """
+    with open(file_path, "rb") as file:
+        file.seek(position)
+        return _collect_chunk(_iter_words(file, block_size), char_count)
+
+
+class TextChunkReader:
+    # pylint: disable=too-many-instance-attributes
+    """
+    Reads consecutive text chunks from a single open file handle.
+
+    Each chunk is the same (text, word_end_positions) tuple `read_text_file_bytes` would return
+    for the current position, but the file stays open and already decoded words are kept,
+    so moving back to a word end of the last chunk (resend, overlap rewind) does not touch
+    the file again.
+
+    With `token_budget` set, chunks are sized by estimated tokens instead of characters and cut
+    at article/sentence ends where possible (see `last_boundary`). `bytes_sent` and
+    `bytes_resent` count the input bytes handed out and the bytes handed out again after
+    seeking back. With `end` set, words ending after that byte offset are not read
+    (the reader behaves as if the file ended there).
+
+    Usage:
+        with TextChunkReader(path, 1000, position) as reader:
+            for text, positions in reader:
+                ...
+                reader.seek(positions[reverse_index])
+    """
+
+    def __init__(self, file_path: str, char_count: int, position: int = 0,
+                 block_size: int = DEFAULT_BLOCK_SIZE, token_budget: int | None = None,
+                 bytes_per_token: float = DEFAULT_BYTES_PER_TOKEN, end: int | None = None):
+        # pylint: disable=too-many-arguments
+        # pylint: disable=too-many-positional-arguments
+        """
+        :param file_path: Path to the text file.
+        :param char_count: Default number of printable characters per chunk.
+        :param position: Starting byte offset in the file.
+        :param block_size: Number of bytes read from the file at once.
+        :param token_budget: Estimated tokens per chunk, enables token-budget chunking.
+        :param bytes_per_token: Average number of UTF-8 bytes per token for the model.
+        :param end: Byte offset of a word end where reading stops (None for the end of the file).
+        """
+        self.char_count = char_count
+        self.token_budget = token_budget
+        self.bytes_per_token = bytes_per_token
+        self.end = end
+        self.position = position
+        self.last_boundary = None
+        self.bytes_sent = 0
+        self.bytes_resent = 0
+        self._block_size = block_size
+        self._file = open(file_path, "rb") # pylint: disable=consider-using-with
+        self._words = iter(())
+        self._queue = deque()   # already decoded words following self.position
+        self._history = []      # words of the last chunk, for rewinds
+        self._seek_file(position)
+
+    def _seek_file(self, position: int) -> None:
+        self._file.seek(position)
+        self._words = _iter_words(self._file, self._block_size)
+        self._queue.clear()
+        self._history = []
+
+    def _next_words(self, consumed: list):
+        while True:
+            if self._queue:
+                word = self._queue.popleft()
+            else:
+                word = next(self._words, None)
+                if word is None:
+                    return
+            if self.end is not None and word[1] > self.end:
+                self._queue.appendleft(word)
+                return
+            consumed.append(word)
+            yield word
+
+    def read_chunk(self, char_count: int | None = None) -> tuple[str, list[int]]:
+        """
+        Reads the next chunk from the current position and moves to its last word end.
+
+        :param char_count: Number of printable characters to read, defaults to self.char_count.
+        :return: Tuple of the text read and list of byte positions at the ends of words.
+        """
+        start = self.position
+        consumed = []
+        if self.token_budget and not char_count:
+            text, word_end_positions, self.last_boundary = _collect_token_chunk(
+                self._next_words(consumed), self.token_budget, self.bytes_per_token)
+        else:
+            text, word_end_positions = _collect_chunk(
+                self._next_words(consumed), char_count or self.char_count)
+            self.last_boundary = "word"
+
+        # words read ahead of the last word end are served again by the next chunk
+        self._queue.extendleft(reversed(consumed[len(word_end_positions):]))
+        self._history = consumed[:len(word_end_positions)]
+        if word_end_positions:
+            self.position = word_end_positions[-1]
+            self.bytes_sent += self.position - start
+
+        return text, word_end_positions
+
+    def seek(self, position: int) -> None:
+        """
+        Moves the reader to a byte offset. Word end positions of the last chunk
+        are served from memory, any other offset seeks the underlying file.
+
+        :param position: Byte offset of a word end (or 0).
+        """
+        if position == self.position:
+            return
+        if position < self.position:
+            self.bytes_resent += self.position - position
+
+        for i, word in enumerate(self._history):
+            if word[1] == position:
+                self._queue.extendleft(reversed(self._history[i + 1:]))
+                self._history = self._history[:i + 1]
+                self.position = position
+                return
+
+        self._seek_file(position)
+        self.position = position
+
+    def close(self) -> None:
+        """Closes the underlying file."""
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self) -> tuple[str, list[int]]:
+        start = self.position
+        text, word_end_positions = self.read_chunk()
+        if not word_end_positions or word_end_positions[-1] == start:
+            raise StopIteration
+        return text, word_end_positions
+
 
 
 
@@ -0,0 +1,77 @@
+"""
+Micro-benchmark comparing the character-by-character `read_text_file`
+with the block based `read_text_file_bytes` and `TextChunkReader` on the validation text.
+
+All readers are used the same way as in continuous_llm_requests.py:
+the whole file is consumed chunk by chunk, each chunk starting at the
+last word end position of the previous one.
+"""
+
+import os
+import time
+
+from text_file_extraction import read_text_file, read_text_file_bytes, TextChunkReader
+
+BENCHMARK_FILE = os.path.join(os.path.dirname(__file__), "..", "validation_text.txt")
+CHUNK_CHAR_LENGTH = 1000
+REPEATS = 5
+
+
+def read_whole_file(reader, file_path: str, char_count: int) -> list[str]:
+    """
+    Reads the whole file in chunks using the given reader function.
+
+    :param reader: read_text_file or read_text_file_bytes.
+    :param file_path: Path to the text file.
+    :param char_count: Number of printable characters per chunk.
+    :return: List of the text chunks.
+    """
+    chunks = []
+    position = 0
+    while True:
+        text, positions = reader(file_path, position, char_count)
+        if not positions or positions[-1] == position:
+            break
+        chunks.append(text)
+        position = positions[-1]
+    return chunks
+
+
+def read_whole_file_streaming(file_path: str, char_count: int) -> list[str]:
+    """
+    Reads the whole file in chunks using a single TextChunkReader.
+
+    :param file_path: Path to the text file.
+    :param char_count: Number of printable characters per chunk.
+    :return: List of the text chunks.
+    """
+    with TextChunkReader(file_path, char_count) as reader:
+        return [text for text, _ in reader]
+
+
+def best_time(reader, file_path: str, char_count: int) -> float:
+    """Returns the best wall time of REPEATS full passes over the file."""
+    times = []
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        if reader is TextChunkReader:
+            read_whole_file_streaming(file_path, char_count)
+        else:
+            read_whole_file(reader, file_path, char_count)
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+if __name__ == "__main__":
+    old_chunks = read_whole_file(read_text_file, BENCHMARK_FILE, CHUNK_CHAR_LENGTH)
+    new_chunks = read_whole_file(read_text_file_bytes, BENCHMARK_FILE, CHUNK_CHAR_LENGTH)
+    stream_chunks = read_whole_file_streaming(BENCHMARK_FILE, CHUNK_CHAR_LENGTH)
+    print(f"Chunks: {len(old_chunks)} / {len(new_chunks)} / {len(stream_chunks)}, "
+          f"identical: {old_chunks == new_chunks == stream_chunks}")
+
+    old_time = best_time(read_text_file, BENCHMARK_FILE, CHUNK_CHAR_LENGTH)
+    new_time = best_time(read_text_file_bytes, BENCHMARK_FILE, CHUNK_CHAR_LENGTH)
+    stream_time = best_time(TextChunkReader, BENCHMARK_FILE, CHUNK_CHAR_LENGTH)
+    print(f"read_text_file:       {old_time * 1000:8.2f} ms")
+    print(f"read_text_file_bytes: {new_time * 1000:8.2f} ms ({old_time / new_time:.1f}x)")
+    print(f"TextChunkReader:      {stream_time * 1000:8.2f} ms ({old_time / stream_time:.1f}x)")
@@ -0,0 +1,152 @@
+"""
+Tests of the chunk readers of text_file_extraction.py.
+
+Run from the llm_requests folder:
+    python -m pytest text_file_extraction_test.py
+"""
+
+import random
+
+import pytest
+
+from text_file_extraction import read_text_file, read_text_file_bytes, TextChunkReader, \
+    estimate_tokens
+
+WORDS = ["Honza", "jel", "do", "Prahy.", "Vrátil", "se", "až", "večer.", "Ing.", "Novák",
+         "řekl:", "„Ano“", "č.", "j.", "12/2024", "—", "slovo slovo", "a\u0007b",
+         "nejneobhospodařovávatelnějšími"]
+SEPARATORS = [" ", " ", " ", "  ", "\n", "\t", " \n", "\n\n", "\r\n", "\r\n\r\n"]
+
+
+def random_text(seed: int, word_count: int = 400) -> str:
+    """Returns a random text of WORDS and SEPARATORS (with articles and sentences)."""
+    generator = random.Random(seed)
+    parts = []
+    for _ in range(word_count):
+        parts += [generator.choice(WORDS), generator.choice(SEPARATORS)]
+    return "".join(parts[:-1]) + generator.choice(["", "\n", " "])
+
+
+@pytest.fixture(name="text_file")
+def fixture_text_file(tmp_path):
+    """Returns a function writing a text (bytes as they are) to a file."""
+    def write(text: str) -> str:
+        path = tmp_path / "text.txt"
+        path.write_bytes(text.encode("utf-8"))
+        return str(path)
+    return write
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_bytes_reader_matches_text_mode_reader(text_file, seed):
+    """The block reader returns the chunks and word end positions of the text-mode reader."""
+    path = text_file(random_text(seed).replace("\r\n", "\n"))
+    generator = random.Random(seed)
+    position = 0
+    while True:
+        char_count = generator.choice([1, 5, 30, 200])
+        expected = read_text_file(path, position, char_count)
+        assert read_text_file_bytes(path, position, char_count, block_size=16) == expected
+        if not expected[1] or expected[1][-1] == position:
+            break
+        position = expected[1][-1]
+
+
+@pytest.mark.parametrize("seed", range(10))
+def test_chunk_reader_matches_bytes_reader(text_file, seed):
+    """TextChunkReader gives the chunks of read_text_file_bytes, also after rewinds and seeks."""
+    path = text_file(random_text(seed))
+    _, all_positions = read_text_file_bytes(path, 0, 1 << 20)
+    generator = random.Random(seed)
+    resent = 0
+    seeks = 0
+    with TextChunkReader(path, 100, block_size=32) as reader:
+        while True:
+            char_count = generator.choice([None, 40])
+            start = reader.position
+            chunk = reader.read_chunk(char_count)
+            assert chunk == read_text_file_bytes(path, start, char_count or 100)
+            text, positions = chunk
+            if not positions or positions[-1] == start:
+                break
+
+            if generator.random() < 0.3 and len(positions) > 1:
+                target = generator.choice(positions[:-1])   # rewind within the last chunk
+            elif generator.random() < 0.1 and seeks < 5:
+                target = generator.choice(all_positions)    # anywhere in the file
+                seeks += 1
+            else:
+                continue
+            resent += max(0, reader.position - target)
+            reader.seek(target)
+            assert reader.position == target
+        assert reader.bytes_resent == resent
+        assert text == "" or positions[-1] == all_positions[-1]
+
+
+def test_chunk_reader_sequence(text_file):
+    """Consecutive chunks continue at the last word end of the previous chunk."""
+    path = text_file(random_text(1))
+    position = 0
+    expected = []
+    while True:
+        text, positions = read_text_file_bytes(path, position, 100)
+        if not positions or positions[-1] == position:
+            break
+        expected.append((text, positions))
+        position = positions[-1]
+
+    with TextChunkReader(path, 100) as reader:
+        assert list(reader) == expected
+        assert reader.bytes_sent == position
+
+
+def test_chunk_reader_stops_at_end(text_file):
+    """With `end` set, no word ending after it is read, and the reader stops there."""
+    text = random_text(2)
+    path = text_file(text)
+    _, all_positions = read_text_file_bytes(path, 0, len(text))
+    end = all_positions[len(all_positions) // 2]
+
+    with TextChunkReader(path, 100, end=end) as reader:
+        chunks = list(reader)
+    positions = [position for _, chunk_positions in chunks for position in chunk_positions]
+    assert positions == [position for position in all_positions if position <= end]
+    assert " ".join(chunk for chunk, _ in chunks).split() == \
+        read_text_file_bytes(path, 0, len(text))[0].split()[:len(positions)]
+
+
+def separator_after(data: bytes, position: int) -> bytes:
+    """Returns the whole separator after the word ending at a word end position."""
+    start = position - 2 if data[position - 2:position] == b"\r\n" else position - 1
+    rest = data[start:]
+    return rest[:len(rest) - len(rest.lstrip())]
+
+
+@pytest.mark.parametrize("token_budget", [20, 60, 150])
+def test_token_budget_chunks(text_file, token_budget):
+    """Token-budget chunks stay within the budget, cover the text and end at their boundary."""
+    text = random_text(3, 1500)
+    path = text_file(text)
+    data = text.encode("utf-8")
+    words = read_text_file_bytes(path, 0, len(text))[0].split()
+
+    chunk_words = []
+    boundaries = set()
+    with TextChunkReader(path, 100, token_budget=token_budget, bytes_per_token=3.0) as reader:
+        for chunk, positions in reader:
+            tokens = sum(estimate_tokens(word, 3.0) for word in chunk.split())
+            assert tokens <= token_budget or len(positions) == 1
+            assert len(chunk.split()) == len(positions)
+
+            boundaries.add(reader.last_boundary)
+            separator = separator_after(data, positions[-1])
+            if reader.last_boundary == "article":
+                assert separator.count(b"\n") > 1
+            elif reader.last_boundary == "sentence":
+                assert chunk.split()[-1].rstrip("\"'»“”)")[-1] in ".!?…"
+                assert separator.count(b"\n") <= 1
+            chunk_words += chunk.split()
+
+    assert chunk_words == words
+    assert {"article", "eof"} <= boundaries
@@ -0,0 +1,200 @@
+"""
+Module for a persistent index of word end byte offsets of an input text file.
+
+The index is built once by a single pass of the block reader and stored in a
+sidecar file next to the input (`<input>.wordidx`). Later runs memory-map the
+sidecar, so any word boundary, chunk boundary or progress percentage can be
+looked up without rescanning the input file.
+
+Sidecar layout: a fixed header followed by a native-endian array of offsets
+(uint32 for inputs under 4 GiB, uint64 otherwise).
+"""
+
+import os
+import mmap
+import struct
+from array import array
+from bisect import bisect_right
+
+from text_file_extraction import DEFAULT_BLOCK_SIZE, _iter_words
+
+INDEX_SUFFIX = ".wordidx"
+
+_MAGIC = b"WIDX"
+_VERSION = 1
+_HEADER = struct.Struct("<4sBcxxQQQ")  # magic, version, typecode, source size, mtime, count
+
+
+def index_path_for(input_file_path: str) -> str:
+    """
+    Returns the sidecar index path for the given input file.
+
+    :param input_file_path: Path to the input file.
+    :return: Path to the index file.
+    """
+    return input_file_path + INDEX_SUFFIX
+
+
+def build_word_index(input_file_path: str, index_path: str | None = None,
+                     block_size: int = DEFAULT_BLOCK_SIZE) -> str:
+    """
+    Scans the whole input file once and writes the word end offsets into the sidecar file.
+    The offsets are the same positions `read_text_file_bytes` returns for each word.
+
+    :param input_file_path: Path to the input file.
+    :param index_path: Path to the index file, defaults to `index_path_for(input_file_path)`.
+    :param block_size: Number of bytes read from the input file at once.
+    :return: Path to the written index file.
+    """
+    index_path = index_path or index_path_for(input_file_path)
+    stat = os.stat(input_file_path)
+    typecode = "I" if stat.st_size < (1 << 32) else "Q"
+
+    offsets = array(typecode)
+    with open(input_file_path, "rb") as file:
+        for _, end_position, *_ in _iter_words(file, block_size):
+            offsets.append(end_position)
+
+    temp_path = index_path + ".tmp"
+    with open(temp_path, "wb") as file:
+        file.write(_HEADER.pack(_MAGIC, _VERSION, typecode.encode("ascii"),
+                                stat.st_size, stat.st_mtime_ns, len(offsets)))
+        offsets.tofile(file)
+    os.replace(temp_path, index_path)
+
+    return index_path
+
+
+class WordOffsetIndex:
+    """
+    Read-only, memory-mapped view of a word end offset index.
+    Behaves as a sequence of byte offsets (`len(index)`, `index[i]`).
+    """
+
+    def __init__(self, index_path: str):
+        with open(index_path, "rb") as file:
+            self._mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, typecode, source_size, source_mtime_ns, count = \
+            _HEADER.unpack_from(self._mmap)
+        if magic != _MAGIC or version != _VERSION:
+            self._mmap.close()
+            raise ValueError(f"File {index_path} is not a valid word offset index.")
+
+        self.source_size = source_size
+        self.source_mtime_ns = source_mtime_ns
+        self._view = memoryview(self._mmap)
+        self._offsets = self._view[_HEADER.size:].cast(typecode.decode("ascii"))
+        if len(self._offsets) != count:
+            self.close()
+            raise ValueError(f"Word offset index {index_path} is truncated.")
+
+    def __len__(self) -> int:
+        return len(self._offsets)
+
+    def __getitem__(self, word_index: int) -> int:
+        return self._offsets[word_index]
+
+    def close(self) -> None:
+        """Releases the memory mapping."""
+        self._offsets.release()
+        self._view.release()
+        self._mmap.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    def is_stale(self, input_file_path: str) -> bool:
+        """
+        Checks whether the input file has changed since the index was built.
+
+        :param input_file_path: Path to the input file.
+        :return: True if the index no longer matches the input file.
+        """
+        stat = os.stat(input_file_path)
+        return stat.st_size != self.source_size or stat.st_mtime_ns != self.source_mtime_ns
+
+    def words_before(self, position: int) -> int:
+        """
+        Returns the number of words ending at or before the given byte position.
+        For a position returned by the reader, this is the index of the next word.
+
+        :param position: Byte offset in the input file.
+        :return: Number of whole words before the position.
+        """
+        return bisect_right(self._offsets, position)
+
+    def chunk_end(self, position: int, word_count: int) -> int:
+        """
+        Returns the byte position after `word_count` further words from the given position.
+
+        :param position: Byte offset of a word boundary (or 0).
+        :param word_count: Number of words in the chunk.
+        :return: Word end byte offset, clamped to the last word of the file.
+        """
+        if not self._offsets:
+            return position
+        word_index = min(self.words_before(position) + word_count, len(self._offsets)) - 1
+        return max(self._offsets[word_index], position) if word_index >= 0 else position
+
+    def progress(self, position: int) -> float:
+        """
+        Returns the fraction of words of the input file that lie before the given position.
+
+        :param position: Byte offset in the input file.
+        :return: Value between 0.0 and 1.0.
+        """
+        if not self._offsets:
+            return 1.0
+        return self.words_before(position) / len(self._offsets)
+
+    def split(self, parts: int) -> list[tuple[int, int]]:
+        """
+        Splits the input file into byte ranges with roughly equal word counts.
+        Every range boundary is a word end position, so each range can be processed
+        independently by the reader.
+
+        :param parts: Number of ranges.
+        :return: List of (start, end) byte offsets.
+        """
+        count = len(self._offsets)
+        bounds = [0]
+        for part in range(1, parts):
+            word_index = count * part // parts
+            if word_index > 0 and self._offsets[word_index - 1] > bounds[-1]:
+                bounds.append(self._offsets[word_index - 1])
+        bounds.append(self._offsets[-1] if count else 0)
+        return list(zip(bounds, bounds[1:]))
+
+
+def load_word_index(input_file_path: str, rebuild_stale: bool = True) -> WordOffsetIndex:
+    """
+    Opens the sidecar index of the input file, building it first if it is missing
+    (or stale, when `rebuild_stale` is set).
+
+    :param input_file_path: Path to the input file.
+    :param rebuild_stale: Rebuild the index if the input file changed since it was built.
+    :return: WordOffsetIndex over the input file.
+    """
+    index_path = index_path_for(input_file_path)
+
+    if not os.path.exists(index_path):
+        build_word_index(input_file_path, index_path)
+
+    index = WordOffsetIndex(index_path)
+    if rebuild_stale and index.is_stale(input_file_path):
+        index.close()
+        build_word_index(input_file_path, index_path)
+        index = WordOffsetIndex(index_path)
+
+    return index
+
+
+if __name__ == "__main__":
+    TEMP_PATH = r"" # <Cesta k textovému souboru, ke kterému má být vytvořen index>
+    with load_word_index(TEMP_PATH) as WORD_INDEX:
+        print(f"Words: {len(WORD_INDEX)}")
+        print(WORD_INDEX.split(4))